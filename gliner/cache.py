@@ -0,0 +1,229 @@
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+import numpy as np
+import torch
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit-rate statistics.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Args:
+            max_size (Optional[int]): Maximum number of entries, unbounded if None.
+        """
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns:
+            Dict[str, float]: Number of hits, misses, the hit rate and the current size.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+        }
+
+
+class LabelsEmbeddingsCache:
+    """
+    Two-level cache of label embeddings: an in-memory LRU and an optional append-only on-disk
+    table, memory-mapped and namespaced by model revision.
+
+    The on-disk table is made of a raw float32 embeddings file and an index with one label per line,
+    so that flushing only appends the new embeddings.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = 10000,
+        cache_dir: Optional[Union[str, Path]] = None,
+        namespace: str = "default",
+    ):
+        """
+        Args:
+            max_size (Optional[int]): Maximum number of embeddings kept in memory. Defaults to 10000.
+            cache_dir (Optional[Union[str, Path]]): Directory of the persistent cache. Defaults to None (memory only).
+            namespace (str): Name of the on-disk table, e.g. a fingerprint of the labels encoder weights.
+        """
+        self.memory = LRUCache(max_size)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.namespace = namespace
+        self._pending: Dict[str, torch.Tensor] = {}
+        self._disk_index: Dict[str, int] = {}
+        self._disk_embeddings: Optional[np.ndarray] = None
+        self._index_size = 0
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._open_disk_table()
+
+    @property
+    def disk_path(self) -> Optional[Path]:
+        """
+        Path of the embeddings file, the labels index has the same name with a `.jsonl` suffix.
+        """
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{self.namespace}.bin"
+
+    @property
+    def index_path(self) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.disk_path.with_suffix(".jsonl")
+
+    def _open_disk_table(self) -> None:
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "rb") as f:
+            index = f.read()
+        # a flush interrupted while writing the index leaves a partial last line, ignored here
+        self._index_size = index.rfind(b"\n") + 1
+        lines = index[:self._index_size].decode("utf-8").splitlines()
+        if not lines:
+            return
+        dim = json.loads(lines[0])["dim"]
+        if self.disk_path.stat().st_size:
+            embeddings = np.memmap(self.disk_path, dtype=np.float32, mode="r")
+            embeddings = embeddings[:len(embeddings) // dim * dim].reshape(-1, dim)
+        else:
+            embeddings = np.empty((0, dim), dtype=np.float32)
+        # labels are indexed after their embeddings are written, so an interrupted flush leaves extra rows
+        labels = [json.loads(line) for line in lines[1:]][:len(embeddings)]
+        self._disk_embeddings = embeddings
+        self._disk_index = {label: row for row, label in enumerate(labels)}
+
+    def _read_disk(self, label: str) -> Optional[torch.Tensor]:
+        row = self._disk_index.get(label)
+        if row is None:
+            return None
+        return torch.from_numpy(np.array(self._disk_embeddings[row]))
+
+    def get(self, label: str) -> Optional[torch.Tensor]:
+        embedding = self.memory.get(label)
+        if embedding is None and self._disk_embeddings is not None:
+            with self._lock:
+                embedding = self._read_disk(label)
+            if embedding is not None:
+                self.memory.put(label, embedding)
+        return embedding
+
+    def put(self, label: str, embedding: torch.Tensor) -> None:
+        self.memory.put(label, embedding)
+        if self.cache_dir is not None and label not in self._disk_index:
+            with self._lock:
+                self._pending[label] = embedding.detach().cpu()
+
+    def get_many(self, labels: List[str]) -> Dict[str, torch.Tensor]:
+        """
+        Returns:
+            Dict[str, torch.Tensor]: Cached embeddings of the labels that were found.
+        """
+        found = {}
+        for label in labels:
+            embedding = self.get(label)
+            if embedding is not None:
+                found[label] = embedding
+        return found
+
+    def flush(self) -> None:
+        """
+        Append the embeddings added since the last flush to the on-disk table.
+        """
+        if self.cache_dir is None or not self._pending:
+            return
+        with self._lock:
+            labels = list(self._pending)
+            embeddings = torch.stack([emb.to(torch.float32) for emb in self._pending.values()]).numpy()
+            new_table = self._disk_embeddings is None
+            self._disk_embeddings = None
+
+            if new_table:
+                # also drops the leftovers of an interrupted first flush
+                embeddings_size, index_size = 0, 0
+                index_lines = [json.dumps({"dim": embeddings.shape[1]})]
+            else:
+                embeddings_size = len(self._disk_index) * embeddings.shape[1] * embeddings.itemsize
+                index_size, index_lines = self._index_size, []
+            index_lines.extend(json.dumps(label) for label in labels)
+
+            # embeddings are written before the labels that index them
+            with open(self.disk_path, "r+b" if self.disk_path.exists() else "wb") as f:
+                f.truncate(embeddings_size)
+                f.seek(embeddings_size)
+                f.write(embeddings.tobytes())
+            with open(self.index_path, "r+b" if self.index_path.exists() else "wb") as f:
+                f.truncate(index_size)
+                f.seek(index_size)
+                f.write("".join(line + "\n" for line in index_lines).encode("utf-8"))
+
+            self._pending = {}
+            self._open_disk_table()
+
+    def clear(self) -> None:
+        """
+        Drop the in-memory entries and the embeddings not yet written to disk.
+        """
+        self.memory.clear()
+        with self._lock:
+            self._pending = {}
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        stats = self.memory.stats
+        stats["disk_size"] = len(self._disk_index)
+        return stats
@@ -26,6 +26,11 @@ class GLiNERConfig(PretrainedConfig):
                  max_len: int = 384,
                  words_splitter_type: str = "whitespace",
                  has_rnn: bool = True,
+                 rnn_type: str = "lstm",
+                 span_proposal: bool = False,
+                 span_pruning_top_k: Optional[int] = None,
+                 span_pruning_threshold: Optional[float] = None,
+                 inference_optimization: Optional[str] = None,
                  fuse_layers: bool = False,
                  embed_ent_token: bool = True,
                  class_token_index: int = -1,
@@ -78,6 +83,11 @@ class GLiNERConfig(PretrainedConfig):
         self.max_len = max_len
         self.words_splitter_type = words_splitter_type
         self.has_rnn = has_rnn
+        self.rnn_type = rnn_type
+        self.span_proposal = span_proposal
+        self.span_pruning_top_k = span_pruning_top_k
+        self.span_pruning_threshold = span_pruning_threshold
+        self.inference_optimization = inference_optimization
         self.fuse_layers = fuse_layers
         self.class_token_index = class_token_index
         self.embed_ent_token = embed_ent_token
@@ -1,4 +1,5 @@
 from .processor import SpanProcessor, SpanBiEncoderProcessor, TokenProcessor, TokenBiEncoderProcessor
 from .collator import DataCollator
 from .tokenizer import WordsSplitter
-from .dataset import GLiNERDataset
\ No newline at end of file
+from .dataset import GLiNERDataset
+from .pretokenized import PretokenizedDataset, prepare_pretokenized_dataset
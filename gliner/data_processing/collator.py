@@ -10,6 +10,7 @@ class DataCollator:
                         return_id_to_classes: bool = False,
                         return_entities: bool = False,
                         prepare_labels: bool = False,
+                        prepare_entities: bool = True,
                         entity_types = None):
         self.config=config
         if data_processor is None:
@@ -20,15 +21,19 @@ class DataCollator:
         else:
             self.data_processor = data_processor
         self.prepare_labels = prepare_labels
+        self.prepare_entities = prepare_entities
         self.return_tokens = return_tokens
         self.return_id_to_classes = return_id_to_classes
         self.return_entities = return_entities
         self.entity_types = entity_types
 
-    def __call__(self, input_x):
-        raw_batch = self.data_processor.collate_raw_batch(input_x, entity_types = self.entity_types)
+    def __call__(self, input_x, entity_types = None):
+        if entity_types is None:
+            entity_types = self.entity_types
+        raw_batch = self.data_processor.collate_raw_batch(input_x, entity_types = entity_types)
         
-        model_input = self.data_processor.collate_fn(raw_batch, prepare_labels=self.prepare_labels)
+        model_input = self.data_processor.collate_fn(raw_batch, prepare_labels=self.prepare_labels,
+                                                    prepare_entities=self.prepare_entities)
         model_input.update({"span_idx": raw_batch['span_idx'] if 'span_idx' in raw_batch else None, 
                             "span_mask": raw_batch["span_mask"] if 'span_mask' in raw_batch else None,
                             "text_lengths": raw_batch['seq_length']})
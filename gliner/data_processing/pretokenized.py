@@ -0,0 +1,203 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+# Columns of a pretokenized dataset, each stored as a raw binary file that is memory-mapped when read.
+COLUMNS = {
+    "input_ids": np.int32,      # subword tokens of the texts, without special tokens
+    "word_ids": np.int32,       # word of each subword token, relative to its text
+    "token_offsets": np.int64,  # first token of each example, and the total number of tokens
+    "words": np.uint8,          # utf-8 encoded words of each text, separated by "\0"
+    "words_offsets": np.int64,  # first byte of each example in `words`, and the total number of bytes
+    "spans": np.int32,          # (start, end, label id) of each entity
+    "spans_offsets": np.int64,  # first entity of each example, and the total number of entities
+}
+METADATA_FILE = "metadata.json"
+# number of words of the first text kept in the metadata to check the tokenizer
+PROBE_LENGTH = 32
+
+
+def iter_examples(path: Union[str, Path]) -> Iterator[Dict]:
+    """
+    Iterate over the examples of a dataset in the training format, either a JSON list or,
+    for `.jsonl` files, one example per line (read lazily).
+    """
+    with open(path, "r") as f:
+        if str(path).endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def _tokenize_words(tokenizer, texts: List[List[str]]):
+    encodings = tokenizer(texts, is_split_into_words=True, add_special_tokens=False, verbose=False)
+    return [(ids, encodings.word_ids(i)) for i, ids in enumerate(encodings["input_ids"])]
+
+
+def prepare_pretokenized_dataset(
+    examples: Iterable[Dict],
+    output_dir: Union[str, Path],
+    tokenizer,
+    chunk_size: int = 1000,
+    show_progress: bool = True,
+) -> int:
+    """
+    Tokenize the texts of a dataset once and write them, with their words and entities, into a
+    columnar store read by `PretokenizedDataset`. Examples are processed by chunks, so the dataset
+    doesn't have to fit in memory. Examples without words or entities are dropped, as in `train.py`.
+
+    Args:
+        examples (Iterable[Dict]): Examples with `tokenized_text` and `ner` fields (see `iter_examples`).
+        output_dir (Union[str, Path]): Directory of the store.
+        tokenizer (AutoTokenizer): Tokenizer of the model that will be trained, it must be a fast tokenizer.
+        chunk_size (int): Number of texts tokenized at once. Defaults to 1000.
+        show_progress (bool): Whether to show a progress bar. Defaults to True.
+
+    Returns:
+        int: The number of examples written.
+    """
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("Pretokenized datasets require a fast tokenizer, to get the words of the tokens.")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    files = {name: open(output_dir / f"{name}.bin", "wb") for name in COLUMNS}
+    totals = {"token_offsets": 0, "words_offsets": 0, "spans_offsets": 0}
+    labels: Dict[str, int] = {}
+    probe = None
+    num_examples = 0
+
+    def write(name, values):
+        files[name].write(np.asarray(values, dtype=COLUMNS[name]).tobytes())
+
+    def write_chunk(chunk):
+        nonlocal num_examples
+        token_offsets, words_offsets, spans_offsets = [], [], []
+        for example, (ids, word_ids) in zip(chunk, _tokenize_words(tokenizer, [ex["tokenized_text"] for ex in chunk])):
+            words = "\0".join(example["tokenized_text"]).encode("utf-8")
+            spans = [(start, end, labels.setdefault(label, len(labels))) for start, end, label in example["ner"]]
+            write("input_ids", ids)
+            write("word_ids", word_ids)
+            write("words", np.frombuffer(words, dtype=np.uint8))
+            write("spans", np.asarray(spans, dtype=np.int32).reshape(-1, 3))
+
+            token_offsets.append(totals["token_offsets"])
+            words_offsets.append(totals["words_offsets"])
+            spans_offsets.append(totals["spans_offsets"])
+            totals["token_offsets"] += len(ids)
+            totals["words_offsets"] += len(words)
+            totals["spans_offsets"] += len(spans)
+        write("token_offsets", token_offsets)
+        write("words_offsets", words_offsets)
+        write("spans_offsets", spans_offsets)
+        num_examples += len(chunk)
+
+    try:
+        chunk = []
+        for example in tqdm(examples, desc="Tokenizing", disable=not show_progress):
+            if not len(example["tokenized_text"]) or not len(example["ner"]):
+                continue
+            if probe is None:
+                probe = list(example["tokenized_text"][:PROBE_LENGTH])
+            chunk.append(example)
+            if len(chunk) == chunk_size:
+                write_chunk(chunk)
+                chunk = []
+        if chunk:
+            write_chunk(chunk)
+        for name, total in totals.items():
+            write(name, [total])
+    finally:
+        for f in files.values():
+            f.close()
+
+    metadata = {
+        "num_examples": num_examples,
+        "labels": list(labels),
+        "tokenizer": getattr(tokenizer, "name_or_path", None),
+        "probe": probe,
+        "probe_ids": _tokenize_words(tokenizer, [probe])[0][0] if probe is not None else None,
+    }
+    with open(output_dir / METADATA_FILE, "w") as f:
+        json.dump(metadata, f)
+    return num_examples
+
+
+class PretokenizedDataset(Dataset):
+    """
+    Dataset read from a store written by `prepare_pretokenized_dataset`.
+
+    The columns are memory-mapped, and the token ids and word ids of an example are returned as
+    views of them, which `SpanProcessor` and `TokenProcessor` splice after the prompt instead of
+    tokenizing the text again. Entity types (and negative types) are still sampled when batches are
+    collated, so examples have the same format as those of the JSON datasets, with the extra
+    `input_ids` and `word_ids` fields.
+    """
+
+    def __init__(self, path: Union[str, Path], tokenizer=None):
+        """
+        Args:
+            path (Union[str, Path]): Directory of the store.
+            tokenizer (Optional[AutoTokenizer]): If set, checked to tokenize texts as the one that prepared the store.
+        """
+        self.path = Path(path)
+        with open(self.path / METADATA_FILE, "r") as f:
+            self.metadata = json.load(f)
+        self.labels: List[str] = self.metadata["labels"]
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        if tokenizer is not None:
+            self.check_tokenizer(tokenizer)
+
+    def check_tokenizer(self, tokenizer) -> None:
+        probe = self.metadata["probe"]
+        if probe is not None and _tokenize_words(tokenizer, [probe])[0][0] != self.metadata["probe_ids"]:
+            raise ValueError(f"The dataset in {self.path} was tokenized with a different tokenizer "
+                             f"({self.metadata['tokenizer']}), prepare it again with the tokenizer of the model.")
+
+    def __getstate__(self):
+        # memory maps are opened again by each worker process
+        state = self.__dict__.copy()
+        state["_columns"] = None
+        return state
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            self._columns = {}
+            for name, dtype in COLUMNS.items():
+                file = self.path / f"{name}.bin"
+                if file.stat().st_size:
+                    self._columns[name] = np.memmap(file, dtype=dtype, mode="r")
+                else:
+                    self._columns[name] = np.empty(0, dtype=dtype)
+            self._columns["spans"] = self._columns["spans"].reshape(-1, 3)
+        return self._columns
+
+    def __len__(self):
+        return self.metadata["num_examples"]
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Index {idx} is out of range for a dataset of {len(self)} examples.")
+        columns = self.columns
+        token_start, token_end = columns["token_offsets"][idx:idx + 2]
+        words_start, words_end = columns["words_offsets"][idx:idx + 2]
+        spans_start, spans_end = columns["spans_offsets"][idx:idx + 2]
+
+        words = columns["words"][words_start:words_end].tobytes().decode("utf-8").split("\0")
+        ner = [(start, end, self.labels[label])
+               for start, end, label in columns["spans"][spans_start:spans_end].tolist()]
+        return {
+            "tokenized_text": words,
+            "ner": ner,
+            "input_ids": columns["input_ids"][token_start:token_end],
+            "word_ids": columns["word_ids"][token_start:token_end],
+        }
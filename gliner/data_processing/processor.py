@@ -1,16 +1,22 @@
 import random
+import threading
 import warnings
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from typing import List, Tuple, Dict, Union
 from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 from torch.nn.utils.rnn import pad_sequence
 import torch.nn.functional as F
 
-from .utils import pad_2d_tensor
+from transformers import BatchEncoding
+from transformers.tokenization_utils_base import VERY_LARGE_INTEGER
+
+from ..cache import LRUCache
+from .utils import pad_2d_tensor, get_spans_idx
 
 # Abstract base class for handling data processing
 class BaseProcessor(ABC):
@@ -26,11 +32,27 @@ class BaseProcessor(ABC):
 
         self.preprocess_text = preprocess_text
 
+        # Tokenized `<<ENT>> label ... <<SEP>>` prompts, spliced in front of the tokenized texts.
+        self.prompts_cache = LRUCache(max_size=128)
+        self._splice_prompts = None
+
+        # Fast tokenizers can't be called from several threads at once.
+        self._tokenizer_lock = threading.Lock()
+
         # Check if the tokenizer has unk_token and pad_token
         self._check_and_set_special_tokens(self.transformer_tokenizer)
         if self.labels_tokenizer:
             self._check_and_set_special_tokens(self.labels_tokenizer)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_tokenizer_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._tokenizer_lock = threading.Lock()
+
     def _check_and_set_special_tokens(self, tokenizer):
         # Check for unk_token
         if tokenizer.unk_token is None:
@@ -50,6 +72,16 @@ class BaseProcessor(ABC):
             )
             tokenizer.pad_token = default_pad_token
 
+    @staticmethod
+    def _warn_unused_text_encodings():
+        # pretokenized texts can only be spliced after the prompts of span and token processors
+        # that tokenize the words as they are, with a tokenizer that passes the `splice_prompts` check
+        warnings.warn(
+            "The token ids of the pretokenized dataset can't be spliced into the inputs by this data processor, "
+            "the texts are tokenized again.",
+            UserWarning
+        )
+
     @staticmethod
     def get_dict(spans: List[Tuple[int, int, str]], classes_to_id: Dict[str, int]) -> Dict[Tuple[int, int], int]:
         dict_tag = defaultdict(int)
@@ -127,49 +159,223 @@ class BaseProcessor(ABC):
             input_texts.append(input_text)
         return input_texts, prompt_lengths
     
-    def prepare_word_mask(self, texts, tokenized_inputs, prompt_lengths = None, token_level=False):
-        words_masks = []
-        for id in range(len(texts)):
-            if prompt_lengths is not None:
-                prompt_length = prompt_lengths[id]
-            else:
-                prompt_length = 0
-            words_mask = []
-            prev_word_id=None
-            words_count=0
-            for word_id in tokenized_inputs.word_ids(id):
-                if word_id is None:
-                    words_mask.append(0)
-                elif word_id != prev_word_id or token_level:
-                    if words_count<prompt_length:
-                        words_mask.append(0)
-                    else:
-                        masking_word_id = word_id-prompt_length+1
-                        words_mask.append(masking_word_id)
-                    if word_id != prev_word_id:
-                        words_count+=1
-                else:
-                    words_mask.append(0)
-                prev_word_id = word_id
-            words_masks.append(words_mask)
-        return words_masks
+    def shard_labels(self, labels, max_prompt_tokens = None, max_labels = None):
+        """
+        Split labels into groups whose prompt (`<<ENT>> label ... <<SEP>>`) fits
+        into `max_prompt_tokens` tokens and contains at most `max_labels` labels.
+        """
+        labels_ids = self.transformer_tokenizer(labels, add_special_tokens=False)['input_ids']
+
+        shards = []
+        current_shard = []
+        current_length = 1 # sep token
+        for label, label_ids in zip(labels, labels_ids):
+            label_length = len(label_ids) + 1 # ent token
+            too_long = max_prompt_tokens is not None and current_length + label_length > max_prompt_tokens
+            too_many = max_labels is not None and len(current_shard) >= max_labels
+            if current_shard and (too_long or too_many):
+                shards.append(current_shard)
+                current_shard = []
+                current_length = 1
+            current_shard.append(label)
+            current_length += label_length
+
+        if current_shard:
+            shards.append(current_shard)
+        return shards
+
+    def words_num_tokens(self, texts):
+        """
+        Count the subword tokens of every word of word-tokenized texts.
+
+        Returns:
+            List[np.ndarray]: Number of tokens of each word, for every text.
+        """
+        tokenizer = self.transformer_tokenizer
+        if getattr(tokenizer, "is_fast", False):
+            encodings = tokenizer(texts, is_split_into_words=True, add_special_tokens=False, verbose=False)
+            return [
+                np.bincount([word_id for word_id in encodings.word_ids(i) if word_id is not None],
+                            minlength=len(text))
+                for i, text in enumerate(texts)
+            ]
+        # slow tokenizers don't map tokens to words, so words are tokenized one by one
+        words = [word for text in texts for word in text]
+        words_ids = tokenizer(words, add_special_tokens=False, verbose=False)["input_ids"] if words else []
+        num_tokens = np.array([len(ids) for ids in words_ids], dtype=np.int64)
+        return np.split(num_tokens, np.cumsum([len(text) for text in texts])[:-1])
+
+    def max_text_tokens(self, label_shards=None):
+        """
+        Number of text tokens that fit into the encoder next to the special tokens and the prompt
+        of the longest shard of labels, or None if the tokenizer has no maximum length.
+        """
+        tokenizer = self.transformer_tokenizer
+        if tokenizer.model_max_length >= VERY_LARGE_INTEGER:
+            return None
+        prompt_tokens = 0
+        if label_shards:
+            prompts, _ = self.prepare_inputs([[] for _ in label_shards], label_shards)
+            prompts_ids = tokenizer(prompts, is_split_into_words=True, add_special_tokens=False)["input_ids"]
+            prompt_tokens = max(len(ids) for ids in prompts_ids)
+        return tokenizer.model_max_length - tokenizer.num_special_tokens_to_add() - prompt_tokens
+
+    def prepare_word_mask(self, texts, tokenized_inputs, prompt_lengths = None, token_level=False, word_ids=None):
+        """
+        Map every token to the 1-based index of the word it starts (0 for special tokens,
+        prompt words and word continuations; with `token_level`, every token of a word is mapped).
+
+        Args:
+            word_ids (Optional[np.ndarray]): Word index of every token (-1 for special and padding tokens),
+                read from `tokenized_inputs` if None.
+
+        Returns:
+            np.ndarray: Words mask of shape (batch_size, num_tokens).
+        """
+        if word_ids is None:
+            # None word ids become NaN in a float array, then -1.
+            word_ids = np.array([tokenized_inputs.word_ids(id) for id in range(len(texts))], dtype=np.float64)
+            word_ids = np.nan_to_num(word_ids, nan=-1).astype(np.int64)
+        if prompt_lengths is not None:
+            prompt_lengths = np.asarray(prompt_lengths, dtype=np.int64)[:, None]
+        else:
+            prompt_lengths = np.zeros((len(texts), 1), dtype=np.int64)
+
+        is_word = word_ids >= 0
+        prev_word_ids = np.pad(word_ids[:, :-1], ((0, 0), (1, 0)), constant_values=-1)
+        is_first = is_word & (word_ids != prev_word_ids)
+        # Number of words started before each token, counting the token's own word if it started earlier.
+        words_count = np.cumsum(is_first, axis=1) - is_first
+
+        is_mapped = is_first | (is_word & token_level)
+        is_mapped &= words_count >= prompt_lengths
+        return np.where(is_mapped, word_ids - prompt_lengths + 1, 0)
     
-    def tokenize_inputs(self, texts, entities, prepare_labels: bool = False, blank = None):
+    def _tokenize_prompt(self, prompt):
+        cached = self.prompts_cache.get(prompt)
+        if cached is None:
+            encoding = self.transformer_tokenizer(list(prompt), is_split_into_words=True, add_special_tokens=False)
+            cached = (encoding["input_ids"], encoding.word_ids())
+            self.prompts_cache.put(prompt, cached)
+        return cached
+
+    def tokenize_with_cached_prompts(self, input_texts, prompt_lengths, text_encodings=None):
+        """
+        Tokenize prompted texts by splicing the cached tokens of each prompt in front of the
+        separately tokenized text, which matches tokenizing the whole word sequence at once.
+
+        Args:
+            text_encodings (Optional[List[Tuple[np.ndarray, np.ndarray]]]): Token ids and word ids of the
+                texts, without special tokens (see `PretokenizedDataset`), used instead of tokenizing them.
+
+        Returns:
+            Tuple of the `BatchEncoding` (or None if some text cannot be spliced) and the word ids array.
+        """
+        tokenizer = self.transformer_tokenizer
+        prefix_ids, suffix_ids = self._special_tokens_template
+        num_special = len(prefix_ids) + len(suffix_ids)
+
+        prompts = [self._tokenize_prompt(tuple(text[:length])) for text, length in zip(input_texts, prompt_lengths)]
+        if tokenizer.model_max_length < VERY_LARGE_INTEGER:
+            max_text_tokens = [tokenizer.model_max_length - num_special - len(ids) for ids, _ in prompts]
+        else:
+            max_text_tokens = [None] * len(prompts)
+        if any(text_length is not None and text_length <= 0 for text_length in max_text_tokens) or \
+                any(len(text) <= length for text, length in zip(input_texts, prompt_lengths)):
+            return None, None
+
+        if text_encodings is None:
+            # a single batched call, rows are truncated below as the tokenizer would (on the right)
+            encodings = tokenizer([text[length:] for text, length in zip(input_texts, prompt_lengths)],
+                                  is_split_into_words=True, add_special_tokens=False, verbose=False)
+
+        rows_ids, rows_word_ids = [], []
+        for i, (text, prompt_length, (prompt_ids, prompt_word_ids), max_tokens) in enumerate(
+                zip(input_texts, prompt_lengths, prompts, max_text_tokens)):
+            if text_encodings is not None:
+                text_ids, text_word_ids = text_encodings[i]
+                # drop the tokens of the words truncated from the text, then truncate as the tokenizer would
+                num_tokens = int(np.searchsorted(text_word_ids, len(text) - prompt_length))
+                if max_tokens is not None:
+                    num_tokens = min(num_tokens, max_tokens)
+                text_ids = text_ids[:num_tokens].tolist()
+                text_word_ids = (text_word_ids[:num_tokens] + prompt_length).tolist()
+            else:
+                text_ids = encodings["input_ids"][i][:max_tokens]
+                text_word_ids = [word_id + prompt_length for word_id in encodings.word_ids(i)[:max_tokens]]
+            rows_ids.append(prefix_ids + prompt_ids + text_ids + suffix_ids)
+            rows_word_ids.append([-1] * len(prefix_ids) + prompt_word_ids + text_word_ids + [-1] * len(suffix_ids))
+
+        num_tokens = max(len(ids) for ids in rows_ids)
+        input_ids = np.full((len(rows_ids), num_tokens), tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(rows_ids), num_tokens), dtype=np.int64)
+        word_ids = np.full((len(rows_ids), num_tokens), -1, dtype=np.int64)
+        for i, (ids, row_word_ids) in enumerate(zip(rows_ids, rows_word_ids)):
+            row = slice(0, len(ids)) if tokenizer.padding_side == "right" else slice(num_tokens - len(ids), None)
+            input_ids[i, row] = ids
+            attention_mask[i, row] = 1
+            word_ids[i, row] = row_word_ids
+
+        data = {"input_ids": input_ids}
+        if "token_type_ids" in tokenizer.model_input_names:
+            data["token_type_ids"] = np.zeros_like(input_ids)
+        data["attention_mask"] = attention_mask
+        return BatchEncoding(data, tensor_type="pt"), word_ids
+
+    @property
+    def splice_prompts(self):
+        """
+        Whether prompts can be tokenized once and spliced in front of the texts, checked once
+        against regular tokenization of a sample (requires a fast tokenizer truncating on the right).
+        """
+        if self._splice_prompts is None:
+            tokenizer = self.transformer_tokenizer
+            self._splice_prompts = False
+            if getattr(tokenizer, "is_fast", False) and tokenizer.truncation_side == "right":
+                encoding = tokenizer(["word"], is_split_into_words=True)
+                word_ids = encoding.word_ids()
+                first = word_ids.index(0)
+                last = len(word_ids) - word_ids[::-1].index(0)
+                self._special_tokens_template = (encoding["input_ids"][:first], encoding["input_ids"][last:])
+
+                sample = [[self.ent_token, "person", self.ent_token, "organization", self.sep_token,
+                           "John", "Smithson", "works", "at", "ACME", "."]]
+                expected = tokenizer(sample, is_split_into_words=True, return_tensors="pt",
+                                     truncation=True, padding="longest")
+                spliced, spliced_word_ids = self.tokenize_with_cached_prompts(sample, [5])
+                expected_word_ids = [-1 if word_id is None else word_id for word_id in expected.word_ids(0)]
+                self._splice_prompts = (
+                    spliced is not None
+                    and set(spliced.keys()) == set(expected.keys())
+                    and all(torch.equal(spliced[key], expected[key]) for key in expected.keys())
+                    and spliced_word_ids[0].tolist() == expected_word_ids
+                )
+                self.prompts_cache.clear()
+        return self._splice_prompts
+
+    def tokenize_inputs(self, texts, entities, prepare_labels: bool = False, blank = None, text_encodings = None):
 
         input_texts, prompt_lengths = self.prepare_inputs(texts, entities, blank=blank)
 
         if self.preprocess_text:
             input_texts = self.prepare_texts(input_texts)
 
-        tokenized_inputs = self.transformer_tokenizer(
-            input_texts,
-            is_split_into_words=True,
-            return_tensors="pt",
-            truncation=True,
-            padding="longest",
-        )
-        words_masks = self.prepare_word_mask(texts, tokenized_inputs, prompt_lengths)
-        tokenized_inputs["words_mask"] = torch.tensor(words_masks)
+        tokenized_inputs, word_ids = None, None
+        if not self.preprocess_text and self.splice_prompts:
+            tokenized_inputs, word_ids = self.tokenize_with_cached_prompts(input_texts, prompt_lengths,
+                                                                           text_encodings=text_encodings)
+        if tokenized_inputs is None:
+            if text_encodings is not None:
+                self._warn_unused_text_encodings()
+            tokenized_inputs = self.transformer_tokenizer(
+                input_texts,
+                is_split_into_words=True,
+                return_tensors="pt",
+                truncation=True,
+                padding="longest",
+            )
+        words_masks = self.prepare_word_mask(texts, tokenized_inputs, prompt_lengths, word_ids=word_ids)
+        tokenized_inputs["words_mask"] = torch.from_numpy(words_masks)
 
         if self.decoder_tokenizer is not None and self.config.decoder_mode == 'span':
             decoder_input_texts = [[f" {t}" if i else t for i, t in enumerate(tokens)] for tokens in input_texts]
@@ -185,7 +391,7 @@ class BaseProcessor(ABC):
 
             if self.config.full_decoder_context:
                 decoder_words_masks = self.prepare_word_mask(texts, decoder_tokenized_inputs, prompt_lengths, token_level=True)
-                tokenized_inputs['decoder_words_mask'] = torch.tensor(decoder_words_masks)
+                tokenized_inputs['decoder_words_mask'] = torch.from_numpy(decoder_words_masks)
 
         if prepare_labels and self.config.decoder_mode == 'prompt':
             if isinstance(entities, dict):
@@ -278,11 +484,16 @@ class BaseProcessor(ABC):
                     for b in batch_list
                 ]
         
-        return self.create_batch_dict(batch, class_to_ids, id_to_classes)
+        batch_dict = self.create_batch_dict(batch, class_to_ids, id_to_classes)
+        # texts already tokenized by `PretokenizedDataset`
+        if all("input_ids" in b and "word_ids" in b for b in batch_list):
+            batch_dict["text_encodings"] = [(b["input_ids"], b["word_ids"]) for b in batch_list]
+        return batch_dict
 
 
     def collate_fn(self, batch, prepare_labels=True, *args, **kwargs):
-        model_input_batch = self.tokenize_and_prepare_labels(batch, prepare_labels, *args, **kwargs)
+        with self._tokenizer_lock:
+            model_input_batch = self.tokenize_and_prepare_labels(batch, prepare_labels, *args, **kwargs)
         return model_input_batch
     
     @abstractmethod
@@ -309,7 +520,7 @@ class BaseBiEncoderProcessor(BaseProcessor):
             tokenized_inputs['labels_attention_mask'] = tokenized_labels['attention_mask']
 
         words_masks = self.prepare_word_mask(texts, tokenized_inputs, prompt_lengths=None)
-        tokenized_inputs['words_mask'] = torch.tensor(words_masks)
+        tokenized_inputs['words_mask'] = torch.from_numpy(words_masks)
         return tokenized_inputs
 
     def batch_generate_class_mappings(self, batch_list: List[Dict], negatives: List[str]=None) -> Tuple[
@@ -343,6 +554,13 @@ class BaseBiEncoderProcessor(BaseProcessor):
         return class_to_ids, id_to_classes
     
 class SpanProcessor(BaseProcessor):    
+    def get_span_position(self, start, end, num_tokens):
+        # Row of the span (start, end) in `get_spans_idx`, None if it is not a candidate span.
+        width = end - start
+        if 0 <= start < num_tokens and 0 <= width < self.config.max_width:
+            return start * self.config.max_width + width
+        return None
+
     def preprocess_example(self, tokens, ner, classes_to_id):
         if len(tokens) == 0:
             tokens = ["[PAD]"]
@@ -351,10 +569,16 @@ class SpanProcessor(BaseProcessor):
             warnings.warn(f"Sentence of length {len(tokens)} has been truncated to {max_len}")
             tokens = tokens[:max_len]
 
-        spans_idx = [(i, i + j) for i in range(len(tokens)) for j in range(self.config.max_width)]
-        dict_lab = self.get_dict(ner, classes_to_id) if ner else defaultdict(int)
-        span_label = torch.LongTensor([dict_lab[i] for i in spans_idx])
-        spans_idx = torch.LongTensor(spans_idx)
+        spans_idx = get_spans_idx(len(tokens), self.config.max_width)
+        span_label = torch.zeros(len(spans_idx), dtype=torch.long)
+        if ner:
+            span_to_class = {}
+            for span in ner:
+                idx = self.get_span_position(span[0], span[1], len(tokens))
+                if idx is not None and span[2] in classes_to_id:
+                    span_to_class[idx] = classes_to_id[span[2]]
+            if span_to_class:
+                span_label[list(span_to_class)] = torch.LongTensor(list(span_to_class.values()))
         valid_span_mask = spans_idx[:, 1] > len(tokens) - 1
         span_label = span_label.masked_fill(valid_span_mask, -1)
 
@@ -393,34 +617,28 @@ class SpanProcessor(BaseProcessor):
             classes_to_id = batch['classes_to_id'][i]
             ner = batch['entities'][i]
             num_classes = len(classes_to_id)
-            spans_idx = torch.LongTensor([
-                (start, start + width)
-                for start in range(len(tokens))
-                for width in range(self.config.max_width)
-            ])
-            span_to_index = {
-                (spans_idx[idx, 0].item(), spans_idx[idx, 1].item()): idx
-                for idx in range(len(spans_idx))
-            }
+            spans_idx = get_spans_idx(len(tokens), self.config.max_width)
             if blank is not None:
                 num_classes = 1
             labels_one_hot = torch.zeros(len(spans_idx), num_classes + 1, dtype=torch.float)
             end_token_idx = (len(tokens) - 1)
             used_spans = set()
             span_labels_dict = {}
+            positive_idx, positive_classes = [], []
             for (start, end, label) in ner:
-                span = (start, end)
-                if label in classes_to_id and span in span_to_index:
-                    idx = span_to_index[span]
+                idx = self.get_span_position(start, end, len(tokens))
+                if label in classes_to_id and idx is not None:
                     if self.config.decoder_mode == 'span':
                         class_id = classes_to_id[label] if blank is None else 1
                     else:
                         class_id = classes_to_id[label]
-                    if labels_one_hot[idx, class_id] == 0 and idx not in used_spans:
+                    if idx not in used_spans:
                         used_spans.add(idx)
                         if end <= end_token_idx:
-                            labels_one_hot[idx, class_id] = 1.0
+                            positive_idx.append(idx)
+                            positive_classes.append(class_id)
                             span_labels_dict[idx] = label
+            labels_one_hot[positive_idx, positive_classes] = 1.0
             valid_span_mask = spans_idx[:, 1] > end_token_idx
             labels_one_hot[valid_span_mask, :] = 0.0
             labels_one_hot = labels_one_hot[:, 1:]
@@ -455,7 +673,8 @@ class SpanProcessor(BaseProcessor):
             blank = "entity"
         else:
             blank = None
-        tokenized_input = self.tokenize_inputs(batch['tokens'], batch['classes_to_id'], prepare_labels, blank)
+        tokenized_input = self.tokenize_inputs(batch['tokens'], batch['classes_to_id'], prepare_labels, blank,
+                                               text_encodings=batch.get('text_encodings'))
         if prepare_labels:
             labels, decoder_tokenized_input = self.create_labels(batch, blank=blank)
             tokenized_input['labels'] = labels
@@ -476,6 +695,8 @@ class SpanBiEncoderProcessor(SpanProcessor, BaseBiEncoderProcessor):
                 entities = list(batch['classes_to_id'][0])
         else:
             entities = None
+        if batch.get('text_encodings') is not None:
+            self._warn_unused_text_encodings()
         tokenized_input = self.tokenize_inputs(batch['tokens'], entities)
         if prepare_labels:
             labels = self.create_labels(batch)
@@ -553,7 +774,8 @@ class TokenProcessor(BaseProcessor):
         seq_len = batch['seq_length'].max()
         num_classes = max([len(cid) for cid in batch['classes_to_id']])
 
-        tokenized_input = self.tokenize_inputs(batch['tokens'], batch['classes_to_id'])
+        tokenized_input = self.tokenize_inputs(batch['tokens'], batch['classes_to_id'],
+                                               text_encodings=batch.get('text_encodings'))
         
         if prepare_labels:
             labels = self.create_labels(batch['entities_id'], batch_size, seq_len, num_classes)
@@ -569,13 +791,14 @@ class TokenBiEncoderProcessor(TokenProcessor, BaseBiEncoderProcessor):
                 entities = list(batch['classes_to_id'][0])
         else:
             entities = None
-        batch_size = len(batch['tokens'])
-        seq_len = batch['seq_length'].max()
-        num_classes = len(entities)
-
+        if batch.get('text_encodings') is not None:
+            self._warn_unused_text_encodings()
         tokenized_input = self.tokenize_inputs(batch['tokens'], entities)
         
         if prepare_labels:
+            batch_size = len(batch['tokens'])
+            seq_len = batch['seq_length'].max()
+            num_classes = len(entities)
             labels = self.create_labels(batch['entities_id'], batch_size, seq_len, num_classes)
             tokenized_input['labels'] = labels
 
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import torch
 
 def pad_2d_tensor(key_data):
@@ -29,4 +31,65 @@ def pad_2d_tensor(key_data):
     # Stack the tensors into a single tensor along a new batch dimension
     padded_tensors = torch.stack(tensors)
 
-    return padded_tensors
\ No newline at end of file
+    return padded_tensors
+
+def length_bucketed_batches(lengths, batch_size, max_tokens_per_batch=None):
+    """
+    Group example indices into batches of similar length to reduce padding.
+
+    Examples are sorted by decreasing length. If `max_tokens_per_batch` is set, a batch
+    is filled while `len(batch) * max_length_in_batch` stays within the budget,
+    otherwise batches contain `batch_size` examples.
+
+    :param lengths: List with the length (e.g. number of words) of every example.
+    :param batch_size: Number of examples per batch when no token budget is given.
+    :param max_tokens_per_batch: Optional budget of padded tokens per batch.
+    :return: List of batches, each a list of indices into `lengths`.
+    """
+    order = sorted(range(len(lengths)), key=lambda idx: -lengths[idx])
+
+    batches = []
+    current_batch = []
+    current_max_length = 0
+    for idx in order:
+        length = max(lengths[idx], 1)
+        max_length = max(current_max_length, length)
+        if current_batch:
+            if max_tokens_per_batch is not None:
+                is_full = max_length * (len(current_batch) + 1) > max_tokens_per_batch
+            else:
+                is_full = len(current_batch) >= batch_size
+            if is_full:
+                batches.append(current_batch)
+                current_batch = []
+                max_length = length
+        current_batch.append(idx)
+        current_max_length = max_length
+
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+@lru_cache(maxsize=32)
+def _spans_idx_template(num_starts, max_width):
+    starts = torch.arange(num_starts).repeat_interleave(max_width)
+    widths = torch.arange(max_width).repeat(num_starts)
+    return torch.stack([starts, starts + widths], dim=1)
+
+
+def get_spans_idx(seq_length, max_width):
+    """
+    Get the (start, end) word indices of every candidate span of a sentence, ordered by start
+    then width, so that the span (start, start + width) is at row `start * max_width + width`.
+
+    Templates are cached per power-of-two capacity and sliced, the result must not be modified in place.
+
+    :param seq_length: Number of words in the sentence.
+    :param max_width: Maximum span width.
+    :return: LongTensor of shape (seq_length * max_width, 2).
+    """
+    capacity = 64
+    while capacity < seq_length:
+        capacity *= 2
+    return _spans_idx_template(capacity, max_width)[:seq_length * max_width]
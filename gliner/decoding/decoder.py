@@ -1,9 +1,8 @@
 from typing import Optional
 from abc import ABC, abstractmethod
-from functools import partial
 import torch
 
-from .utils import has_overlapping, has_overlapping_nested
+from .utils import greedy_search_indices
 
 
 class BaseDecoder(ABC):
@@ -29,26 +28,11 @@ class BaseDecoder(ABC):
         return id_to_classes
     
     def greedy_search(self, spans, flat_ner=True, multi_label=False):
-        if flat_ner:
-            has_ov = partial(has_overlapping, multi_label=multi_label)
-        else:
-            has_ov = partial(has_overlapping_nested, multi_label=multi_label)
-
-        new_list = []
-        span_prob = sorted(spans, key=lambda x: -x[-1])
-
-        for i in range(len(spans)):
-            b = span_prob[i]
-            flag = False
-            for new in new_list:
-                if has_ov(b[:-1], new):
-                    flag = True
-                    break
-            if not flag:
-                new_list.append(b)
-
-        new_list = sorted(new_list, key=lambda x: x[0])
-        return new_list
+        if not spans:
+            return []
+        keep = greedy_search_indices([span[0] for span in spans], [span[1] for span in spans],
+                                     [span[-1] for span in spans], flat_ner, multi_label)
+        return [spans[i] for i in keep]
 
 
 class SpanDecoder(BaseDecoder):
@@ -62,7 +46,8 @@ class SpanDecoder(BaseDecoder):
         multi_label=False,
         sel_idx=None,
         gen_labels=None,             # list[str] – labels generated by the span‑decoder
-        num_gen_sequences=1
+        num_gen_sequences=1,
+        kept_span_idx=None,          # (B, N) – flat span positions of pruned logits
     ):
         """
         Parameters
@@ -76,9 +61,21 @@ class SpanDecoder(BaseDecoder):
             The labels returned by `generate_labels`.  Their order is the same
             as the order in which embeddings were fed to the decoder
             (`sel_idx` flattened row‑major).
+
+        kept_span_idx : torch.LongTensor or None
+            When spans were pruned by the model, `model_output` has shape `(B, N, C)`
+            and this `(B, N)` matrix gives the flat `(start*max_width + width)` position
+            of every scored span.  Padded elements contain ‑1.
         """
-        B, L, K, C = model_output.shape
-        probs = torch.sigmoid(model_output)
+        if kept_span_idx is None:
+            B, L, K, C = model_output.shape
+            probs = torch.sigmoid(model_output).view(B, L * K, C)
+            span_positions = torch.arange(L * K, device=probs.device).expand(B, -1)
+        else:
+            B, _, C = model_output.shape
+            K = self.config.max_width
+            probs = torch.sigmoid(model_output)
+            span_positions = kept_span_idx.to(probs.device)
     
         span_label_maps = [{} for _ in range(B)]        # one dict per sample
         if self.config.decoder_mode == "span" and sel_idx is not None and gen_labels is not None:
@@ -99,18 +96,29 @@ class SpanDecoder(BaseDecoder):
                     span_label_maps[b] = dict(zip(flat_indices, labels_b))
                 cursor += n
 
+        # Threshold the whole batch at once, discarding spans that exceed their sentence.
+        lengths = torch.tensor([len(t) for t in tokens], device=probs.device)
+        span_starts, span_widths = span_positions // K, span_positions % K
+        valid_spans = (span_positions >= 0) & (span_starts + span_widths < lengths[:, None])
+        b_idx, n_idx, c_idx = torch.where((probs > threshold) & valid_spans.unsqueeze(-1))
+        s_idx, k_idx = span_starts[b_idx, n_idx], span_widths[b_idx, n_idx]
+        scores = probs[b_idx, n_idx, c_idx].float()
+
+        # Single host transfer for the candidates of every sample.
+        candidates = torch.stack([b_idx, s_idx, k_idx, c_idx]).cpu().numpy()
+        scores = scores.cpu().numpy()
+        bounds = candidates[0].searchsorted(range(B + 1))
+
         spans = []
         for i in range(B):
-            probs_i = probs[i]
             id_to_class_i  = id_to_classes[i] if isinstance(id_to_classes, list) else id_to_classes
-            span_i = []
-
-            s_idx, k_idx, c_idx = torch.where(probs_i > threshold)
-            for s, k, c in zip(s_idx.tolist(), k_idx.tolist(), c_idx.tolist()):
-                end = s + k + 1
-                if end > len(tokens[i]):          # skip if span exceeds sentence
-                    continue
+            lo, hi = bounds[i], bounds[i + 1]
+            s_i, k_i, c_i = candidates[1:, lo:hi]
+            keep = greedy_search_indices(s_i, s_i + k_i, scores[lo:hi], flat_ner, multi_label)
 
+            span_i = []
+            for s, k, c, score in zip(s_i[keep].tolist(), k_i[keep].tolist(),
+                                      c_i[keep].tolist(), scores[lo:hi][keep].tolist()):
                 flat_idx = s * K + k              # match encoder's flatten rule
 
                 # pick entity type
@@ -120,51 +128,78 @@ class SpanDecoder(BaseDecoder):
                     gen_ent_type = None
                 ent_type = id_to_class_i[c + 1]   # (+1 because 0 is <pad>)
 
-                span_i.append((s, s + k, ent_type, gen_ent_type, probs_i[s, k, c].item()))
-
-            span_i = self.greedy_search(span_i, flat_ner, multi_label=multi_label)
+                span_i.append((s, s + k, ent_type, gen_ent_type, score))
             spans.append(span_i)
 
         return spans
 
 class TokenDecoder(BaseDecoder):
-    def get_indices_above_threshold(self, scores, threshold):
-        scores = torch.sigmoid(scores)
-        return [k.tolist() for k in torch.where(scores > threshold)]
-
-    def calculate_span_score(self, start_idx, end_idx, scores_inside_i, start_i, end_i, id_to_classes, threshold):
-        span_i = []
-        for st, cls_st in zip(*start_idx):
-            for ed, cls_ed in zip(*end_idx):
-                if ed >= st and cls_st == cls_ed:
-                    ins = scores_inside_i[st:ed + 1, cls_st]
-                    if (ins < threshold).any():
-                        continue
-                    # Get the start and end scores for this span
-                    start_score = start_i[st, cls_st]
-                    end_score = end_i[ed, cls_st]
-                    # Concatenate the inside scores with start and end scores
-                    combined = torch.cat([ins, start_score.unsqueeze(0), end_score.unsqueeze(0)])
-                    # The span score is the minimum value among these scores
-                    spn_score = combined.min().item()
-                    span_i.append((st, ed, id_to_classes[cls_st + 1], None, spn_score))
-        return span_i
+    def calculate_span_score(self, scores_start, scores_end, scores_inside, lengths, threshold):
+        """
+        Score every span whose start and end are above the threshold and whose inside scores
+        all reach it, for the whole batch at once.
+
+        Args:
+            scores_start, scores_end, scores_inside (torch.Tensor): Probabilities of shape (B, L, C).
+            lengths (torch.LongTensor): Number of words of each sentence, shape (B,).
+            threshold (float): Confidence threshold.
+
+        Returns:
+            Tuple of the (N, 4) tensor of (batch, start, end, class) indices and the (N,) span scores,
+            ordered by batch, start, class and end.
+        """
+        B, L, C = scores_start.shape
+        positions = torch.arange(L, device=scores_start.device)
+        in_sentence = (positions.unsqueeze(0) < lengths.unsqueeze(1)).unsqueeze(-1)
+
+        is_start = (scores_start > threshold) & in_sentence
+        is_end = (scores_end > threshold) & in_sentence
+        # First position at or after each word where the inside score drops below the threshold.
+        breaks = torch.where((scores_inside >= threshold) & in_sentence, L, positions.view(1, L, 1))
+        next_break = breaks.flip(1).cummin(dim=1).values.flip(1)
+
+        b_idx, st_idx, c_idx = torch.where(is_start)
+        if not len(b_idx):
+            return torch.zeros((0, 4), dtype=torch.long), torch.zeros(0)
+        run_lengths = next_break[b_idx, st_idx, c_idx] - st_idx
+        max_width = max(int(run_lengths.max()), 1)
+
+        offsets = torch.arange(max_width, device=scores_start.device)
+        ed_idx = st_idx.unsqueeze(1) + offsets                              # (N, W)
+        in_run = offsets.unsqueeze(0) < run_lengths.unsqueeze(1)
+        ed_idx = ed_idx.clamp(max=L - 1)
+
+        b_grid, c_grid = b_idx.unsqueeze(1).expand_as(ed_idx), c_idx.unsqueeze(1).expand_as(ed_idx)
+        inside_min = scores_inside[b_grid, ed_idx, c_grid].cummin(dim=1).values
+        span_scores = torch.minimum(inside_min, scores_end[b_grid, ed_idx, c_grid])
+        span_scores = torch.minimum(span_scores, scores_start[b_idx, st_idx, c_idx].unsqueeze(1))
+
+        valid = in_run & is_end[b_grid, ed_idx, c_grid]
+        n_idx, w_idx = torch.where(valid)
+        spans_idx = torch.stack([b_idx[n_idx], st_idx[n_idx], ed_idx[n_idx, w_idx], c_idx[n_idx]], dim=1)
+        return spans_idx, span_scores[n_idx, w_idx]
 
     def decode(self, tokens, id_to_classes, model_output, flat_ner=False, threshold=0.5, multi_label=False, **kwargs):
-        model_output = model_output.permute(3, 0, 1, 2)
-        scores_start, scores_end, scores_inside = model_output
+        scores_start, scores_end, scores_inside = torch.sigmoid(model_output).permute(3, 0, 1, 2)
+        lengths = torch.tensor([len(t) for t in tokens], device=model_output.device)
+        spans_idx, span_scores = self.calculate_span_score(scores_start, scores_end, scores_inside,
+                                                           lengths, threshold)
+
+        # Single host transfer for the candidates of every sample.
+        spans_idx = spans_idx.cpu().numpy()
+        span_scores = span_scores.float().cpu().numpy()
+        bounds = spans_idx[:, 0].searchsorted(range(len(tokens) + 1))
+
         spans = []
-        for i, _ in enumerate(tokens):
+        for i in range(len(tokens)):
             id_to_class_i = id_to_classes[i] if isinstance(id_to_classes, list) else id_to_classes
-            span_scores = self.calculate_span_score(
-                self.get_indices_above_threshold(scores_start[i], threshold),
-                self.get_indices_above_threshold(scores_end[i], threshold),
-                torch.sigmoid(scores_inside[i]),
-                torch.sigmoid(scores_start[i]),
-                torch.sigmoid(scores_end[i]),
-                id_to_class_i,
-                threshold
-            )
-            span_i = self.greedy_search(span_scores, flat_ner, multi_label)
+            lo, hi = bounds[i], bounds[i + 1]
+            _, st_i, ed_i, c_i = spans_idx[lo:hi].T
+            keep = greedy_search_indices(st_i, ed_i, span_scores[lo:hi], flat_ner, multi_label)
+            span_i = [
+                (st, ed, id_to_class_i[c + 1], None, score)
+                for st, ed, c, score in zip(st_i[keep].tolist(), ed_i[keep].tolist(),
+                                            c_i[keep].tolist(), span_scores[lo:hi][keep].tolist())
+            ]
             spans.append(span_i)
-        return spans
\ No newline at end of file
+        return spans
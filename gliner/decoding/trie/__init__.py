@@ -8,4 +8,6 @@ if is_module_available("pyximport"):
     except:
         from .python_labels_trie import LabelsTrie
 else:
-    from .python_labels_trie import LabelsTrie
\ No newline at end of file
+    from .python_labels_trie import LabelsTrie
+
+from .compiled_trie import CompiledLabelsTrie
@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional, Tuple, Union
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+class CompiledLabelsTrie:
+    """
+    Immutable, array-backed labels trie.
+
+    Nodes are numbered in breadth-first order, with the root as node 0, and stored in CSR form:
+    the children of node `n` are the edges `offsets[n]:offsets[n + 1]`, `keys[e]` is the token of edge `e`
+    and edge `e` leads to node `e + 1`. Keys are sorted within each node. The two arrays are saved into a
+    single `.npy` file, which can be memory-mapped, so that large ontologies are loaded without being parsed.
+
+    It has the same `get(prefix)` method as `LabelsTrie`, but decoding should query it by node id
+    (`child`, `children`) to avoid walking the trie from the root at every step.
+    """
+
+    def __init__(self, offsets: np.ndarray, keys: np.ndarray):
+        """
+        Args:
+            offsets (np.ndarray): Start of the children of each node in `keys`, shape (num_nodes + 1,).
+            keys (np.ndarray): Token of each edge, shape (num_nodes - 1,).
+        """
+        if len(offsets) != len(keys) + 2:
+            raise ValueError(f"Expected {len(keys) + 2} offsets for {len(keys)} keys, got {len(offsets)}.")
+        self.offsets = offsets
+        self.keys = keys
+        self._tensors: Dict[torch.device, Tuple[torch.LongTensor, torch.LongTensor]] = {}
+
+    @classmethod
+    def from_labels(cls, labels: List[List[int]]) -> "CompiledLabelsTrie":
+        """
+        Build the trie of tokenized labels.
+
+        Args:
+            labels (List[List[int]]): Token ids of each label.
+        """
+        root: dict = {}
+        for label in labels:
+            node = root
+            for token_id in label:
+                node = node.setdefault(int(token_id), {})
+
+        offsets, keys = [0], []
+        level = [root]
+        while level:
+            next_level = []
+            for node in level:
+                for key in sorted(node):
+                    keys.append(key)
+                    next_level.append(node[key])
+                offsets.append(len(keys))
+            level = next_level
+        return cls(np.asarray(offsets, dtype=np.int32), np.asarray(keys, dtype=np.int32))
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Save the trie into a single `.npy` file: the number of nodes, the offsets and the keys.
+        """
+        data = np.concatenate([[self.num_nodes], self.offsets, self.keys]).astype(np.int32)
+        np.save(path, data)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "CompiledLabelsTrie":
+        """
+        Args:
+            path (Union[str, Path]): File written by `save`.
+            mmap (bool): Whether to memory-map the file instead of reading it. Defaults to True.
+        """
+        data = np.load(path, mmap_mode="r" if mmap else None)
+        num_nodes = int(data[0])
+        return cls(data[1:num_nodes + 2], data[num_nodes + 2:])
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def root(self) -> int:
+        return 0
+
+    def children(self, node: int) -> np.ndarray:
+        """
+        Tokens allowed after `node`, as a (read-only) view of `keys`.
+        """
+        return self.keys[self.offsets[node]:self.offsets[node + 1]]
+
+    def child(self, node: int, token_id: int) -> int:
+        """
+        Node reached from `node` with `token_id`, or -1 if it is not in the trie.
+        """
+        start, end = int(self.offsets[node]), int(self.offsets[node + 1])
+        idx = start + int(np.searchsorted(self.keys[start:end], token_id))
+        if idx < end and self.keys[idx] == token_id:
+            return idx + 1
+        return -1
+
+    def node(self, prefix: List[int]) -> int:
+        """
+        Node reached with `prefix` from the root, or -1 if it is not in the trie.
+        """
+        node = self.root
+        for token_id in prefix:
+            node = self.child(node, token_id)
+            if node == -1:
+                break
+        return node
+
+    def get(self, prefix: List[int]) -> List[int]:
+        """Get possible next tokens after a given prefix.
+
+        Args:
+            prefix: The token sequence to search for.
+
+        Returns:
+            List of possible next token IDs.
+        """
+        node = self.node(prefix)
+        if node == -1:
+            return []
+        return self.children(node).tolist()
+
+    def tensors(self, device: Optional[torch.device] = None) -> Tuple[torch.LongTensor, torch.LongTensor]:
+        """
+        The `offsets` and `keys` arrays as int64 tensors, cached per device.
+        """
+        device = torch.device(device if device is not None else "cpu")
+        if device not in self._tensors:
+            self._tensors[device] = (
+                torch.tensor(np.asarray(self.offsets), dtype=torch.long, device=device),
+                torch.tensor(np.asarray(self.keys), dtype=torch.long, device=device),
+            )
+        return self._tensors[device]
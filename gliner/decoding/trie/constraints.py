@@ -0,0 +1,138 @@
+from typing import List, Optional, Tuple
+
+import torch
+
+from .compiled_trie import CompiledLabelsTrie
+
+
+class TrieConstraints:
+    """
+    Batched decoding constrained by a labels trie.
+
+    Each sequence holds the id of its current trie node, which is advanced with the generated token,
+    so the trie is never walked from the root. Nodes are expanded lazily, the first time a sequence
+    reaches them, and their children are stored in flat tensors (`starts`, `counts`, `keys`, `children`),
+    so that the allowed tokens of a whole batch are gathered and scattered into the logits at once.
+
+    Sequences that leave the trie, or reach a node without children, may only generate EOS.
+    With a `CompiledLabelsTrie`, its arrays are used directly and nothing is expanded while decoding.
+    """
+
+    def __init__(self, labels_trie, device: Optional[torch.device] = None):
+        """
+        Args:
+            labels_trie (Union[LabelsTrie, CompiledLabelsTrie]): Trie of the tokenized labels; only the
+                `get(prefix)` method of a `LabelsTrie` is used.
+            device (Optional[torch.device]): Device of the decoding states. Defaults to CPU.
+        """
+        self.labels_trie = labels_trie
+        self.device = device if device is not None else torch.device("cpu")
+        # node 0 is the dead node, without children, and node 1 the root
+        self._prefixes: List[Optional[Tuple[int, ...]]] = [None, ()]
+        self._starts = [0, 0]
+        self._counts = [0, 0]
+        self._expanded = [True, False]
+        self._keys: List[int] = []
+        self._children: List[int] = []
+        if isinstance(labels_trie, CompiledLabelsTrie):
+            self._from_compiled(labels_trie)
+        else:
+            self._update_tensors()
+
+    @property
+    def dead_state(self) -> int:
+        return 0
+
+    @property
+    def root_state(self) -> int:
+        return 1
+
+    def initial_states(self, batch_size: int) -> torch.LongTensor:
+        return torch.full((batch_size,), self.root_state, dtype=torch.long, device=self.device)
+
+    def _expand(self, state: int) -> None:
+        prefix = self._prefixes[state]
+        keys = list(dict.fromkeys(self.labels_trie.get(list(prefix))))
+        self._starts[state] = len(self._keys)
+        self._counts[state] = len(keys)
+        self._expanded[state] = True
+        for key in keys:
+            self._keys.append(key)
+            self._children.append(len(self._prefixes))
+            self._prefixes.append(prefix + (key,))
+            self._starts.append(0)
+            self._counts.append(0)
+            self._expanded.append(False)
+
+    def _from_compiled(self, labels_trie: CompiledLabelsTrie) -> None:
+        # states are shifted by one for the dead node: node n of the trie is state n + 1
+        offsets, self.keys = labels_trie.tensors(self.device)
+        zero = offsets.new_zeros(1)
+        self.starts = torch.cat([zero, offsets[:-1]])
+        self.counts = torch.cat([zero, offsets[1:] - offsets[:-1]])
+        self.expanded = torch.ones(len(self.starts), dtype=torch.bool, device=self.device)
+        self.children = torch.arange(2, len(self.keys) + 2, device=self.device)
+
+    def _update_tensors(self) -> None:
+        self.starts = torch.tensor(self._starts, dtype=torch.long, device=self.device)
+        self.counts = torch.tensor(self._counts, dtype=torch.long, device=self.device)
+        self.expanded = torch.tensor(self._expanded, dtype=torch.bool, device=self.device)
+        self.keys = torch.tensor(self._keys, dtype=torch.long, device=self.device)
+        self.children = torch.tensor(self._children, dtype=torch.long, device=self.device)
+
+    def allowed_tokens(self, states: torch.LongTensor) -> Tuple[torch.LongTensor, torch.LongTensor]:
+        """
+        Args:
+            states (torch.LongTensor): Current node of each sequence, shape (B,).
+
+        Returns:
+            Tuple[torch.LongTensor, torch.LongTensor]: Sequence index and position in the flat children
+                arrays of each allowed token, shape (N,).
+        """
+        unexpanded = states[~self.expanded[states]]
+        if unexpanded.numel():
+            for state in torch.unique(unexpanded).tolist():
+                self._expand(state)
+            self._update_tensors()
+
+        counts = self.counts[states]
+        batch_idx = torch.repeat_interleave(torch.arange(len(states), device=self.device), counts)
+        # position of each allowed token within the children of its node
+        first_idx = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(len(batch_idx), device=self.device) - first_idx[batch_idx]
+        return batch_idx, self.starts[states][batch_idx] + rank
+
+    def mask_logits(self, logits: torch.FloatTensor, states: torch.LongTensor,
+                    eos_token_id: int) -> Tuple[torch.FloatTensor, Tuple[torch.LongTensor, torch.LongTensor]]:
+        """
+        Set the logits of the tokens that are not allowed by the trie to -inf.
+
+        Returns:
+            Tuple: The masked logits and the allowed tokens (see `allowed_tokens`), to pass to `advance`.
+        """
+        batch_idx, children_idx = allowed = self.allowed_tokens(states)
+        tokens = self.keys[children_idx]
+        masked_logits = torch.full_like(logits, -float("inf"))
+        masked_logits[batch_idx, tokens] = logits[batch_idx, tokens]
+        leaves = self.counts[states] == 0
+        masked_logits[leaves, eos_token_id] = logits[leaves, eos_token_id]
+        return masked_logits, allowed
+
+    def advance(self, states: torch.LongTensor, next_tokens: torch.LongTensor,
+                allowed: Tuple[torch.LongTensor, torch.LongTensor]) -> torch.LongTensor:
+        """
+        Move each sequence to the child of its node matching the generated token.
+
+        Args:
+            states (torch.LongTensor): Current node of each sequence, shape (B,).
+            next_tokens (torch.LongTensor): Generated tokens, shape (B,).
+            allowed (Tuple[torch.LongTensor, torch.LongTensor]): Allowed tokens returned by `mask_logits`.
+
+        Returns:
+            torch.LongTensor: The new nodes, the dead node for tokens outside of the trie.
+        """
+        batch_idx, children_idx = allowed
+        matches = self.keys[children_idx] == next_tokens[batch_idx]
+        new_states = torch.full_like(states, self.dead_state)
+        new_states[batch_idx[matches]] = self.children[children_idx[matches]]
+        return new_states
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def is_nested(idx1, idx2):
     # Return True if idx2 is nested inside idx1 or vice versa
     return (idx1[0] <= idx2[0] and idx1[1] >= idx2[1]) or (idx2[0] <= idx1[0] and idx2[1] >= idx1[1])
@@ -18,3 +21,45 @@ def has_overlapping_nested(idx1, idx2, multi_label=False):
     if (idx1[0] > idx2[1] or idx2[0] > idx1[1]) or is_nested(idx1, idx2):
         return False
     return True
+
+
+def greedy_search_indices(starts, ends, scores, flat_ner=True, multi_label=False):
+    """
+    Vectorized greedy span selection: spans are visited by decreasing score and every
+    accepted span suppresses the remaining spans it conflicts with (any overlap for flat NER,
+    partial overlap for nested NER; identical boundaries unless `multi_label`).
+
+    Args:
+        starts (array-like): Start word index of each span.
+        ends (array-like): End word index (inclusive) of each span.
+        scores (array-like): Score of each span.
+        flat_ner (bool): Whether to forbid nested spans. Defaults to True.
+        multi_label (bool): Whether a span may keep several labels. Defaults to False.
+
+    Returns:
+        np.ndarray: Indices of the selected spans, ordered by start.
+    """
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    sorted_starts, sorted_ends = starts[order], ends[order]
+
+    alive = np.ones(len(order), dtype=bool)
+    kept = []
+    for i in range(len(order)):
+        if not alive[i]:
+            continue
+        kept.append(i)
+        s, e = sorted_starts[i], sorted_ends[i]
+        rest_starts, rest_ends = sorted_starts[i + 1:], sorted_ends[i + 1:]
+
+        conflict = (rest_starts <= e) & (rest_ends >= s)
+        if not flat_ner:
+            nested = ((s <= rest_starts) & (e >= rest_ends)) | ((rest_starts <= s) & (rest_ends >= e))
+            conflict &= ~nested
+        same = (rest_starts == s) & (rest_ends == e)
+        conflict = np.where(same, not multi_label, conflict)
+        alive[i + 1:] &= ~conflict
+
+    kept = order[kept]
+    return kept[np.argsort(starts[kept], kind="stable")]
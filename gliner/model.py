@@ -1,12 +1,18 @@
+import hashlib
 import json
 import os
 import re
 import warnings
+from collections import OrderedDict, deque
+from contextlib import ExitStack, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from tqdm import tqdm
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Dict, Hashable, List, Optional, Union
 
 import onnxruntime as ort
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 from huggingface_hub import PyTorchModelHubMixin, snapshot_download
@@ -19,11 +25,21 @@ from .config import GLiNERConfig
 from .data_processing import SpanProcessor, SpanBiEncoderProcessor, TokenProcessor, TokenBiEncoderProcessor
 from .data_processing.collator import DataCollator, DataCollatorWithPadding
 from .data_processing.tokenizer import WordsSplitter
+from .data_processing.utils import length_bucketed_batches
 from .decoding import SpanDecoder, TokenDecoder
-from .decoding.trie import LabelsTrie
+from .decoding.trie import LabelsTrie, CompiledLabelsTrie
 from .evaluation import Evaluator
 from .modeling.base import BaseModel, SpanModel, TokenModel
-from .onnx.model import BaseORTModel, SpanORTModel, TokenORTModel
+from .modeling.layers import RNN_TYPES
+from .onnx.model import (BaseORTModel, SpanORTModel, TokenORTModel, BiEncoderORTModel,
+                         SpanBiEncoderORTModel, TokenBiEncoderORTModel,
+                         TextEncoderORTModel, LabelsEncoderORTModel)
+from .onnx.session import ORTSessionPool
+from .cache import LabelsEmbeddingsCache, LRUCache
+
+INFERENCE_OPTIMIZATIONS = ("frozen", "bf16", "dynamic_int8")
+# submodules whose Linear and LSTM layers are quantized by the 'dynamic_int8' optimization
+DYNAMIC_INT8_MODULES = ("token_rep_layer", "rnn", "span_rep_layer", "prompt_rep_layer", "scorer")
 
 
 class GLiNER(nn.Module, PyTorchModelHubMixin):
@@ -103,12 +119,41 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
 
         if isinstance(self.model, BaseORTModel):
             self.onnx_model = True
+            if self.model.config is None:
+                self.model.config = config
         else:
             self.onnx_model = False
 
+        # default constraints of the labels decoder, saved with the model as `labels_trie.npy`
+        self.labels_trie: Optional[CompiledLabelsTrie] = None
+        self._gen_constraints_trie = None
+
+        # generated labels, see `set_generated_labels_cache`
+        self.generated_labels_cache: Optional[LRUCache] = None
+        self.generated_labels_context_window: Optional[int] = None
+
+        self.labels_cache = None
+        if config.labels_encoder is not None and (not self.onnx_model or isinstance(self.model, BiEncoderORTModel)):
+            self.labels_cache = LabelsEmbeddingsCache()
+
         # to suppress an AttributeError when training
         self._keys_to_ignore_on_save = None
 
+    def train(self, mode: bool = True):
+        # the weights of optimized models are frozen, and quantized in 'dynamic_int8' mode
+        if mode and getattr(self.config, "inference_optimization", None) is not None:
+            raise ValueError(f"Models optimized for inference ({self.config.inference_optimization}) can't be "
+                             f"trained, load the original weights instead.")
+        # Cached label embeddings are tied to the current weights of the labels encoder.
+        if mode and self.labels_cache is not None:
+            if self.labels_cache.cache_dir is not None:
+                self.labels_cache = LabelsEmbeddingsCache(self.labels_cache.memory.max_size)
+            else:
+                self.labels_cache.clear()
+        if mode and self.generated_labels_cache is not None:
+            self.generated_labels_cache.clear()
+        return super().train(mode)
+
     def forward(self, *args, **kwargs):
         """Wrapper function for the model's forward pass."""
         output = self.model(*args, **kwargs)
@@ -290,12 +335,14 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
             **kwargs,
         )
 
-    def set_labels_trie(self, labels: List[str]):
+    def set_labels_trie(self, labels: List[str], compiled: bool = False):
         """
         Initializing the labels trie
 
         Args:
             labels (List[str]): Labels that will be used.
+            compiled (bool): Whether to build an array-backed `CompiledLabelsTrie`, which can be saved
+                with the model (see `labels_trie`). Defaults to False.
         """ 
         tokenized_labels = []
         if self.data_processor.decoder_tokenizer is None:
@@ -306,10 +353,12 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
                 tokens = tokens[1:]
             tokens.append(self.data_processor.decoder_tokenizer.eos_token_id)
             tokenized_labels.append(tokens) # type: ignore
+        if compiled:
+            return CompiledLabelsTrie.from_labels(tokenized_labels)
         trie = LabelsTrie(tokenized_labels)
         return trie
     
-    def generate_labels(self, model_output, **gen_kwargs):
+    def generate_labels(self, model_output, cache_keys: Optional[List[Hashable]] = None, **gen_kwargs):
         """
         Generate (or rewrite) the textual class labels for each example in the batch.
 
@@ -319,6 +368,9 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
             Must expose `decoder_embedding` (FloatTensor, shape [N, L, H]) and
             `decoder_embedding_mask` (BoolTensor, shape [N, L]), where N is the total
             number of label placeholders across the whole minibatch.
+        cache_keys : list[Hashable], optional
+            Key of each decoder input in the generated labels cache (see
+            `set_generated_labels_cache`). Inputs found in the cache are not decoded.
         **gen_kwargs
             Extra args forwarded to `self.model.generate_labels` (e.g. `max_new_tokens`).
 
@@ -335,96 +387,173 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         
         dec_mask = model_output.decoder_embedding_mask       # [N, L]
 
-        gen_ids = self.model.generate_labels(dec_embeds, dec_mask, 
-                                                max_new_tokens=gen_kwargs.pop("max_new_tokens", 15),
-                                                eos_token_id=self.data_processor.decoder_tokenizer.eos_token_id,
-                                                do_sample = gen_kwargs.pop("do_sample", True),
-                                                temperature = gen_kwargs.pop("temperature", 0.01),
-                                                no_repeat_ngram_size = gen_kwargs.pop("no_repeat_ngram_size", 1),
-                                                repetition_penalty = gen_kwargs.pop("repetition_penalty", 1.1),
-                                                **gen_kwargs)  # [N, S]
+        cached = None
+        if cache_keys is not None and self.generated_labels_cache is not None:
+            cached, dec_mask = self._lookup_generated_labels(dec_mask, cache_keys)
+            if all(labels is not None for labels in cached):
+                return [label for labels in cached for label in labels]
+
+        num_return_sequences = gen_kwargs.get("num_return_sequences", 1)
+        with self._inference_context():
+            gen_ids = self.model.generate_labels(dec_embeds, dec_mask, 
+                                                    max_new_tokens=gen_kwargs.pop("max_new_tokens", 15),
+                                                    eos_token_id=self.data_processor.decoder_tokenizer.eos_token_id,
+                                                    do_sample = gen_kwargs.pop("do_sample", True),
+                                                    temperature = gen_kwargs.pop("temperature", 0.01),
+                                                    no_repeat_ngram_size = gen_kwargs.pop("no_repeat_ngram_size", 1),
+                                                    repetition_penalty = gen_kwargs.pop("repetition_penalty", 1.1),
+                                                    **gen_kwargs)  # [N, S]
 
         gen_texts = self.data_processor.decoder_tokenizer.batch_decode(
             gen_ids, skip_special_tokens=True
         ) 
+
+        if cached is not None:
+            misses = [i for i, labels in enumerate(cached) if labels is None]
+            for j, i in enumerate(misses):
+                cached[i] = gen_texts[j * num_return_sequences:(j + 1) * num_return_sequences]
+                self.generated_labels_cache.put(cache_keys[i], cached[i])
+            gen_texts = [label for labels in cached for label in labels]
         return gen_texts
-    
-    @torch.no_grad()
-    def run(
-        self, texts, labels, flat_ner=True, threshold=0.5, multi_label=False, batch_size=8, 
-        gen_constraints = None, num_gen_sequences = 1, **gen_kwargs
-    ):
+
+    def _lookup_generated_labels(self, dec_mask, cache_keys):
         """
-        Predict entities for a batch of texts.
+        Look the decoder inputs up in the generated labels cache.
+
+        Returns:
+            Tuple of the cached labels of each input (None for misses) and the decoder mask
+            without the inputs that were found.
+        """
+        cached = [self.generated_labels_cache.get(key) for key in cache_keys]
+        hits = [i for i, labels in enumerate(cached) if labels is not None]
+        if hits:
+            rows = self._decoder_input_rows(dec_mask)[hits]
+            dec_mask = dec_mask.clone()
+            dec_mask[rows[:, 0], rows[:, 1]] = 0
+        return cached, dec_mask
+
+    @staticmethod
+    def _decoder_input_rows(dec_mask):
+        # (batch, position) of the inputs kept by the decoder, in the order they are generated
+        B, S = dec_mask.shape[:2]
+        return dec_mask.reshape(B, S, -1).bool().any(-1).nonzero()
+
+    def _generated_labels_keys(self, batch, model_output, labels_trie=None, **gen_kwargs):
+        """
+        Key of each decoder input in the generated labels cache: the words of the span with
+        `generated_labels_context_window` words around it (the whole text in prompt mode), the
+        labels of the example, and the generation parameters.
+        """
+        if model_output.decoder_embedding is None:
+            return None
+        rows = self._decoder_input_rows(model_output.decoder_embedding_mask).tolist()
+        sel_idx = model_output.decoder_span_idx
+        if self.config.decoder_mode == "span":
+            sel_idx = sel_idx.tolist()
+        generation = (labels_trie, tuple(sorted((name, repr(value)) for name, value in gen_kwargs.items())))
+        window = self.generated_labels_context_window
+
+        keys = []
+        for b, s in rows:
+            tokens = batch["tokens"][b]
+            id_to_classes = batch["id_to_classes"]
+            classes = id_to_classes[b] if isinstance(id_to_classes, list) else id_to_classes
+            labels = tuple(classes.values())
+            if self.config.decoder_mode == "span":
+                start, width = divmod(sel_idx[b][s], self.config.max_width)
+                lo = 0 if window is None else max(start - window, 0)
+                hi = len(tokens) if window is None else start + width + 1 + window
+                keys.append((tuple(tokens[lo:hi]), start - lo, width, labels, generation))
+            else:
+                keys.append((tuple(tokens), s, labels, generation))
+        return keys
+
+    def set_generated_labels_cache(self, max_size: Optional[int] = 10000,
+                                   context_window: Optional[int] = 16) -> LRUCache:
+        """
+        Memoize the labels generated by the labels decoder. A span seen again with the same words
+        around it, the same labels and the same generation parameters is not decoded again.
+        Hit rates are available through the `stats` of the returned cache.
 
         Args:
-            texts (List[str]): A list of input texts to predict entities for.
-            labels (List[str]): A list of labels to predict.
-            flat_ner (bool, optional): Whether to use flat NER. Defaults to True.
-            threshold (float, optional): Confidence threshold for predictions. Defaults to 0.5.
-            multi_label (bool, optional): Whether to allow multiple labels per token. Defaults to False.
+            max_size (Optional[int]): Maximum number of cached spans. Defaults to 10000.
+            context_window (Optional[int]): Number of words on each side of a span that are part of its key,
+                the whole text if None. In prompt mode, the whole text is always used. Defaults to 16.
 
         Returns:
-            The list of lists with predicted entities.
+            LRUCache: The new cache.
         """
-        self.eval()
-        # raw input preparation
-        if isinstance(texts, str):
-            texts = [texts]
-        input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx = self.prepare_texts(texts)
-        
-        collator = DataCollator(
-            self.config,
-            data_processor=self.data_processor,
-            return_tokens=True,
-            return_entities=True,
-            return_id_to_classes=True,
-            prepare_labels=False,
-            entity_types=labels,
-        )
-        data_loader = torch.utils.data.DataLoader(
-            input_x, batch_size=batch_size, shuffle=False, collate_fn=collator
-        )
-
-        outputs = []
-        # Iterate over data batches
-        for batch in data_loader:
-            # Move the batch to the appropriate device
-            if not self.onnx_model:
-                for key in batch:
-                    if isinstance(batch[key], torch.Tensor):
-                        batch[key] = batch[key].to(self.device)
+        if self.config.labels_decoder is None:
+            raise NotImplementedError("Generated labels cache is supported only for models with labels decoder.")
+        self.generated_labels_cache = LRUCache(max_size)
+        self.generated_labels_context_window = context_window
+        return self.generated_labels_cache
+
+    def _forward_batch(self, batch, threshold=0.5, labels_trie=None, num_gen_sequences=1,
+                       labels_embeddings=None, **gen_kwargs):
+        """
+        Run the model (and the labels decoder, if any) over a single collated batch.
 
-            # Perform predictions
-            model_output = self.model(**batch, threshold=threshold)
-            model_logits = model_output[0]
+        Args:
+            batch (Dict): Batch produced by `DataCollator` with tokens and id_to_classes.
+            threshold (float, optional): Confidence threshold for predictions. Defaults to 0.5.
+            labels_trie (Optional[LabelsTrie]): Trie constraining generated labels. Defaults to None.
+            num_gen_sequences (int, optional): Number of generated labels per span. Defaults to 1.
+            labels_embeddings (Optional[torch.FloatTensor]): Pre-encoded labels of a bi-encoder model. Defaults to None.
 
-            if not isinstance(model_logits, torch.Tensor):
-                model_logits = torch.from_numpy(model_logits)
-            
-            gen_labels = None
-            id_to_classes = batch["id_to_classes"]
-            if self.config.labels_decoder is not None:
-                if gen_constraints is not None:
-                    labels_trie = self.set_labels_trie(gen_constraints)
-                else:
-                    labels_trie = None
-                gen_labels = self.generate_labels(model_output, labels_trie=labels_trie, 
-                                                  num_return_sequences=num_gen_sequences, **gen_kwargs)
+        Returns:
+            Tuple of the logits tensor, the generated labels (or None), the decoder span indices (or None)
+            and the positions of the spans kept by span pruning (or None).
+        """
+        # Move the batch to the appropriate device
+        if not self.onnx_model:
+            for key in batch:
+                if isinstance(batch[key], torch.Tensor):
+                    batch[key] = batch[key].to(self.device)
 
-            decoded_outputs = self.decoder.decode(
-                batch["tokens"],
-                id_to_classes,
-                model_logits,
-                flat_ner=flat_ner,
-                threshold=threshold,
-                multi_label=multi_label,
-                gen_labels=gen_labels,
-                sel_idx = model_output.decoder_span_idx,
-                num_gen_sequences=num_gen_sequences
-            )
-            outputs.extend(decoded_outputs)
+        # Perform predictions
+        if labels_embeddings is not None:
+            model_output = self._call_model(**batch, labels_embeddings=labels_embeddings, threshold=threshold)
+        else:
+            model_output = self._call_model(**batch, threshold=threshold)
+        model_logits = model_output[0]
+
+        if not isinstance(model_logits, torch.Tensor):
+            model_logits = torch.from_numpy(model_logits)
+
+        gen_labels = None
+        if self.config.labels_decoder is not None:
+            cache_keys = None
+            if self.generated_labels_cache is not None:
+                cache_keys = self._generated_labels_keys(batch, model_output, labels_trie=labels_trie,
+                                                         num_return_sequences=num_gen_sequences, **gen_kwargs)
+            gen_labels = self.generate_labels(model_output, cache_keys=cache_keys, labels_trie=labels_trie,
+                                              num_return_sequences=num_gen_sequences, **gen_kwargs)
+        return model_logits, gen_labels, model_output.decoder_span_idx, model_output.kept_span_idx
+
+    def _decode_batch(self, batch, model_logits, gen_labels=None, sel_idx=None, kept_span_idx=None,
+                      flat_ner=True, threshold=0.5, multi_label=False, num_gen_sequences=1):
+        """
+        Decode the logits of a single batch into lists of spans (start, end, label, generated label, score).
+        """
+        decoded_outputs = self.decoder.decode(
+            batch["tokens"],
+            batch["id_to_classes"],
+            model_logits,
+            flat_ner=flat_ner,
+            threshold=threshold,
+            multi_label=multi_label,
+            gen_labels=gen_labels,
+            sel_idx = sel_idx,
+            num_gen_sequences=num_gen_sequences,
+            kept_span_idx=kept_span_idx,
+        )
+        return decoded_outputs
 
+    def _spans_to_entities(self, texts, outputs, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx):
+        """
+        Convert decoded word-level spans into character-level entity dictionaries.
+        """
         all_entities = []
         for i, output in enumerate(outputs):
             start_token_idx_to_text_idx = all_start_token_idx_to_text_idx[i]
@@ -448,6 +577,429 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
 
         return all_entities
 
+    def _collate_texts(self, collator, texts, prepared_texts=None, label_shards=None):
+        """
+        Split a list of texts into words (unless already done) and collate them into model inputs.
+
+        With `label_shards`, every text is repeated once per shard (text-major order),
+        each copy being prompted with the labels of its shard.
+        """
+        if prepared_texts is None:
+            prepared_texts = self.prepare_texts(texts)
+        input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx = prepared_texts
+        if label_shards is None:
+            batch = collator(input_x)
+        else:
+            input_x = [example for example in input_x for _ in label_shards]
+            batch = collator(input_x, entity_types=label_shards * (len(input_x) // len(label_shards)))
+        return texts, batch, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx
+
+    def _merge_label_shards(self, batch, forward_output, label_shards):
+        """
+        Concatenate the logits of the rows that share a text but were prompted with different
+        label shards, so that the decoder sees every label of the text at once.
+        """
+        model_logits, _, _, kept_span_idx = forward_output
+        num_shards = len(label_shards)
+        class_dim = -2 if self.config.span_mode == "token_level" else -1
+
+        if kept_span_idx is not None:
+            # the prompt of every shard changes the text representations and thus the kept spans, so the
+            # pruned logits of each row are scattered back to the dense (B, L, K, C) layout, spans not kept
+            # by a shard getting -inf logits for its labels
+            B, _, C = model_logits.shape
+            num_spans = batch["span_idx"].size(1)
+            dense_logits = model_logits.new_full((B, num_spans, C), float("-inf"))
+            batch_idx, kept_idx = torch.where(kept_span_idx >= 0)
+            dense_logits[batch_idx, kept_span_idx[batch_idx, kept_idx]] = model_logits[batch_idx, kept_idx]
+            model_logits = dense_logits.view(B, num_spans // self.config.max_width, self.config.max_width, C)
+
+        shards_logits = [
+            model_logits[shard_id::num_shards].narrow(class_dim, 0, len(shard))
+            for shard_id, shard in enumerate(label_shards)
+        ]
+        model_logits = torch.cat(shards_logits, dim=class_dim)
+
+        all_labels = [label for shard in label_shards for label in shard]
+        merged_batch = {
+            "tokens": batch["tokens"][::num_shards],
+            "id_to_classes": {class_id: label for class_id, label in enumerate(all_labels, start=1)},
+        }
+        return merged_batch, (model_logits, None, None, None)
+
+    def _decode_to_entities(self, texts, batch, forward_output, all_start_token_idx_to_text_idx,
+                            all_end_token_idx_to_text_idx, label_shards=None, **decode_kwargs):
+        """
+        Decode the forward output of a batch and map the spans back to character offsets.
+        """
+        if label_shards is not None:
+            batch, forward_output = self._merge_label_shards(batch, forward_output, label_shards)
+        decoded_outputs = self._decode_batch(batch, *forward_output, **decode_kwargs)
+        return self._spans_to_entities(texts, decoded_outputs,
+                                       all_start_token_idx_to_text_idx,
+                                       all_end_token_idx_to_text_idx)
+
+    @staticmethod
+    def _iter_text_batches(texts, batch_size):
+        texts = iter(texts)
+        while True:
+            batch_texts = list(islice(texts, batch_size))
+            if not batch_texts:
+                break
+            yield batch_texts
+
+    @torch.no_grad()
+    def _predict_batches(
+        self, batches, labels, flat_ner=True, threshold=0.5, multi_label=False,
+        gen_constraints = None, num_gen_sequences = 1, pipeline = False, prefetch_batches = 2,
+        max_prompt_tokens = None, max_labels_per_shard = None, **gen_kwargs
+    ):
+        """
+        Predict entities batch by batch and yield them in the order of `batches`.
+
+        Args:
+            batches (Iterable[Tuple[List[str], Optional[Tuple]]]): Pairs of a list of texts and,
+                optionally, the output of `prepare_texts` for these texts (None to split them here).
+
+        See `stream` for the other arguments.
+        """
+        self.eval()
+
+        label_shards = None
+        if max_prompt_tokens is not None or max_labels_per_shard is not None:
+            if self.config.labels_encoder is not None or self.config.labels_decoder is not None:
+                raise NotImplementedError("Label sharding is supported only for uni-encoder models without labels decoder.")
+            labels = list(dict.fromkeys(labels))
+            label_shards = self.data_processor.shard_labels(labels, max_prompt_tokens, max_labels_per_shard)
+            if len(label_shards) == 1:
+                label_shards = None
+
+        labels_embeddings = None
+        if self.labels_cache is not None:
+            labels = list(dict.fromkeys(labels))
+            labels_embeddings = self.encode_labels(labels, show_progress=False)
+
+        collator = DataCollator(
+            self.config,
+            data_processor=self.data_processor,
+            return_tokens=True,
+            return_entities=True,
+            return_id_to_classes=True,
+            prepare_labels=False,
+            prepare_entities=labels_embeddings is None,
+            entity_types=labels,
+        )
+
+        labels_trie = None
+        if self.config.labels_decoder is not None:
+            if isinstance(gen_constraints, (LabelsTrie, CompiledLabelsTrie)):
+                labels_trie = gen_constraints
+            elif gen_constraints is not None:
+                # the same trie object is reused for the same constraints, which keeps the keys
+                # of the generated labels cache stable across calls
+                gen_constraints = tuple(gen_constraints)
+                if self._gen_constraints_trie is None or self._gen_constraints_trie[0] != gen_constraints:
+                    self._gen_constraints_trie = (gen_constraints, self.set_labels_trie(list(gen_constraints)))
+                labels_trie = self._gen_constraints_trie[1]
+            else:
+                labels_trie = self.labels_trie
+
+        decode_kwargs = dict(flat_ner=flat_ner, threshold=threshold,
+                             multi_label=multi_label, num_gen_sequences=num_gen_sequences)
+        forward_kwargs = dict(threshold=threshold, labels_trie=labels_trie, num_gen_sequences=num_gen_sequences,
+                              labels_embeddings=labels_embeddings, **gen_kwargs)
+        batches = iter(batches)
+
+        if not pipeline:
+            for batch_texts, prepared_texts in batches:
+                batch_texts, batch, starts, ends = self._collate_texts(collator, batch_texts, prepared_texts,
+                                                                       label_shards)
+                forward_output = self._forward_batch(batch, **forward_kwargs)
+                yield from self._decode_to_entities(batch_texts, batch, forward_output,
+                                                    starts, ends, label_shards, **decode_kwargs)
+            return
+
+        # Single-worker pools keep every stage in FIFO order, while the forward pass runs
+        # on the calling thread concurrently with collation and decoding.
+        with ThreadPoolExecutor(max_workers=1) as collate_pool, \
+                ThreadPoolExecutor(max_workers=1) as decode_pool:
+            collating = deque(
+                collate_pool.submit(self._collate_texts, collator, *next_batch, label_shards)
+                for next_batch in islice(batches, max(prefetch_batches, 1))
+            )
+            decoding = deque()
+            while collating:
+                batch_texts, batch, starts, ends = collating.popleft().result()
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    collating.append(collate_pool.submit(self._collate_texts, collator, *next_batch, label_shards))
+
+                forward_output = self._forward_batch(batch, **forward_kwargs)
+                decoding.append(decode_pool.submit(self._decode_to_entities, batch_texts, batch,
+                                                   forward_output, starts, ends, label_shards, **decode_kwargs))
+                while decoding and decoding[0].done():
+                    yield from decoding.popleft().result()
+
+            while decoding:
+                yield from decoding.popleft().result()
+
+    @torch.no_grad()
+    def stream(
+        self, texts, labels, flat_ner=True, threshold=0.5, multi_label=False, batch_size=8,
+        gen_constraints = None, num_gen_sequences = 1, pipeline = False, prefetch_batches = 2,
+        max_prompt_tokens = None, max_labels_per_shard = None, **gen_kwargs
+    ):
+        """
+        Lazily predict entities for an iterable of texts.
+
+        Texts are pulled from `texts` one batch at a time, so neither the inputs nor
+        the predictions have to fit in memory at once. Results are yielded in input order.
+
+        Args:
+            texts (Iterable[str]): An iterable (e.g. a generator) of input texts.
+            labels (List[str]): A list of labels to predict.
+            flat_ner (bool, optional): Whether to use flat NER. Defaults to True.
+            threshold (float, optional): Confidence threshold for predictions. Defaults to 0.5.
+            multi_label (bool, optional): Whether to allow multiple labels per token. Defaults to False.
+            batch_size (int, optional): Number of texts processed per forward pass. Defaults to 8.
+            pipeline (bool, optional): Whether to overlap collation of the next batches and decoding
+                of the previous batch with the forward pass of the current one, using worker threads.
+                Defaults to False.
+            prefetch_batches (int, optional): Number of batches collated ahead of the model when
+                `pipeline` is enabled. Defaults to 2.
+            max_prompt_tokens (Optional[int]): If set, labels are split into shards whose prompt fits
+                into this number of tokens. Each text is run once per shard as extra batch rows and the
+                logits are merged before decoding. Only for uni-encoder models. Defaults to None.
+            max_labels_per_shard (Optional[int]): If set, maximum number of labels per shard. Defaults to None.
+
+        Yields:
+            The list of predicted entities for each input text.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = ((batch_texts, None) for batch_texts in self._iter_text_batches(texts, batch_size))
+        yield from self._predict_batches(
+            batches,
+            labels,
+            flat_ner=flat_ner,
+            threshold=threshold,
+            multi_label=multi_label,
+            gen_constraints=gen_constraints,
+            num_gen_sequences=num_gen_sequences,
+            pipeline=pipeline,
+            prefetch_batches=prefetch_batches,
+            max_prompt_tokens=max_prompt_tokens,
+            max_labels_per_shard=max_labels_per_shard,
+            **gen_kwargs
+        )
+
+    def _split_into_windows(self, input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx,
+                            window_size, window_overlap, max_tokens=None):
+        """
+        Split word-tokenized documents into overlapping windows of at most `window_size` words
+        and, if set, `max_tokens` subword tokens, so that no window is truncated by the encoder.
+
+        Returns:
+            The windows' inputs and offset mappings (same layout as `prepare_texts`), the index of
+            the source document of every window and, for every window, the character offsets of its
+            first and last word if they are cut inside the document (None at document edges).
+        """
+        docs_words = [example["tokenized_text"] for example in input_x]
+        if max_tokens is not None:
+            words_num_tokens = self.data_processor.words_num_tokens(docs_words)
+
+        windows_x, windows_start_idx, windows_end_idx, windows_doc, windows_cuts = [], [], [], [], []
+        for doc_id, tokens in enumerate(docs_words):
+            num_words = len(tokens)
+            if max_tokens is not None:
+                tokens_offsets = np.concatenate([[0], np.cumsum(words_num_tokens[doc_id])])
+
+            start = 0
+            while True:
+                end = min(start + window_size, num_words)
+                if max_tokens is not None:
+                    # last word whose tokens still fit into the budget, at least one word per window
+                    fit_end = np.searchsorted(tokens_offsets, tokens_offsets[start] + max_tokens, side="right") - 1
+                    end = min(end, max(int(fit_end), start + 1))
+
+                windows_x.append({"tokenized_text": tokens[start:end], "ner": None})
+                windows_start_idx.append(all_start_token_idx_to_text_idx[doc_id][start:end])
+                windows_end_idx.append(all_end_token_idx_to_text_idx[doc_id][start:end])
+                windows_doc.append(doc_id)
+                left_cut = all_start_token_idx_to_text_idx[doc_id][start] if start > 0 else None
+                right_cut = all_end_token_idx_to_text_idx[doc_id][end - 1] if end < num_words else None
+                windows_cuts.append((left_cut, right_cut))
+
+                if end >= num_words:
+                    break
+                start = max(end - window_overlap, start + 1)
+
+        return windows_x, windows_start_idx, windows_end_idx, windows_doc, windows_cuts
+
+    def _window_max_tokens(self, labels, max_prompt_tokens=None, max_labels_per_shard=None):
+        """
+        Number of subword tokens of a window that fit into the encoder next to the special tokens
+        and, for uni-encoder models, the prompt of the labels (of their longest shard when sharded).
+        """
+        label_shards = None
+        if self.config.labels_encoder is None:
+            labels = list(dict.fromkeys(labels))
+            if max_prompt_tokens is not None or max_labels_per_shard is not None:
+                label_shards = self.data_processor.shard_labels(labels, max_prompt_tokens, max_labels_per_shard)
+            else:
+                label_shards = [labels]
+        max_tokens = self.data_processor.max_text_tokens(label_shards)
+        if max_tokens is not None and max_tokens <= 0:
+            raise ValueError("The prompt of the labels doesn't leave room for any text in the encoder, "
+                             "use `max_prompt_tokens` to split the labels into smaller shards.")
+        return max_tokens
+
+    def _merge_window_entities(self, windows_entities, windows_cuts, flat_ner=True, multi_label=False):
+        """
+        Merge the entities predicted on the consecutive, overlapping windows of a single document.
+
+        Entities touching a window edge inside the document may be truncated and are dropped, since
+        the neighbouring window sees them whole, unless they cover the whole overlap with it and
+        touch its edge too. Duplicates keep their best score and the remaining overlaps are resolved
+        greedily by score, as in the decoder.
+        """
+        best = {}
+        for i, (entities, (left_cut, right_cut)) in enumerate(zip(windows_entities, windows_cuts)):
+            prev_right_cut = windows_cuts[i - 1][1] if i > 0 else None
+            next_left_cut = windows_cuts[i + 1][0] if i + 1 < len(windows_cuts) else None
+            for entity in entities:
+                if entity["start"] == left_cut and entity["end"] != prev_right_cut:
+                    continue
+                if entity["end"] == right_cut and entity["start"] != next_left_cut:
+                    continue
+                key = (entity["start"], entity["end"], entity["label"])
+                if key not in best or entity["score"] > best[key]["score"]:
+                    best[key] = entity
+
+        # decoder spans use inclusive ends
+        spans = [(ent["start"], ent["end"] - 1, ent["label"], ent, ent["score"]) for ent in best.values()]
+        spans = self.decoder.greedy_search(spans, flat_ner, multi_label=multi_label)
+        return [span[3] for span in spans]
+
+    @torch.no_grad()
+    def run(
+        self, texts, labels, flat_ner=True, threshold=0.5, multi_label=False, batch_size=8, 
+        gen_constraints = None, num_gen_sequences = 1, pipeline = False, prefetch_batches = 2,
+        sort_by_length = False, max_tokens_per_batch = None, sliding_window = False,
+        window_size = None, window_overlap = None, max_prompt_tokens = None, max_labels_per_shard = None,
+        **gen_kwargs
+    ):
+        """
+        Predict entities for a batch of texts.
+
+        Args:
+            texts (List[str]): A list of input texts to predict entities for.
+            labels (List[str]): A list of labels to predict.
+            flat_ner (bool, optional): Whether to use flat NER. Defaults to True.
+            threshold (float, optional): Confidence threshold for predictions. Defaults to 0.5.
+            multi_label (bool, optional): Whether to allow multiple labels per token. Defaults to False.
+            pipeline (bool, optional): Whether to overlap collation, forward pass and decoding
+                of consecutive batches using worker threads. Defaults to False.
+            prefetch_batches (int, optional): Number of batches collated ahead of the model when
+                `pipeline` is enabled. Defaults to 2.
+            sort_by_length (bool, optional): Whether to group texts of similar word count into the
+                same batches to reduce padding. Results are returned in the original order. Defaults to False.
+            max_tokens_per_batch (Optional[int]): If set, texts are sorted by length and batches are
+                filled up to this number of padded words instead of `batch_size` texts. Defaults to None.
+            sliding_window (bool, optional): Whether to process texts longer than the model budget as
+                overlapping windows instead of truncating them. Windows of all texts are batched together
+                and their entities are merged back per text. Defaults to False.
+            window_size (Optional[int]): Maximum number of words per window, at most `config.max_len`.
+                Windows are also shortened to fit into the encoder with the prompt. Defaults to `config.max_len`.
+            window_overlap (Optional[int]): Number of words shared by consecutive windows, at least
+                `config.max_width`. Defaults to a quarter of `window_size`.
+            max_prompt_tokens (Optional[int]): If set, labels are split into shards whose prompt fits
+                into this number of tokens. Each text is run once per shard as extra batch rows and the
+                logits are merged before decoding. Only for uni-encoder models. Defaults to None.
+            max_labels_per_shard (Optional[int]): If set, maximum number of labels per shard. Defaults to None.
+
+        Returns:
+            The list of lists with predicted entities.
+        """
+        predict_kwargs = dict(
+            flat_ner=flat_ner,
+            threshold=threshold,
+            multi_label=multi_label,
+            gen_constraints=gen_constraints,
+            num_gen_sequences=num_gen_sequences,
+            pipeline=pipeline,
+            prefetch_batches=prefetch_batches,
+            max_prompt_tokens=max_prompt_tokens,
+            max_labels_per_shard=max_labels_per_shard,
+            **gen_kwargs
+        )
+        if not sort_by_length and max_tokens_per_batch is None and not sliding_window:
+            return list(self.stream(texts, labels, batch_size=batch_size, **predict_kwargs))
+
+        if isinstance(texts, str):
+            texts = [texts]
+        input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx = self.prepare_texts(texts)
+        inputs_doc = list(range(len(texts)))
+
+        if sliding_window:
+            window_size = min(window_size or self.config.max_len, self.config.max_len)
+            if window_overlap is None:
+                window_overlap = max(window_size // 4, self.config.max_width)
+            if not self.config.max_width <= window_overlap < window_size:
+                raise ValueError(f"`window_overlap` should be at least `config.max_width` ({self.config.max_width}), "
+                                 f"so that entities crossing a window edge are seen whole by a neighbouring window, "
+                                 f"and smaller than `window_size` ({window_size}).")
+            max_tokens = self._window_max_tokens(labels, max_prompt_tokens, max_labels_per_shard)
+            (input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx,
+                inputs_doc, windows_cuts) = self._split_into_windows(
+                    input_x, all_start_token_idx_to_text_idx, all_end_token_idx_to_text_idx,
+                    window_size, window_overlap, max_tokens=max_tokens
+                )
+
+        if sort_by_length or max_tokens_per_batch is not None:
+            lengths = [min(len(x["tokenized_text"]), self.config.max_len) for x in input_x]
+            batches_idx = length_bucketed_batches(lengths, batch_size, max_tokens_per_batch)
+        else:
+            batches_idx = [list(range(i, min(i + batch_size, len(input_x))))
+                           for i in range(0, len(input_x), batch_size)]
+
+        batches = (
+            (
+                [texts[inputs_doc[i]] for i in batch_idx],
+                (
+                    [input_x[i] for i in batch_idx],
+                    [all_start_token_idx_to_text_idx[i] for i in batch_idx],
+                    [all_end_token_idx_to_text_idx[i] for i in batch_idx],
+                ),
+            )
+            for batch_idx in batches_idx
+        )
+        sorted_idx = (i for batch_idx in batches_idx for i in batch_idx)
+
+        inputs_entities = [None] * len(input_x)
+        for i, entities in zip(sorted_idx, self._predict_batches(batches, labels, **predict_kwargs)):
+            inputs_entities[i] = entities
+
+        if not sliding_window:
+            return inputs_entities
+
+        docs_windows = [[] for _ in texts]
+        for i, doc_id in enumerate(inputs_doc):
+            docs_windows[doc_id].append(i)
+
+        all_entities = []
+        for windows in docs_windows:
+            if len(windows) == 1:
+                all_entities.append(inputs_entities[windows[0]])
+            else:
+                all_entities.append(self._merge_window_entities(
+                    [inputs_entities[i] for i in windows],
+                    [windows_cuts[i] for i in windows],
+                    flat_ner=flat_ner,
+                    multi_label=multi_label,
+                ))
+        return all_entities
+
     def predict_with_embeds(
         self, text, labels_embeddings, labels, flat_ner=True, threshold=0.5, multi_label=False
     ):
@@ -493,18 +1045,20 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
 
         model_input, raw_batch = self.prepare_model_inputs(texts, labels, prepare_entities = False)
 
-        model_output = self.model(labels_embeddings = labels_embeddings, **model_input)[0]
+        model_output = self._call_model(labels_embeddings = labels_embeddings, **model_input)
+        model_logits = model_output[0]
 
-        if not isinstance(model_output, torch.Tensor):
-            model_output = torch.from_numpy(model_output)
+        if not isinstance(model_logits, torch.Tensor):
+            model_logits = torch.from_numpy(model_logits)
 
         outputs = self.decoder.decode(
             raw_batch["tokens"],
             raw_batch["id_to_classes"],
-            model_output,
+            model_logits,
             flat_ner=flat_ner,
             threshold=threshold,
             multi_label=multi_label,
+            kept_span_idx=model_output.kept_span_idx,
         )
 
         all_entities = []
@@ -580,18 +1134,20 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
                     batch[key] = batch[key].to(self.device)
 
             # Perform predictions
-            model_output = self.model(**batch)[0]
+            model_output = self._call_model(**batch)
+            model_logits = model_output[0]
 
-            if not isinstance(model_output, torch.Tensor):
-                model_output = torch.from_numpy(model_output)
+            if not isinstance(model_logits, torch.Tensor):
+                model_logits = torch.from_numpy(model_logits)
 
             decoded_outputs = self.decoder.decode(
                 batch["tokens"],
                 batch["id_to_classes"],
-                model_output,
+                model_logits,
                 flat_ner=flat_ner,
                 threshold=threshold,
                 multi_label=multi_label,
+                kept_span_idx=model_output.kept_span_idx,
             )
             all_preds.extend(decoded_outputs)
             all_trues.extend(batch["entities"])
@@ -601,13 +1157,16 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
 
         return out, f1
 
-    def encode_labels(self, labels: List[str], batch_size: int = 8) -> torch.FloatTensor:
+    def encode_labels(self, labels: List[str], batch_size: int = 8, show_progress: bool = True) -> torch.FloatTensor:
         """
         Embedding of labels.
 
+        Labels already seen by the labels cache (see `set_labels_cache`) are not encoded again.
+
         Args:
             labels (List[str]): A list of labels.
             batch_size (int): Batch size for processing labels.
+            show_progress (bool): Whether to display a progress bar. Defaults to True.
 
         Returns:
             labels_embeddings (torch.FloatTensor): Tensor containing label embeddings.
@@ -615,20 +1174,91 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         if self.config.labels_encoder is None:
             raise NotImplementedError("Labels pre-encoding is supported only for bi-encoder model.")
 
+        if self.labels_cache is None:
+            return self._encode_labels(labels, batch_size, show_progress)
+
+        labels_embeddings = self.labels_cache.get_many(labels)
+        missing_labels = [label for label in dict.fromkeys(labels) if label not in labels_embeddings]
+        if missing_labels:
+            new_embeddings = self._encode_labels(missing_labels, batch_size, show_progress)
+            for label, embedding in zip(missing_labels, new_embeddings):
+                self.labels_cache.put(label, embedding)
+                labels_embeddings[label] = embedding
+            self.labels_cache.flush()
+
+        dtype = torch.float32 if self.onnx_model else next(self.model.parameters()).dtype
+        return torch.stack([labels_embeddings[label].to(device=self.device, dtype=dtype) for label in labels])
+
+    def _encode_labels(self, labels: List[str], batch_size: int = 8, show_progress: bool = True) -> torch.FloatTensor:
         # Create a DataLoader for efficient batching
         dataloader = DataLoader(labels, batch_size=batch_size, collate_fn=lambda x: x)
 
         labels_embeddings = []
 
-        for batch in tqdm(dataloader, desc="Encoding labels"):
+        for batch in tqdm(dataloader, desc="Encoding labels", disable=not show_progress):
             tokenized_labels = self.data_processor.labels_tokenizer(batch, return_tensors='pt',
-                                                                truncation=True, padding="max_length").to(self.device)
-            with torch.no_grad():  # Disable gradient calculation for inference
-                curr_labels_embeddings = self.model.token_rep_layer.encode_labels(**tokenized_labels)
-            labels_embeddings.append(curr_labels_embeddings)
+                                                                truncation=True, padding="longest").to(self.device)
+            with torch.no_grad(), self._inference_context():  # Disable gradient calculation for inference
+                if self.onnx_model:
+                    curr_labels_embeddings = self.model.labels_encoder(**tokenized_labels)
+                else:
+                    curr_labels_embeddings = self.model.token_rep_layer.encode_labels(**tokenized_labels)
+            labels_embeddings.append(curr_labels_embeddings.float() if self._autocast_dtype is not None
+                                     else curr_labels_embeddings)
 
         return torch.cat(labels_embeddings, dim=0)
 
+    def set_labels_cache(self, max_size: Optional[int] = 10000, cache_dir: Optional[Union[str, Path]] = None,
+                         model_revision: Optional[str] = None):
+        """
+        Configure the cache of label embeddings used by bi-encoder models.
+
+        Args:
+            max_size (Optional[int]): Maximum number of embeddings kept in memory. Defaults to 10000.
+            cache_dir (Optional[Union[str, Path]]): Directory where embeddings are persisted across sessions.
+                Defaults to None (memory only).
+            model_revision (Optional[str]): Identifier of the model weights the on-disk embeddings belong to.
+                Defaults to a fingerprint of the labels encoder weights.
+
+        Returns:
+            LabelsEmbeddingsCache: The new cache.
+        """
+        if self.config.labels_encoder is None:
+            raise NotImplementedError("Labels cache is supported only for bi-encoder models.")
+
+        namespace = "default"
+        if cache_dir is not None:
+            namespace = model_revision or self._labels_encoder_fingerprint()
+        self.labels_cache = LabelsEmbeddingsCache(max_size, cache_dir, namespace)
+        return self.labels_cache
+
+    def _labels_encoder_fingerprint(self) -> str:
+        if self.onnx_model:
+            session_pool = self.model.labels_encoder.session_pool
+            if session_pool is None:
+                raise ValueError("`model_revision` is required to persist the labels cache of an ONNX model "
+                                 "not loaded from a file.")
+            hasher = hashlib.sha256()
+            with open(session_pool.model_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(chunk)
+            return hasher.hexdigest()[:16]
+
+        labels_encoder = self.model.token_rep_layer
+        params = list(labels_encoder.labels_encoder.named_parameters())
+        if hasattr(labels_encoder, "labels_projection"):
+            params.extend(labels_encoder.labels_projection.named_parameters())
+
+        hasher = hashlib.sha256()
+        for name, param in params:
+            hasher.update(name.encode())
+            hasher.update(param.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+        # optimized models produce slightly different embeddings
+        inference_optimization = getattr(self.config, "inference_optimization", None)
+        if inference_optimization is not None:
+            hasher.update(inference_optimization.encode())
+        return hasher.hexdigest()[:16]
+
     def predict(self, batch, flat_ner=False, threshold=0.5, multi_label=False):
         """
         Predict the entities for a given batch of data.
@@ -642,18 +1272,20 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         Returns:
             List: Predicted entities for each example in the batch.
         """
-        model_output = self.model(**batch)[0]
+        model_output = self._call_model(**batch)
+        model_logits = model_output[0]
 
-        if not isinstance(model_output, torch.Tensor):
-            model_output = torch.from_numpy(model_output)
+        if not isinstance(model_logits, torch.Tensor):
+            model_logits = torch.from_numpy(model_logits)
 
         decoded_outputs = self.decoder.decode(
             batch["tokens"],
             batch["id_to_classes"],
-            model_output,
+            model_logits,
             flat_ner=flat_ner,
             threshold=threshold,
             multi_label=multi_label,
+            kept_span_idx=model_output.kept_span_idx,
         )
 
         return decoded_outputs
@@ -676,6 +1308,204 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
             print("Compiling scorer...")
             self.model.scorer = torch.compile(self.model.scorer)
 
+    @property
+    def _autocast_dtype(self) -> Optional[torch.dtype]:
+        if getattr(self.config, "inference_optimization", None) == "bf16":
+            return torch.bfloat16
+        return None
+
+    def _inference_context(self):
+        """
+        Context of the forward passes of a model optimized with `optimize_for_inference`.
+        """
+        if getattr(self.config, "inference_optimization", None) is None:
+            return nullcontext()
+        context = ExitStack()
+        context.enter_context(torch.inference_mode())
+        if self._autocast_dtype is not None:
+            context.enter_context(torch.autocast(device_type=self.device.type, dtype=self._autocast_dtype))
+        return context
+
+    def _call_model(self, *args, **kwargs):
+        """Run the model for inference, in the context set by `optimize_for_inference`."""
+        with self._inference_context():
+            output = self.model(*args, **kwargs)
+        if self._autocast_dtype is not None:
+            # the decoders expect fp32 scores
+            for key, value in output.items():
+                if isinstance(value, torch.Tensor) and value.is_floating_point():
+                    output[key] = value.float()
+        return output
+
+    def _apply_inference_optimization(self, mode: str):
+        self.model.requires_grad_(False)
+        if mode == "dynamic_int8":
+            for name in DYNAMIC_INT8_MODULES:
+                if hasattr(self.model, name):
+                    module = torch.ao.quantization.quantize_dynamic(getattr(self.model, name),
+                                                                    {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+                    setattr(self.model, name, module)
+        self.config.inference_optimization = mode
+
+    def optimize_for_inference(
+        self,
+        mode: str = "dynamic_int8",
+        verify: bool = True,
+        texts: Optional[List[str]] = None,
+        labels: Optional[List[str]] = None,
+        atol: float = 0.05,
+    ) -> "GLiNER":
+        """
+        Optimize the PyTorch model for CPU inference. All modes freeze the weights and run the forward
+        passes in `torch.inference_mode`:
+
+        - 'frozen': no other change.
+        - 'bf16': forward passes run in bfloat16 autocast, which is fast on CPUs with AVX512-BF16 or AMX.
+        - 'dynamic_int8': Linear and LSTM layers of the encoder, the RNN, the span representation layer and
+          the prompt projection are replaced with dynamically quantized int8 layers (CPU only).
+
+        The optimization is saved in the config, so models saved with `save_pretrained` are optimized again on load.
+        Optimized models can't be trained: `train()` raises an error.
+
+        Args:
+            mode (str): One of 'frozen', 'bf16' or 'dynamic_int8'. Defaults to 'dynamic_int8'.
+            verify (bool): Whether to compare the scores of the optimized model with the ones of the original
+                model and revert the optimization if they differ by more than `atol`. Defaults to True.
+            texts (Optional[List[str]]): Texts used for the verification. Defaults to a sample text.
+            labels (Optional[List[str]]): Labels used for the verification. Defaults to sample labels.
+            atol (float): Maximum allowed absolute difference between the scores (probabilities). Defaults to 0.05.
+
+        Returns:
+            GLiNER: The optimized model.
+
+        Raises:
+            ValueError: If the model is already optimized, or if the scores differ by more than `atol`.
+        """
+        if self.onnx_model:
+            raise NotImplementedError("Inference optimizations are supported only for PyTorch models.")
+        if mode not in INFERENCE_OPTIMIZATIONS:
+            raise ValueError(f"Unknown inference optimization: {mode}. Expected one of {list(INFERENCE_OPTIMIZATIONS)}.")
+        if getattr(self.config, "inference_optimization", None) is not None:
+            raise ValueError(f"The model is already optimized for inference ({self.config.inference_optimization}).")
+        if mode == "dynamic_int8" and self.device.type != "cpu":
+            raise ValueError("Dynamic int8 quantization is supported only on CPU.")
+
+        self.eval()
+        if verify:
+            if texts is None:
+                texts = ["Apple was founded by Steve Jobs and Steve Wozniak in Cupertino, California, in April 1976."]
+            if labels is None:
+                labels = ["person", "organization", "location", "date"]
+            model_input, _ = self.prepare_model_inputs(texts, labels, prepare_entities=False)
+            model_input = {key: value.to(self.device) if isinstance(value, torch.Tensor) else value
+                                                            for key, value in model_input.items()}
+
+            def compute_scores():
+                forward_kwargs = dict(model_input)
+                if self.config.labels_encoder is not None:
+                    forward_kwargs["labels_embeddings"] = self._encode_labels(labels, show_progress=False)
+                with torch.no_grad():
+                    return torch.sigmoid(self._call_model(**forward_kwargs).logits)
+
+            reference_scores = compute_scores()
+
+        original_modules = {name: getattr(self.model, name) for name in DYNAMIC_INT8_MODULES
+                                                            if hasattr(self.model, name)}
+        requires_grad = {name: param.requires_grad for name, param in self.model.named_parameters()}
+        self._apply_inference_optimization(mode)
+
+        if verify:
+            scores = compute_scores()
+            max_diff = (scores - reference_scores).abs().max().item()
+            if max_diff > atol:
+                for name, module in original_modules.items():
+                    setattr(self.model, name, module)
+                for name, param in self.model.named_parameters():
+                    param.requires_grad_(requires_grad[name])
+                self.config.inference_optimization = None
+                raise ValueError(f"The scores of the model optimized with '{mode}' differ by up to {max_diff:.4f} "
+                                 f"from the original ones, more than the tolerance of {atol}.")
+
+        # labels embeddings computed with the original weights are stale
+        if self.labels_cache is not None:
+            self.labels_cache = LabelsEmbeddingsCache(self.labels_cache.memory.max_size)
+        if self.generated_labels_cache is not None:
+            self.generated_labels_cache.clear()
+        return self
+
+    def distill_rnn(
+        self,
+        data: List[Dict],
+        rnn_type: str = "conv",
+        epochs: int = 3,
+        batch_size: int = 8,
+        learning_rate: float = 1e-3,
+        show_progress: bool = True,
+    ) -> float:
+        """
+        Replace the contextualizer of the word embeddings (the LSTM by default) with another type, e.g. the
+        convolutional one, trained to reproduce the outputs of the current one on `data`. The rest of the
+        model is not modified. The new type is saved in the config.
+
+        Args:
+            data (List[Dict]): Examples in the training data format.
+            rnn_type (str): Type of the new contextualizer, one of the keys of `RNN_TYPES`. Defaults to 'conv'.
+            epochs (int): Number of passes over the data. Defaults to 3.
+            batch_size (int): Batch size. Defaults to 8.
+            learning_rate (float): Learning rate of the new contextualizer. Defaults to 1e-3.
+            show_progress (bool): Whether to display a progress bar. Defaults to True.
+
+        Returns:
+            float: Mean squared error between the outputs of both contextualizers over the last epoch.
+        """
+        if self.onnx_model:
+            raise NotImplementedError("Distillation is supported only for PyTorch models.")
+        if not self.config.has_rnn or self.config.labels_encoder is not None:
+            raise ValueError("The model doesn't use a contextualizer of the word embeddings.")
+        if rnn_type not in RNN_TYPES:
+            raise ValueError(f"Unknown rnn_type: {rnn_type}. Expected one of {list(RNN_TYPES)}.")
+
+        # collect the inputs and outputs of the current contextualizer
+        teacher_outputs = []
+        def save_outputs(module, args, output):
+            teacher_outputs.append((args[0].detach().cpu(), args[1].detach().cpu(), output.detach().cpu()))
+
+        collator = DataCollator(self.config, data_processor=self.data_processor, prepare_labels=False)
+        data_loader = DataLoader(data, batch_size=batch_size, shuffle=False, collate_fn=collator)
+        self.eval()
+        handle = self.model.rnn.register_forward_hook(save_outputs)
+        try:
+            with torch.no_grad():
+                for batch in tqdm(data_loader, desc="Collecting outputs", disable=not show_progress):
+                    batch = {key: value.to(self.device) if isinstance(value, torch.Tensor) else value
+                                                                    for key, value in batch.items()}
+                    self.model(**batch)
+        finally:
+            handle.remove()
+
+        student = RNN_TYPES[rnn_type](self.config).to(self.device)
+        optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate)
+        student.train()
+        for _ in tqdm(range(epochs), desc="Distilling", disable=not show_progress):
+            total_loss, total_count = 0.0, 0
+            for idx in torch.randperm(len(teacher_outputs)).tolist():
+                words_embedding, mask, target = (tensor.to(self.device) for tensor in teacher_outputs[idx])
+                words_mask = mask.unsqueeze(-1).to(target.dtype)
+                squared_error = ((student(words_embedding, mask) - target) ** 2 * words_mask).sum()
+                count = words_mask.sum() * target.shape[-1]
+                optimizer.zero_grad()
+                (squared_error / count).backward()
+                optimizer.step()
+                total_loss += squared_error.item()
+                total_count += count.item()
+        student.eval()
+
+        self.model.rnn = student
+        self.config.rnn_type = rnn_type
+        if self.generated_labels_cache is not None:
+            self.generated_labels_cache.clear()
+        return total_loss / max(total_count, 1)
+
     def set_sampling_params(
         self, max_types, shuffle_types, random_drop, max_neg_type_ratio, max_len
     ):
@@ -700,10 +1530,15 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         """
         Prepare state dict in the case of torch.compile
         """
-        new_state_dict = {}
+        new_state_dict = OrderedDict()
         for key, tensor in state_dict.items():
             key = re.sub(r"_orig_mod\.", "", key)
             new_state_dict[key] = tensor
+        # versions of the modules, needed to load quantized modules
+        metadata = getattr(state_dict, "_metadata", None)
+        if metadata is not None:
+            new_state_dict._metadata = OrderedDict((re.sub(r"_orig_mod\.", "", key), value)
+                                                   for key, value in metadata.items())
         return new_state_dict
 
     def save_pretrained(
@@ -741,6 +1576,9 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         model_state_dict = self.prepare_state_dict(self.model.state_dict())
         # save model weights using safetensors
         if safe_serialization:
+            if getattr(self.config, "inference_optimization", None) == "dynamic_int8":
+                raise ValueError("Models quantized with 'dynamic_int8' can't be saved with safetensors, "
+                                 "set `safe_serialization=False`.")
             save_file(model_state_dict, os.path.join(save_directory, "model.safetensors"))
         else:
             torch.save(
@@ -754,6 +1592,9 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         if config is not None:
             config.to_json_file(save_directory / "gliner_config.json")
 
+        if self.labels_trie is not None:
+            self.labels_trie.save(save_directory / "labels_trie.npy")
+
         self.data_processor.transformer_tokenizer.save_pretrained(save_directory)
         # push to the Hub if required
         if push_to_hub:
@@ -783,8 +1624,14 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
         resize_token_embeddings: Optional[bool] = True,
         load_onnx_model: Optional[bool] = False,
         onnx_model_file: Optional[str] = "model.onnx",
+        onnx_text_encoder_file: Optional[str] = "text_encoder.onnx",
+        onnx_labels_encoder_file: Optional[str] = "labels_encoder.onnx",
         compile_torch_model: Optional[bool] = False,
         session_options: Optional[ort.SessionOptions] = None,
+        num_sessions: int = 1,
+        session_config: Optional[Dict] = None,
+        optimized_onnx_model_file: Optional[str] = None,
+        load_shape_buckets: bool = False,
         _attn_implementation: Optional[str] = None,
         max_length: Optional[int] = None,
         max_width: Optional[int] = None,
@@ -809,8 +1656,22 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
             resize_token_embeddings (Optional[bool]): Resize token embeddings. Defaults to True.
             load_onnx_model (Optional[bool]): Load ONNX version of the model. Defaults to False.
             onnx_model_file (Optional[str]): Filename for ONNX model. Defaults to 'model.onnx'.
+                For bi-encoder models, this is the scorer graph taking the token and labels embeddings as inputs.
+            onnx_text_encoder_file (Optional[str]): Filename for the text encoder graph of bi-encoder models.
+                Defaults to 'text_encoder.onnx'.
+            onnx_labels_encoder_file (Optional[str]): Filename for the labels encoder graph of bi-encoder models.
+                Defaults to 'labels_encoder.onnx'.
             compile_torch_model (Optional[bool]): Compile the PyTorch model. Defaults to False.
             session_options (Optional[onnxruntime.SessionOptions]): ONNX Runtime session options. Defaults to None.
+            num_sessions (int): Number of ONNX Runtime sessions serving concurrent calls. Defaults to 1.
+            session_config (Optional[Dict]): Keyword arguments of `gliner.onnx.session.create_session_options`
+                (threads, graph optimization level, execution mode, memory arena), used when `session_options` is None.
+            optimized_onnx_model_file (Optional[str]): File where the optimized ONNX graph is cached, relative to
+                the model directory. The encoder graphs of bi-encoder models are cached next to it with an
+                `_optimized` suffix. Defaults to None (the graph is optimized on every load).
+            load_shape_buckets (bool): Whether to load the static-shape graphs listed in `shape_buckets.json`
+                (see `convert_to_onnx.py --seq_buckets`). Batches are padded to the smallest bucket they fit into
+                and run on the dynamic-shape graph otherwise. Defaults to False.
             **model_kwargs: Additional keyword arguments for model initialization.
 
         Returns:
@@ -865,11 +1726,18 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
                 config.class_token_index == -1 or config.vocab_size == -1
             ) and resize_token_embeddings and not config.labels_encoder:
                 gliner.resize_token_embeddings(add_tokens=add_tokens)
+            # the saved weights are the ones of the optimized model
+            if getattr(config, "inference_optimization", None) is not None:
+                gliner._apply_inference_optimization(config.inference_optimization)
             if model_file.endswith("safetensors"):
                 state_dict = {}
                 with safe_open(model_file, framework="pt", device=map_location) as f:
                     for key in f.keys():
                         state_dict[key] = f.get_tensor(key)
+            elif getattr(config, "inference_optimization", None) == "dynamic_int8":
+                # packed int8 weights are serialized as script objects
+                with torch.serialization.safe_globals([torch.ScriptObject]):
+                    state_dict = torch.load(model_file, map_location=torch.device(map_location), weights_only=True)
             else:
                 state_dict = torch.load(model_file, map_location=torch.device(map_location), weights_only=True)
             gliner.model.load_state_dict(state_dict, strict=strict)
@@ -883,31 +1751,67 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
                 )
             gliner.eval()
         else:
-            model_file = Path(model_dir) / onnx_model_file
-            if not os.path.exists(model_file):
-                raise FileNotFoundError(
-                    f"The ONNX model can't be loaded from {model_file}."
-                )
-            if session_options is None:
-                session_options = ort.SessionOptions()
-                session_options.graph_optimization_level = (
-                    ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-                )
             providers = ['CPUExecutionProvider']
             if "cuda" in map_location:
                 if not torch.cuda.is_available():
                     raise RuntimeError("CUDA is not available but `map_location` is set to 'cuda'.")
                 providers = ['CUDAExecutionProvider']
-            ort_session = ort.InferenceSession(model_file, session_options, providers=providers)
-            if config.span_mode == "token_level":
-                model = TokenORTModel(ort_session)
+
+            def create_session_pool(file_name, optimized_file_name=None, pool_size=num_sessions):
+                model_file = Path(model_dir) / file_name
+                if not os.path.exists(model_file):
+                    raise FileNotFoundError(
+                        f"The ONNX model can't be loaded from {model_file}."
+                    )
+                if optimized_file_name is not None:
+                    optimized_file_name = Path(model_dir) / optimized_file_name
+                return ORTSessionPool(
+                    model_file,
+                    num_sessions=pool_size,
+                    providers=providers,
+                    session_options=session_options,
+                    optimized_model_filepath=optimized_file_name,
+                    **(session_config or {}),
+                )
+
+            session_pool = create_session_pool(onnx_model_file, optimized_onnx_model_file)
+            if config.labels_encoder is not None:
+                encoders = {}
+                for name, encoder_file in (("text", onnx_text_encoder_file), ("labels", onnx_labels_encoder_file)):
+                    optimized_encoder_file = None
+                    if optimized_onnx_model_file is not None:
+                        optimized_encoder_file = f"{Path(encoder_file).stem}_optimized.onnx"
+                    # labels are encoded once and cached, a single session is enough
+                    pool_size = num_sessions if name == "text" else 1
+                    encoders[name] = create_session_pool(encoder_file, optimized_encoder_file, pool_size)
+                text_encoder = TextEncoderORTModel(encoders["text"], config=config)
+                labels_encoder = LabelsEncoderORTModel(encoders["labels"], config=config)
+                if config.span_mode == "token_level":
+                    model = TokenBiEncoderORTModel(session_pool, text_encoder, labels_encoder, config=config)
+                else:
+                    model = SpanBiEncoderORTModel(session_pool, text_encoder, labels_encoder, config=config)
+            elif config.span_mode == "token_level":
+                model = TokenORTModel(session_pool, config=config)
             else:
-                model = SpanORTModel(ort_session)
+                model = SpanORTModel(session_pool, config=config)
+
+            if load_shape_buckets:
+                buckets_file = Path(model_dir) / "shape_buckets.json"
+                if not os.path.exists(buckets_file):
+                    raise FileNotFoundError(f"The shape buckets can't be loaded from {buckets_file}.")
+                with open(buckets_file, "r") as f:
+                    shape_buckets = json.load(f)
+                ort_models = {onnx_model_file: model}
+                if config.labels_encoder is not None:
+                    ort_models[onnx_text_encoder_file] = model.text_encoder
+                for graph_file, ort_model in ort_models.items():
+                    for bucket in shape_buckets.get(graph_file, []):
+                        ort_model.add_shape_bucket(bucket["sizes"], create_session_pool(bucket["file"]))
 
             gliner = cls(config, tokenizer=tokenizer, model=model)
             if (
                 config.class_token_index == -1 or config.vocab_size == -1
-            ) and resize_token_embeddings:
+            ) and resize_token_embeddings and not config.labels_encoder:
                 gliner.data_processor.transformer_tokenizer.add_tokens(add_tokens)
 
         if (len(gliner.data_processor.transformer_tokenizer)!=gliner.config.vocab_size
@@ -916,6 +1820,10 @@ class GLiNER(nn.Module, PyTorchModelHubMixin):
             model_embeds = gliner.model.token_rep_layer.resize_token_embeddings(
                 new_num_tokens, None
             )
+
+        labels_trie_file = Path(model_dir) / "labels_trie.npy"
+        if os.path.exists(labels_trie_file):
+            gliner.labels_trie = CompiledLabelsTrie.load(labels_trie_file, mmap=True)
         return gliner
 
     @staticmethod
@@ -6,13 +6,14 @@ import warnings
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.nn.utils.rnn import pad_sequence
 
 from transformers.utils import ModelOutput
 
 from .encoder import Encoder, BiEncoder
 from .decoder import Decoder
-from .layers import LstmSeq2SeqEncoder, CrossFuser, SelfAttentionBlock, create_projection_layer
+from .layers import RNN_TYPES, CrossFuser, SelfAttentionBlock, create_projection_layer
 from .scorers import Scorer
 from .loss_functions import focal_loss_with_logits, cross_entropy_loss
 from .span_rep import SpanRepLayer
@@ -27,6 +28,7 @@ class GLiNERModelOutput(ModelOutput):
     decoder_embedding: Optional[torch.FloatTensor] = None
     decoder_embedding_mask: Optional[torch.LongTensor] = None
     decoder_span_idx: Optional[torch.LongTensor] = None
+    kept_span_idx: Optional[torch.LongTensor] = None
     words_embedding: Optional[torch.FloatTensor] = None
     mask: Optional[torch.LongTensor] = None
 
@@ -103,7 +105,9 @@ class BaseModel(ABC, nn.Module):
                 )
 
         if self.config.has_rnn:
-            self.rnn = LstmSeq2SeqEncoder(config)
+            if config.rnn_type not in RNN_TYPES:
+                raise ValueError(f"Unknown rnn_type: {config.rnn_type}. Expected one of {list(RNN_TYPES)}.")
+            self.rnn = RNN_TYPES[config.rnn_type](config)
 
         if config.post_fusion_schema:            
             self.cross_fuser = CrossFuser(self.config.hidden_size,
@@ -155,8 +159,12 @@ class BaseModel(ABC, nn.Module):
                                labels_attention_mask: Optional[torch.LongTensor] = None,
                                text_lengths: Optional[torch.Tensor] = None,
                                words_mask: Optional[torch.LongTensor] = None,
+                               token_embeddings: Optional[torch.FloatTensor] = None,
                                **kwargs):
-        if labels_embeds is not None:
+        if token_embeddings is not None:
+            # the text was encoded beforehand, e.g. by a separate graph
+            token_embeds = token_embeddings
+        elif labels_embeds is not None:
             token_embeds = self.token_rep_layer.encode_text(input_ids, attention_mask, **kwargs)
         else:
             token_embeds, labels_embeds = self.token_rep_layer(input_ids, attention_mask,
@@ -187,11 +195,12 @@ class BaseModel(ABC, nn.Module):
                             labels_attention_mask: Optional[torch.LongTensor] = None,
                             text_lengths: Optional[torch.Tensor] = None,
                             words_mask: Optional[torch.LongTensor] = None,
+                            token_embeddings: Optional[torch.FloatTensor] = None,
                             **kwargs):
         if self.config.labels_encoder:
             prompts_embedding, prompts_embedding_mask, words_embedding, mask = self.get_bi_representations(
                 input_ids, attention_mask, labels_embeddings, labels_input_ids, labels_attention_mask,
-                text_lengths, words_mask, **kwargs
+                text_lengths, words_mask, token_embeddings, **kwargs
             )
         else:
             prompts_embedding, prompts_embedding_mask, words_embedding, mask = self.get_uni_representations(
@@ -400,6 +409,10 @@ class SpanModel(BaseModel):
 
         self.prompt_rep_layer = create_projection_layer(config.hidden_size, config.dropout)
 
+        if config.span_proposal:
+            # label-agnostic span score used to prune spans before label scoring
+            self.span_proposal_layer = create_projection_layer(config.hidden_size, config.dropout, 1)
+
         # if self.config.labels_decoder is not None:
         #     num_heads = self.decoder.decoder_hidden_size//(self.decoder.decoder_hidden_size//8)
         #     self.span_attn_layer = SelfAttentionBlock(self.decoder.decoder_hidden_size, num_heads = num_heads)
@@ -495,6 +508,88 @@ class SpanModel(BaseModel):
         return span_rep_new, span_rep_mask, span_sel_idx
 
 
+    @property
+    def pruning_enabled(self):
+        # Pruned logits have a (B, N, C) layout, kept dense for labels decoders and traced (ONNX) graphs.
+        return ((self.config.span_pruning_top_k is not None or self.config.span_pruning_threshold is not None)
+                and not hasattr(self, "decoder") and not torch.jit.is_tracing())
+
+    def prune_spans(self, span_rep, proposal_scores, span_mask, span_positions=None):
+        """
+        Keep the spans with the best proposal scores: at most `config.span_pruning_top_k` per
+        sentence and/or those above `config.span_pruning_threshold`.
+
+        Args:
+            span_rep (torch.FloatTensor): Flat span representations (B, N, D).
+            proposal_scores (torch.FloatTensor): Proposal logits (B, N).
+            span_mask (torch.Tensor): Valid spans (B, N).
+            span_positions (Optional[torch.LongTensor]): Flat span position of every span (B, N),
+                for packed representations. Defaults to the column of the span.
+
+        Returns:
+            Tuple of the kept representations (B, M, D), their mask (B, M) and their flat
+            span positions `start * max_width + width` (B, M), -1 for padding.
+        """
+        B, N, D = span_rep.shape
+        keep = span_mask.bool()
+
+        if self.config.span_pruning_threshold is not None:
+            keep = keep & (torch.sigmoid(proposal_scores) > self.config.span_pruning_threshold)
+
+        if self.config.span_pruning_top_k is not None:
+            top_k = min(self.config.span_pruning_top_k, N)
+            top_idx = proposal_scores.masked_fill(~keep, float("-inf")).topk(top_k, dim=1).indices
+            keep = keep & torch.zeros_like(keep).scatter_(1, top_idx, True)
+
+        span_rep_kept, kept_mask, kept_idx = self.select_decoder_embedding(span_rep, keep.long())
+        if span_positions is not None:
+            kept_idx = span_positions.gather(1, kept_idx.clamp(min=0)).masked_fill(kept_idx < 0, -1)
+        return span_rep_kept, kept_mask, kept_idx
+
+    def get_span_representations(self, words_embedding, span_idx, span_mask):
+        """
+        Span representations.
+
+        With marker span modes, only the spans of `span_mask` are projected and they are packed
+        per sentence: (B, N, D) with the flat span positions `start * max_width + width` of the
+        representations (B, N), -1 for padding. Other span modes, and traced graphs whose shapes
+        can't depend on the number of valid spans, get dense (B, L, K, D) representations and None.
+        """
+        K = self.config.max_width
+        if not self.span_rep_layer.supports_packed:
+            return self.span_rep_layer(words_embedding, span_idx), None
+
+        B, S, _ = span_idx.shape
+        batch_idx, flat_idx = torch.where(span_mask.bool())
+        packed_rep = self.span_rep_layer.forward_packed(words_embedding, span_idx[batch_idx, flat_idx], batch_idx)
+
+        if torch.jit.is_tracing():
+            span_rep = packed_rep.new_zeros(B, S, packed_rep.size(-1))
+            span_rep[batch_idx, flat_idx] = packed_rep
+            return span_rep.view(B, S // K, K, -1), None
+
+        num_spans = span_mask.bool().sum(-1)
+        first_span = num_spans.cumsum(0) - num_spans
+        col_idx = torch.arange(batch_idx.size(0), device=batch_idx.device) - first_span[batch_idx]
+        max_spans = int(num_spans.max()) if B else 0
+
+        span_rep = packed_rep.new_zeros(B, max_spans, packed_rep.size(-1))
+        span_rep[batch_idx, col_idx] = packed_rep
+        span_positions = span_idx.new_full((B, max_spans), -1)
+        span_positions[batch_idx, col_idx] = flat_idx
+        return span_rep, span_positions
+
+    @staticmethod
+    def unpack_spans(values, span_positions, num_spans):
+        """
+        Scatter values of packed spans (B, N, ...) into the dense layout (B, num_spans, ...),
+        with zeros for the spans that were not packed.
+        """
+        dense = values.new_zeros(values.size(0), num_spans, *values.shape[2:])
+        batch_idx, col_idx = torch.where(span_positions >= 0)
+        dense[batch_idx, span_positions[batch_idx, col_idx]] = values[batch_idx, col_idx]
+        return dense
+
     def forward(self,
                 input_ids: Optional[torch.FloatTensor] = None,
                 attention_mask: Optional[torch.LongTensor] = None,
@@ -506,6 +601,7 @@ class SpanModel(BaseModel):
                 labels_embeddings: Optional[torch.FloatTensor] = None,
                 labels_input_ids: Optional[torch.FloatTensor] = None,
                 labels_attention_mask: Optional[torch.LongTensor] = None,
+                token_embeddings: Optional[torch.FloatTensor] = None,
                 words_embedding: Optional[torch.FloatTensor] = None,
                 mask: Optional[torch.LongTensor] = None,
                 prompts_embedding: Optional[torch.FloatTensor] = None,
@@ -526,13 +622,14 @@ class SpanModel(BaseModel):
                                                                                                     labels_input_ids,
                                                                                                     labels_attention_mask,
                                                                                                     text_lengths,
-                                                                                                    words_mask)
+                                                                                                    words_mask,
+                                                                                                    token_embeddings)
         target_W = span_idx.size(1) // self.config.max_width
         words_embedding, mask = self._fit_length(words_embedding, mask, target_W)         
             
         span_idx = span_idx * span_mask.unsqueeze(-1)  
 
-        span_rep = self.span_rep_layer(words_embedding, span_idx)
+        span_rep, span_positions = self.get_span_representations(words_embedding, span_idx, span_mask)
 
         target_C = prompts_embedding.size(1)
         if labels is not None:
@@ -544,8 +641,33 @@ class SpanModel(BaseModel):
 
         prompts_embedding = self.prompt_rep_layer(prompts_embedding) 
 
-        scores = torch.einsum("BLKD,BCD->BLKC", span_rep, prompts_embedding)
-        
+        B, S = span_mask.shape
+        L, K = S // self.config.max_width, self.config.max_width
+        proposal_scores = kept_span_idx = None
+        if hasattr(self, "span_proposal_layer"):
+            proposal_scores = self.span_proposal_layer(span_rep).squeeze(-1)
+
+        if proposal_scores is not None and labels is None and self.pruning_enabled:
+            if span_positions is not None:
+                span_rep_kept, _, kept_span_idx = self.prune_spans(span_rep, proposal_scores, span_positions >= 0,
+                                                                   span_positions)
+            else:
+                span_rep_kept, _, kept_span_idx = self.prune_spans(span_rep.view(B, S, -1),
+                                                                   proposal_scores.view(B, S), span_mask)
+            scores = torch.einsum("BND,BCD->BNC", span_rep_kept, prompts_embedding)
+        elif span_positions is not None:
+            # only the valid spans are scored, the others keep zero logits
+            scores = torch.einsum("BND,BCD->BNC", span_rep, prompts_embedding)
+            scores = self.unpack_spans(scores, span_positions, S).view(B, L, K, -1)
+        else:
+            scores = torch.einsum("BLKD,BCD->BLKC", span_rep, prompts_embedding)
+
+        if span_positions is not None:
+            if proposal_scores is not None:
+                proposal_scores = self.unpack_spans(proposal_scores, span_positions, S).view(B, L, K)
+            if hasattr(self, "decoder"):
+                span_rep = self.unpack_spans(span_rep, span_positions, S).view(B, L, K, -1)
+
         decoder_embedding = decoder_mask = decoder_loss = decoder_span_idx = None
         if hasattr(self, "decoder"):
             if self.config.decoder_mode == 'span':
@@ -569,7 +691,8 @@ class SpanModel(BaseModel):
 
         loss = None
         if labels is not None:
-            loss = self.loss(scores, labels, prompts_embedding_mask, span_mask, decoder_loss=decoder_loss, **kwargs)
+            loss = self.loss(scores, labels, prompts_embedding_mask, span_mask, decoder_loss=decoder_loss,
+                             proposal_scores=proposal_scores, **kwargs)
 
         output = GLiNERModelOutput(
             logits=scores,
@@ -580,6 +703,7 @@ class SpanModel(BaseModel):
             decoder_embedding=decoder_embedding,
             decoder_embedding_mask=decoder_mask,
             decoder_span_idx=decoder_span_idx,
+            kept_span_idx=kept_span_idx,
             words_embedding=words_embedding,
             mask=mask,
         )
@@ -587,7 +711,8 @@ class SpanModel(BaseModel):
 
     def loss(self, scores, labels, prompts_embedding_mask, mask_label,
              alpha: float = -1., gamma: float = 0.0, label_smoothing: float = 0.0,
-             reduction: str = 'sum', negatives=1.0, masking="label", decoder_loss = None, **kwargs):
+             reduction: str = 'sum', negatives=1.0, masking="label", decoder_loss = None,
+             proposal_scores = None, **kwargs):
 
         batch_size = scores.shape[0]
         num_classes = prompts_embedding_mask.shape[-1]
@@ -617,6 +742,14 @@ class SpanModel(BaseModel):
                 f" 'none', 'mean', 'sum'. It will be used 'sum' instead.")
             loss = all_losses.sum()
 
+        if proposal_scores is not None:
+            # a span is a positive proposal if it has any label
+            proposal_labels = labels.max(-1).values
+            proposal_losses = F.binary_cross_entropy_with_logits(proposal_scores.view(batch_size, -1),
+                                                                 proposal_labels, reduction="none")
+            proposal_losses = proposal_losses * mask_label.view(batch_size, -1).float()
+            loss = loss + (proposal_losses.mean() if reduction == "mean" else proposal_losses.sum())
+
         if decoder_loss is not None:
             loss = decoder_loss*0.75+loss*0.25
         
@@ -633,6 +766,7 @@ class TokenModel(BaseModel):
                 labels_embeddings: Optional[torch.FloatTensor] = None,
                 labels_input_ids: Optional[torch.FloatTensor] = None,
                 labels_attention_mask: Optional[torch.LongTensor] = None,
+                token_embeddings: Optional[torch.FloatTensor] = None,
                 words_embedding: Optional[torch.FloatTensor] = None,
                 mask: Optional[torch.LongTensor] = None,
                 prompts_embedding: Optional[torch.FloatTensor] = None,
@@ -649,7 +783,8 @@ class TokenModel(BaseModel):
                                                                                                     labels_input_ids,
                                                                                                     labels_attention_mask,
                                                                                                     text_lengths,
-                                                                                                    words_mask)
+                                                                                                    words_mask,
+                                                                                                    token_embeddings)
         if labels is not None:
             target_W = labels.shape[1]
             words_embedding, mask = self._fit_length(words_embedding, mask, target_W)
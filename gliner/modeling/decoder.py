@@ -9,6 +9,7 @@ from ..utils import is_module_available, MissedPackageException
 from typing import Optional, Union
 
 from ..decoding.trie import LabelsTrie
+from ..decoding.trie.constraints import TrieConstraints
 
 IS_PEFT = is_module_available('peft')
 
@@ -118,25 +119,16 @@ class Decoder(nn.Module):
         next_logits = out.logits[:, -1]                         # (B, V)
 
         unfinished = torch.ones(B, dtype=torch.bool, device=device)
-        generated = [[] for _ in range(B)]
+        generated = torch.full((B, max_new_tokens), pad_token_id, dtype=torch.long, device=device)
+        num_steps = 0
 
-        for _ in range(max_new_tokens):
+        if labels_trie is not None:
+            constraints = TrieConstraints(labels_trie, device=device)
+            states = constraints.initial_states(B)
+
+        for step in range(max_new_tokens):
             if labels_trie is not None:
-                V = next_logits.shape[1]
-                mask_tensor = torch.full((B, V), -float('inf'), device=device)
-                for b in range(B):
-                    if unfinished[b]:
-                        current_seq = generated[b]  # Tokens generated so far
-                        
-                        allowed_tokens = labels_trie.get(current_seq)
-
-                        if len(allowed_tokens) == 0:
-                            allowed_tokens = [eos_token_id]
-                        
-                        mask_tensor[b, allowed_tokens] = 0
-                    else:
-                         mask_tensor[b, :] = 0
-                next_logits = next_logits + mask_tensor
+                next_logits, allowed = constraints.mask_logits(next_logits, states, eos_token_id)
 
             if temperature != 1.0:
                 next_logits = next_logits / temperature
@@ -148,12 +140,16 @@ class Decoder(nn.Module):
             else:
                 next_token = next_logits.argmax(dim=-1, keepdim=True)     # (B, 1)
 
-            for b in range(B):
-                if unfinished[b]:
-                    generated[b].append(next_token[b, 0].item())
+            next_token = next_token.masked_fill(~unfinished.unsqueeze(1), pad_token_id)
+            generated[:, step] = next_token[:, 0]
+            num_steps = step + 1
+
+            if labels_trie is not None:
+                # finished sequences are parked in the dead state so that they are never expanded
+                states = constraints.advance(states, next_token[:, 0], allowed)
+                states = states.masked_fill(~unfinished, constraints.dead_state)
 
-            eos_hit = next_token.squeeze() == eos_token_id
-            unfinished = unfinished & ~eos_hit
+            unfinished = unfinished & (next_token[:, 0] != eos_token_id)
             if not unfinished.any():         
                 break
 
@@ -171,14 +167,37 @@ class Decoder(nn.Module):
             past_key_values = out.past_key_values
             next_logits = out.logits[:, -1]
 
-        max_len = max(len(seq) for seq in generated)
-        out_ids = torch.full((B, max_len), pad_token_id, dtype=torch.long, device=device)
-        for b, seq in enumerate(generated):
-            if seq:
-                out_ids[b, :len(seq)] = torch.tensor(seq, device=device)
-
-        return out_ids 
+        return generated[:, :num_steps]
     
+    @torch.inference_mode()
+    def prefill(
+        self,
+        inputs_embeds: torch.Tensor,                 # (B, L0, D)
+        attention_mask: torch.Tensor,                # (B, L0)
+        num_copies: int = 1,
+    ):
+        """
+        Run a prefix through the decoder once and return its KV cache, repeated `num_copies` times
+        per sequence so that several generated sequences (e.g. beams) can branch from it.
+        """
+        model = self.decoder_layer.model
+        # same positions as the ones derived from the attention mask by `generate`
+        position_ids = attention_mask.long().cumsum(-1) - 1
+        position_ids = position_ids.masked_fill(attention_mask == 0, 1)
+        out = model(inputs_embeds=inputs_embeds,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    use_cache=True)
+        past_key_values = out.past_key_values
+        if num_copies > 1:
+            if isinstance(past_key_values, tuple):
+                # models still using the legacy cache format
+                past_key_values = tuple(tuple(state.repeat_interleave(num_copies, dim=0) for state in layer)
+                                        for layer in past_key_values)
+            else:
+                past_key_values.batch_repeat_interleave(num_copies)
+        return past_key_values
+
     @torch.inference_mode()
     def generate_from_embeds(
         self,
@@ -219,11 +238,18 @@ class Decoder(nn.Module):
         else:
             prefix_allowed_tokens = None
 
+        # `generate` expands the inputs of each sequence to its beams before running the prefix,
+        # so the prefix is run once here and only its last position is processed per beam
+        past_key_values = None
+        if num_return_sequences > 1 and L0 > 1:
+            past_key_values = self.prefill(inputs_embeds[:, :-1], attention_mask[:, :-1],
+                                           num_copies=num_return_sequences)
+
         # Generate new tokens using transformer's generate method
         generated_ids = model.generate(
             inputs_embeds=inputs_embeds, 
             attention_mask=attention_mask,
-            past_key_values=None,
+            past_key_values=past_key_values,
             max_new_tokens=max_new_tokens,
             eos_token_id=eos_token_id,
             pad_token_id=pad_token_id,
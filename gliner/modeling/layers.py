@@ -14,6 +14,10 @@ class LstmSeq2SeqEncoder(nn.Module):
                             batch_first=True)
 
     def forward(self, x, mask, hidden=None):
+        # Packing needs the lengths on the host, which would wait for the GPU to finish the encoder
+        if x.is_cuda and hidden is None and self.lstm.num_layers == 1 and self.lstm.bidirectional:
+            return self.forward_padded(x, mask)
+
         # Packing the input sequence
         lengths = mask.sum(dim=1).cpu()
         packed_x = pack_padded_sequence(x, lengths, batch_first=True, enforce_sorted=False)
@@ -26,6 +30,65 @@ class LstmSeq2SeqEncoder(nn.Module):
 
         return output
 
+    def forward_padded(self, x, mask):
+        """
+        Single-layer bidirectional LSTM over padded sequences, with the lengths kept on the device.
+
+        The forward direction reads the sequences as they are, padded on the right, and the backward
+        direction reads them padded on the left, so that neither reads padding before the words.
+        Both batches go through the LSTM in a single call.
+        """
+        batch_size, seq_length, _ = x.shape
+        positions = torch.arange(seq_length, device=x.device).unsqueeze(0)
+        shift = seq_length - mask.sum(dim=1, keepdim=True)
+
+        right_aligned_idx = (positions - shift).clamp(min=0).unsqueeze(-1).expand_as(x)
+        right_aligned_x = torch.gather(x, 1, right_aligned_idx)
+        output, _ = self.lstm(torch.cat([x, right_aligned_x], dim=0))
+
+        hidden_size = self.lstm.hidden_size
+        forward_output = output[:batch_size, :, :hidden_size]
+        backward_output = output[batch_size:, :, hidden_size:]
+        left_aligned_idx = (positions + shift).clamp(max=seq_length - 1).unsqueeze(-1).expand_as(backward_output)
+        backward_output = torch.gather(backward_output, 1, left_aligned_idx)
+
+        output = torch.cat([forward_output, backward_output], dim=-1)
+        return output * mask.unsqueeze(-1).to(output.dtype)
+
+
+class ConvSeq2SeqEncoder(nn.Module):
+    """
+    Contextualizes word embeddings with residual blocks of a dilated depthwise convolution followed by
+    a gated projection. Unlike the LSTM, all the words are processed in parallel. With the default
+    settings, each word sees the 14 words on each side.
+    """
+    def __init__(self, config, num_layers=3, kernel_size=5, dropout=0.):
+        super(ConvSeq2SeqEncoder, self).__init__()
+        hidden_size = config.hidden_size
+        self.convs = nn.ModuleList([
+            nn.Conv1d(hidden_size, hidden_size, kernel_size, padding=(kernel_size // 2) * 2 ** i,
+                      dilation=2 ** i, groups=hidden_size)
+            for i in range(num_layers)
+        ])
+        self.projections = nn.ModuleList([nn.Linear(hidden_size, hidden_size * 2) for _ in range(num_layers)])
+        self.norms = nn.ModuleList([nn.LayerNorm(hidden_size) for _ in range(num_layers)])
+        self.out_projection = nn.Linear(hidden_size, hidden_size)
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, x, mask, hidden=None):
+        mask = mask.unsqueeze(-1).to(x.dtype)
+        for conv, projection, norm in zip(self.convs, self.projections, self.norms):
+            # padded words must not leak into the words next to them
+            context = conv((norm(x) * mask).transpose(1, 2)).transpose(1, 2)
+            x = x + self.dropout(F.glu(projection(context), dim=-1))
+        return self.out_projection(x) * mask
+
+
+RNN_TYPES = {
+    "lstm": LstmSeq2SeqEncoder,
+    "conv": ConvSeq2SeqEncoder,
+}
+
 
 def create_projection_layer(hidden_size: int, dropout: float, out_dim: int = None) -> nn.Sequential:
     """
@@ -213,7 +213,29 @@ def extract_elements(sequence, indices):
     return extracted_elements
 
 
-class SpanMarker(nn.Module):
+class PackedSpanMarker(nn.Module):
+    """
+    Base of the marker span layers, which project the start and end words of the spans
+    (`project_start`, `project_end`, `out_project`) and can represent the valid spans only.
+    """
+
+    def packed_span_features(self, h: torch.Tensor, batch_idx: torch.Tensor) -> list:
+        # features concatenated after the start and end projections of every span
+        return []
+
+    def forward_packed(self, h: torch.Tensor, span_idx: torch.Tensor, batch_idx: torch.Tensor) -> torch.Tensor:
+        """
+        Representations of the listed spans only: span_idx [N, 2], batch_idx [N] -> [N, D].
+        """
+        start_span_rep = self.project_start(h)[batch_idx, span_idx[:, 0]]
+        end_span_rep = self.project_end(h)[batch_idx, span_idx[:, 1]]
+
+        cat = torch.cat([start_span_rep, end_span_rep, *self.packed_span_features(h, batch_idx)], dim=-1).relu()
+
+        return self.out_project(cat)
+
+
+class SpanMarker(PackedSpanMarker):
 
     def __init__(self, hidden_size, max_width, dropout=0.4):
         super().__init__()
@@ -259,7 +281,7 @@ class SpanMarker(nn.Module):
         return cat.view(B, L, self.max_width, D)
 
 
-class SpanMarkerV0(nn.Module):
+class SpanMarkerV0(PackedSpanMarker):
     """
     Marks and projects span endpoints using an MLP.
     """
@@ -285,7 +307,7 @@ class SpanMarkerV0(nn.Module):
 
         return self.out_project(cat).view(B, L, self.max_width, D)
 
-class SpanMarkerV1(nn.Module):
+class SpanMarkerV1(PackedSpanMarker):
     """
     Marks span endpoints and augments them with the first-token embedding.
 
@@ -348,7 +370,10 @@ class SpanMarkerV1(nn.Module):
 
         # Reshape back to [B, L, max_width, D] (S = L × max_width)
         return out.view(B, L, self.max_width, D)
-    
+
+    def packed_span_features(self, h: torch.Tensor, batch_idx: torch.Tensor) -> list:
+        return [torch.mean(h, dim=1)[batch_idx]]                            # [N, D]
+
 class ConvShareV2(nn.Module):
     def __init__(self, hidden_size, max_width):
         super().__init__()
@@ -416,6 +441,24 @@ class SpanRepLayer(nn.Module):
         else:
             raise ValueError(f'Unknown span mode {span_mode}')
 
+    @property
+    def supports_packed(self):
+        return hasattr(self.span_rep_layer, "forward_packed")
+
     def forward(self, x, *args):
 
         return self.span_rep_layer(x, *args)
+
+    def forward_packed(self, x, span_idx, batch_idx):
+        """
+        Compute representations of the given spans only (marker span modes).
+
+        Args:
+            x (torch.Tensor): Words embeddings of shape [B, L, D].
+            span_idx (torch.LongTensor): (start, end) of each span, shape [N, 2].
+            batch_idx (torch.LongTensor): Batch row of each span, shape [N].
+
+        Returns:
+            torch.Tensor: Span representations of shape [N, D].
+        """
+        return self.span_rep_layer.forward_packed(x, span_idx, batch_idx)
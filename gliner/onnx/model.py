@@ -1,17 +1,113 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Tuple, Union
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import threading
 import warnings
+import weakref
 import onnxruntime as ort
 import numpy as np
 import torch
 
+from ..cache import LRUCache
 from ..modeling.base import GLiNERModelOutput
+from .session import ORTSessionPool
+
+ONNX_TO_TORCH_DTYPE = {
+    "tensor(int64)": torch.int64,
+    "tensor(int32)": torch.int32,
+    "tensor(bool)": torch.bool,
+    "tensor(float)": torch.float32,
+    "tensor(float16)": torch.float16,
+    "tensor(double)": torch.float64,
+}
+
+TORCH_TO_NUMPY_DTYPE = {
+    torch.int64: np.int64,
+    torch.int32: np.int32,
+    torch.bool: np.bool_,
+    torch.float32: np.float32,
+    torch.float16: np.float16,
+    torch.float64: np.float64,
+}
+
+
+def pad_to_bucket(tensor: torch.Tensor, axes: Tuple[Optional[str], ...], sizes: Dict[str, int]) -> torch.Tensor:
+    """
+    Pad the named axes of a tensor up to the sizes of a shape bucket.
+
+    The batch axis is padded by repeating the last example, so that the padding rows remain
+    valid inputs (e.g. non-empty texts). The other axes are padded with zeros, which masks them out.
+
+    Args:
+        tensor (torch.Tensor): Tensor to pad.
+        axes (Tuple[Optional[str], ...]): Name of each axis of the tensor, None for axes that are not padded.
+        sizes (Dict[str, int]): Target size of the named axes.
+
+    Returns:
+        torch.Tensor: The padded tensor.
+    """
+    for dim, axis in enumerate(axes):
+        target = sizes.get(axis) if axis is not None else None
+        if target is None or tensor.shape[dim] >= target:
+            continue
+        extra = target - tensor.shape[dim]
+        if axis == "batch":
+            last = tensor.narrow(dim, tensor.shape[dim] - 1, 1)
+            padding = last.expand(*[extra if d == dim else -1 for d in range(tensor.dim())])
+        else:
+            shape = list(tensor.shape)
+            shape[dim] = extra
+            padding = tensor.new_zeros(shape)
+        tensor = torch.cat([tensor, padding], dim=dim)
+    return tensor
+
 
 class BaseORTModel(ABC):
-    def __init__(self, session: ort.InferenceSession):
-        self.session = session
+    # names of the axes of the inputs and outputs that can be padded to a shape bucket
+    input_axes: Dict[str, Tuple[Optional[str], ...]] = {}
+    output_axes: Dict[str, Tuple[Optional[str], ...]] = {}
+
+    def __init__(self, session: Union[ort.InferenceSession, ORTSessionPool], config=None,
+                 use_io_binding: bool = True, max_cached_buffers: int = 16):
+        """
+        Args:
+            session (Union[ort.InferenceSession, ORTSessionPool]): ONNX Runtime session of the exported model,
+                or a pool of sessions from which each forward pass checks out one.
+            config (Optional[GLiNERConfig]): Model config, used to infer the shape of the logits so that
+                they can be written into preallocated buffers. Defaults to None.
+            use_io_binding (bool): Whether to bind inputs and outputs to device memory instead of
+                copying them through numpy with `session.run`. Defaults to True.
+            max_cached_buffers (int): Number of output buffers kept for reuse. Defaults to 16.
+        """
+        if isinstance(session, ORTSessionPool):
+            self.session_pool = session
+            self.session = session.session
+        else:
+            self.session_pool = None
+            self.session = session
+        self.config = config
         self.input_names = {input_key.name: idx for idx, input_key in enumerate(self.session.get_inputs())}
         self.output_names = {output_key.name: idx for idx, output_key in enumerate(self.session.get_outputs())}
+        self.input_dtypes = {input_key.name: ONNX_TO_TORCH_DTYPE.get(input_key.type)
+                                                    for input_key in self.session.get_inputs()}
+        self.output_dtypes = {output_key.name: ONNX_TO_TORCH_DTYPE.get(output_key.type)
+                                                    for output_key in self.session.get_outputs()}
+        self.use_io_binding = use_io_binding
+        self.preallocate_outputs = True
+        # output buffers keyed by (name, dtype, capacity), capacity being a power of two,
+        # with a weak reference to the tensor last handed out from each of them
+        self.output_buffers = LRUCache(max_cached_buffers)
+        self._buffers_lock = threading.Lock()
+        # static-shape graphs, as (sizes, session) pairs sorted from the smallest to the largest
+        self.shape_buckets = []
+
+        if "CUDAExecutionProvider" in self.session.get_providers():
+            provider_options = self.session.get_provider_options().get("CUDAExecutionProvider", {})
+            self.device_id = int(provider_options.get("device_id", 0))
+            self.device = torch.device("cuda", self.device_id)
+        else:
+            self.device_id = 0
+            self.device = torch.device("cpu")
 
     def prepare_inputs(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, np.ndarray]:
         """
@@ -34,20 +130,216 @@ class BaseORTModel(ABC):
             prepared_inputs[key] = tensor.cpu().detach().numpy()
         return prepared_inputs
 
-    def run_inference(self, inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    @contextmanager
+    def checkout_session(self, session: Optional[Union[ort.InferenceSession, ORTSessionPool]] = None
+                         ) -> Iterator[ort.InferenceSession]:
+        """
+        Borrow a session for one inference, waiting for a free one if the model runs on a session pool.
+
+        Args:
+            session (Optional[Union[ort.InferenceSession, ORTSessionPool]]): Session or pool to borrow from.
+                Defaults to the session(s) of the dynamic-shape graph.
+        """
+        if session is None:
+            session = self.session_pool or self.session
+        if isinstance(session, ORTSessionPool):
+            with session.checkout() as pooled_session:
+                yield pooled_session
+        else:
+            yield session
+
+    def add_shape_bucket(self, sizes: Dict[str, int],
+                         session: Union[ort.InferenceSession, ORTSessionPool]) -> None:
+        """
+        Register a graph exported with static shapes. Batches that fit into its shape are padded
+        to it and run on this graph instead of the dynamic-shape one.
+
+        Args:
+            sizes (Dict[str, int]): Size of each named axis of the graph, e.g. {"batch": 8, "seq": 256}.
+            session (Union[ort.InferenceSession, ORTSessionPool]): Session(s) of the static-shape graph.
+        """
+        self.shape_buckets.append((dict(sizes), session))
+        self.shape_buckets.sort(key=lambda bucket: int(np.prod(list(bucket[0].values()))))
+
+    def get_axes_sizes(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, int]:
+        sizes = {}
+        for name, tensor in inputs.items():
+            for axis, size in zip(self.input_axes.get(name, ()), tensor.shape):
+                if axis is not None:
+                    sizes[axis] = size
+        return self._add_derived_sizes(sizes)
+
+    def _add_derived_sizes(self, sizes: Dict[str, int]) -> Dict[str, int]:
+        return sizes
+
+    def select_shape_bucket(self, inputs: Dict[str, torch.Tensor]):
+        """
+        Returns:
+            The smallest shape bucket the inputs fit into, as a pair of the padded sizes of all axes
+            and the session(s) of the bucket, or None if there is none.
+        """
+        if not self.shape_buckets:
+            return None
+        input_sizes = self.get_axes_sizes(inputs)
+        for sizes, session in self.shape_buckets:
+            bucket_sizes = self._add_derived_sizes(dict(sizes))
+            if all(input_sizes.get(axis, 0) <= size for axis, size in bucket_sizes.items()):
+                return bucket_sizes, session
+        return None
+
+    def run_inference(self, inputs: Dict[str, np.ndarray],
+                      session: Optional[ort.InferenceSession] = None) -> Dict[str, np.ndarray]:
         """
         Run the ONNX model inference.
         
         Args:
             inputs (Dict[str, np.ndarray]): Prepared inputs for the model.
+            session (Optional[ort.InferenceSession]): Session to run. Defaults to `self.session`.
         
         Returns:
             Dict[str, np.ndarray]: Model's outputs as numpy arrays.
         """
-        onnx_outputs = self.session.run(None, inputs)
+        session = session or self.session
+        onnx_outputs = session.run(None, inputs)
         outputs = {name: onnx_outputs[idx] for name, idx in self.output_names.items()}
         return outputs
 
+    def get_output_shapes(self, inputs: Dict[str, torch.Tensor]) -> Optional[Dict[str, Tuple[int, ...]]]:
+        """
+        Infer the shapes of the model outputs from its inputs.
+
+        Args:
+            inputs (Dict[str, torch.Tensor]): Dictionary of input names and tensors.
+
+        Returns:
+            Optional[Dict[str, Tuple[int, ...]]]: Output names and shapes, None if they can't be inferred.
+        """
+        return None
+
+    def get_num_classes(self, inputs: Dict[str, torch.Tensor]) -> Optional[int]:
+        if 'labels_embeddings' in inputs:
+            return inputs['labels_embeddings'].shape[0]
+        if self.config is None or self.config.class_token_index < 0:
+            return None
+        num_classes = int((inputs['input_ids'] == self.config.class_token_index).sum(-1).max())
+        return num_classes if num_classes > 0 else None
+
+    def get_output_buffer(self, name: str, shape: Tuple[int, ...]) -> torch.Tensor:
+        """
+        Return a tensor of the given shape backed by a reusable buffer.
+
+        Buffers are bucketed by their capacity rounded up to a power of two, so that batches of
+        similar shapes share memory. A buffer is reused only when the tensor handed out from it on
+        the previous call was released, views of that tensor (slices, reshapes) keeping it alive.
+        Aliases made with `detach()` or `numpy()` don't, and must be cloned to be kept across calls.
+        """
+        dtype = self.output_dtypes[name] or torch.float32
+        numel = int(np.prod(shape))
+        capacity = 1 << max(numel - 1, 0).bit_length()
+        key = (name, dtype, capacity)
+        with self._buffers_lock:
+            cached = self.output_buffers.get(key)
+            if cached is None or cached[1]() is not None:
+                buffer = torch.empty(capacity, dtype=dtype, device=self.device)
+            else:
+                buffer = cached[0]
+            # a tensor of its own, rather than a view of `buffer`, so that its views reference it
+            output = buffer.new_empty(0).set_(buffer.untyped_storage(), 0, shape,
+                                              buffer[:numel].view(shape).stride())
+            self.output_buffers.put(key, (buffer, weakref.ref(output)))
+            return output
+
+    def bind_tensor(self, binding: ort.IOBinding, name: str, tensor: torch.Tensor, is_input: bool = True) -> None:
+        device_type = "cuda" if tensor.is_cuda else "cpu"
+        bind = binding.bind_input if is_input else binding.bind_output
+        bind(name, device_type, self.device_id, TORCH_TO_NUMPY_DTYPE[tensor.dtype],
+                                        tuple(tensor.shape), tensor.data_ptr())
+
+    def run_with_io_binding(self, inputs: Dict[str, torch.Tensor],
+                            session: Optional[ort.InferenceSession] = None) -> Dict[str, torch.Tensor]:
+        """
+        Run the ONNX model inference binding torch tensors to the session inputs and outputs.
+        
+        Inputs are read in place from the device memory of the session. Outputs are written to
+        preallocated buffers when their shapes can be inferred, otherwise they are allocated by ONNX Runtime.
+
+        Args:
+            inputs (Dict[str, torch.Tensor]): Dictionary of input names and tensors.
+            session (Optional[ort.InferenceSession]): Session to run. Defaults to `self.session`.
+
+        Returns:
+            Dict[str, torch.Tensor]: Model's outputs as torch tensors.
+        """
+        session = session or self.session
+        binding = session.io_binding()
+        bound_inputs = {}
+        for key, tensor in inputs.items():
+            if key not in self.input_names:
+                warnings.warn(f"Input key '{key}' not found in ONNX model's input names. Ignored.")
+                continue
+            dtype = self.input_dtypes[key] or tensor.dtype
+            # keep a reference to converted tensors until the inference is done
+            bound_inputs[key] = tensor.detach().to(device=self.device, dtype=dtype).contiguous()
+            self.bind_tensor(binding, key, bound_inputs[key])
+
+        output_shapes = self.get_output_shapes(inputs) if self.preallocate_outputs else None
+        if output_shapes is not None and set(output_shapes) != set(self.output_names):
+            output_shapes = None
+
+        outputs = {}
+        if output_shapes is not None:
+            for name, shape in output_shapes.items():
+                outputs[name] = self.get_output_buffer(name, shape)
+                self.bind_tensor(binding, name, outputs[name], is_input=False)
+        else:
+            for name in self.output_names:
+                binding.bind_output(name, self.device.type, self.device_id)
+
+        binding.synchronize_inputs()
+        try:
+            session.run_with_iobinding(binding)
+        except Exception:
+            if output_shapes is None:
+                raise
+            warnings.warn("Failed to write ONNX model outputs into preallocated buffers, "
+                          "falling back to buffers allocated by ONNX Runtime.")
+            self.preallocate_outputs = False
+            return self.run_with_io_binding(inputs, session)
+        binding.synchronize_outputs()
+
+        if output_shapes is None:
+            ort_outputs = binding.get_outputs()
+            for name, idx in self.output_names.items():
+                outputs[name] = torch.from_numpy(ort_outputs[idx].numpy())
+        return outputs
+
+    def compute_outputs(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, Any]:
+        bucket = self.select_shape_bucket(inputs)
+        if bucket is None:
+            return self._run(inputs)
+
+        bucket_sizes, session = bucket
+        input_sizes = self.get_axes_sizes(inputs)
+        padded_inputs = {name: pad_to_bucket(tensor, self.input_axes.get(name, ()), bucket_sizes)
+                                                            for name, tensor in inputs.items()}
+        outputs = self._run(padded_inputs, session)
+        for name, output in outputs.items():
+            if not isinstance(output, torch.Tensor):
+                output = torch.from_numpy(output)
+            for dim, axis in enumerate(self.output_axes.get(name, ())):
+                if axis in input_sizes and output.shape[dim] > input_sizes[axis]:
+                    output = output.narrow(dim, 0, input_sizes[axis])
+            outputs[name] = output.contiguous()
+        return outputs
+
+    def _run(self, inputs: Dict[str, torch.Tensor],
+             session: Optional[Union[ort.InferenceSession, ORTSessionPool]] = None) -> Dict[str, Any]:
+        with self.checkout_session(session) as session:
+            if self.use_io_binding:
+                return self.run_with_io_binding(inputs, session)
+            prepared_inputs = self.prepare_inputs(inputs)
+            return self.run_inference(prepared_inputs, session)
+
     @abstractmethod
     def forward(self, input_ids, attention_mask, **kwargs) -> Dict[str, Any]:
         """
@@ -59,6 +351,33 @@ class BaseORTModel(ABC):
         return self.forward(*args, **kwargs)
     
 class SpanORTModel(BaseORTModel):
+    input_axes = {
+        'input_ids': ('batch', 'seq'),
+        'attention_mask': ('batch', 'seq'),
+        'words_mask': ('batch', 'seq'),
+        'text_lengths': ('batch', None),
+        'span_idx': ('batch', 'spans', None),
+        'span_mask': ('batch', 'spans'),
+    }
+    output_axes = {'logits': ('batch', 'words', None, 'labels')}
+
+    def _add_derived_sizes(self, sizes: Dict[str, int]) -> Dict[str, int]:
+        # spans are enumerated over words, and texts have at most as many words as tokens
+        if 'spans' in sizes:
+            sizes['words'] = sizes['spans'] // self.config.max_width
+        elif 'seq' in sizes:
+            sizes['spans'] = sizes['seq'] * self.config.max_width
+            sizes['words'] = sizes['seq']
+        return sizes
+
+    def get_output_shapes(self, inputs: Dict[str, torch.Tensor]) -> Optional[Dict[str, Tuple[int, ...]]]:
+        num_classes = self.get_num_classes(inputs)
+        if num_classes is None:
+            return None
+        max_width = self.config.max_width
+        batch_size, num_spans = inputs['span_idx'].shape[:2]
+        return {'logits': (batch_size, num_spans // max_width, max_width, num_classes)}
+
     def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, 
                 words_mask: torch.Tensor, text_lengths: torch.Tensor, 
                 span_idx: torch.Tensor, span_mask: torch.Tensor, **kwargs) -> Dict[str, Any]:
@@ -83,14 +402,29 @@ class SpanORTModel(BaseORTModel):
             'span_idx': span_idx,
             'span_mask': span_mask
         }
-        prepared_inputs = self.prepare_inputs(inputs)
-        inference_output = self.run_inference(prepared_inputs)
+        inference_output = self.compute_outputs(inputs)
         outputs = GLiNERModelOutput(
             logits=inference_output['logits']
         )
         return outputs
 
 class TokenORTModel(BaseORTModel):
+    input_axes = {
+        'input_ids': ('batch', 'seq'),
+        'attention_mask': ('batch', 'seq'),
+        'words_mask': ('batch', 'seq'),
+        'text_lengths': ('batch', None),
+    }
+    output_axes = {'logits': ('batch', None, 'labels', None)}
+
+    def get_output_shapes(self, inputs: Dict[str, torch.Tensor]) -> Optional[Dict[str, Tuple[int, ...]]]:
+        num_classes = self.get_num_classes(inputs)
+        if num_classes is None:
+            return None
+        batch_size = inputs['attention_mask'].shape[0]
+        seq_length = int(inputs['text_lengths'].max())
+        return {'logits': (batch_size, seq_length, num_classes, 3)}
+
     def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, 
                 words_mask: torch.Tensor, text_lengths: torch.Tensor, 
                 **kwargs) -> Dict[str, Any]:
@@ -111,9 +445,187 @@ class TokenORTModel(BaseORTModel):
             'words_mask': words_mask,
             'text_lengths': text_lengths,
         }
-        prepared_inputs = self.prepare_inputs(inputs)
-        inference_output = self.run_inference(prepared_inputs)
+        inference_output = self.compute_outputs(inputs)
+        outputs = GLiNERModelOutput(
+            logits=inference_output['logits']
+        )
+        return outputs
+
+class TextEncoderORTModel(BaseORTModel):
+    input_axes = {
+        'input_ids': ('batch', 'seq'),
+        'attention_mask': ('batch', 'seq'),
+    }
+    output_axes = {'token_embeddings': ('batch', 'seq', None)}
+
+    def get_output_shapes(self, inputs: Dict[str, torch.Tensor]) -> Optional[Dict[str, Tuple[int, ...]]]:
+        if self.config is None:
+            return None
+        batch_size, seq_length = inputs['input_ids'].shape
+        return {'token_embeddings': (batch_size, seq_length, self.config.hidden_size)}
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, **kwargs) -> torch.Tensor:
+        """
+        Encode the texts of a bi-encoder model.
+
+        Returns:
+            torch.Tensor: Token embeddings of shape (batch_size, seq_length, hidden_size).
+        """
+        inputs = {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+        }
+        return self.compute_outputs(inputs)['token_embeddings']
+
+class LabelsEncoderORTModel(BaseORTModel):
+    def get_output_shapes(self, inputs: Dict[str, torch.Tensor]) -> Optional[Dict[str, Tuple[int, ...]]]:
+        if self.config is None:
+            return None
+        num_labels = inputs['input_ids'].shape[0]
+        return {'labels_embeddings': (num_labels, self.config.hidden_size)}
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, **kwargs) -> torch.Tensor:
+        """
+        Encode the labels of a bi-encoder model.
+
+        Returns:
+            torch.Tensor: Labels embeddings of shape (num_labels, hidden_size).
+        """
+        inputs = {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+        }
+        return self.compute_outputs(inputs)['labels_embeddings']
+
+class BiEncoderORTModel(BaseORTModel):
+    """
+    Bi-encoder model split into three graphs: the text encoder, the labels encoder and
+    the scorer head, which takes the token and labels embeddings as inputs. Labels
+    embeddings can therefore be computed once and reused across requests.
+    """
+    def __init__(self, session: Union[ort.InferenceSession, ORTSessionPool],
+                 text_encoder: TextEncoderORTModel, labels_encoder: LabelsEncoderORTModel,
+                 config=None, **kwargs):
+        """
+        Args:
+            session (Union[ort.InferenceSession, ORTSessionPool]): Session(s) of the scorer graph.
+            text_encoder (TextEncoderORTModel): Text encoder graph.
+            labels_encoder (LabelsEncoderORTModel): Labels encoder graph.
+            config (Optional[GLiNERConfig]): Model config. Defaults to None.
+            **kwargs: Additional arguments of `BaseORTModel`.
+        """
+        self.text_encoder = text_encoder
+        self.labels_encoder = labels_encoder
+        super().__init__(session, config=config, **kwargs)
+
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        for encoder in (self.text_encoder, self.labels_encoder):
+            if encoder.config is None:
+                encoder.config = config
+
+    def encode(self, input_ids: torch.Tensor, attention_mask: torch.Tensor,
+               labels_embeddings: Optional[torch.Tensor] = None,
+               labels_input_ids: Optional[torch.Tensor] = None,
+               labels_attention_mask: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: Token embeddings of the texts and labels embeddings,
+                computed from the labels tokens if they were not provided.
+        """
+        if labels_embeddings is None:
+            if labels_input_ids is None:
+                raise ValueError("Either labels_embeddings or labels_input_ids must be provided.")
+            labels_embeddings = self.labels_encoder(labels_input_ids, labels_attention_mask)
+        token_embeddings = self.text_encoder(input_ids, attention_mask)
+        return token_embeddings, labels_embeddings
+
+class SpanBiEncoderORTModel(BiEncoderORTModel, SpanORTModel):
+    input_axes = {
+        **SpanORTModel.input_axes,
+        'token_embeddings': ('batch', 'seq', None),
+        'labels_embeddings': ('labels', None),
+    }
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor,
+                words_mask: torch.Tensor, text_lengths: torch.Tensor,
+                span_idx: torch.Tensor, span_mask: torch.Tensor,
+                labels_embeddings: Optional[torch.Tensor] = None,
+                labels_input_ids: Optional[torch.Tensor] = None,
+                labels_attention_mask: Optional[torch.Tensor] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Forward pass for span bi-encoder model using ONNX inference.
+
+        Args:
+            input_ids (torch.Tensor): Input IDs tensor.
+            attention_mask (torch.Tensor): Attention mask tensor.
+            span_idx (torch.Tensor): Span indices tensor.
+            span_mask (torch.Tensor): Span mask tensor.
+            labels_embeddings (Optional[torch.Tensor]): Pre-encoded labels. If None, the labels
+                tokens are encoded with the labels encoder graph.
+            **kwargs: Additional arguments.
+
+        Returns:
+            Dict[str, Any]: Model outputs.
+        """
+        token_embeddings, labels_embeddings = self.encode(input_ids, attention_mask, labels_embeddings,
+                                                          labels_input_ids, labels_attention_mask)
+        inputs = {
+            'token_embeddings': token_embeddings,
+            'attention_mask': attention_mask,
+            'words_mask': words_mask,
+            'text_lengths': text_lengths,
+            'labels_embeddings': labels_embeddings,
+            'span_idx': span_idx,
+            'span_mask': span_mask
+        }
+        inference_output = self.compute_outputs(inputs)
         outputs = GLiNERModelOutput(
             logits=inference_output['logits']
         )
-        return outputs
\ No newline at end of file
+        return outputs
+
+class TokenBiEncoderORTModel(BiEncoderORTModel, TokenORTModel):
+    input_axes = {
+        **TokenORTModel.input_axes,
+        'token_embeddings': ('batch', 'seq', None),
+        'labels_embeddings': ('labels', None),
+    }
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor,
+                words_mask: torch.Tensor, text_lengths: torch.Tensor,
+                labels_embeddings: Optional[torch.Tensor] = None,
+                labels_input_ids: Optional[torch.Tensor] = None,
+                labels_attention_mask: Optional[torch.Tensor] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Forward pass for token bi-encoder model using ONNX inference.
+
+        Args:
+            input_ids (torch.Tensor): Input IDs tensor.
+            attention_mask (torch.Tensor): Attention mask tensor.
+            labels_embeddings (Optional[torch.Tensor]): Pre-encoded labels. If None, the labels
+                tokens are encoded with the labels encoder graph.
+            **kwargs: Additional arguments.
+
+        Returns:
+            Dict[str, Any]: Model outputs.
+        """
+        token_embeddings, labels_embeddings = self.encode(input_ids, attention_mask, labels_embeddings,
+                                                          labels_input_ids, labels_attention_mask)
+        inputs = {
+            'token_embeddings': token_embeddings,
+            'attention_mask': attention_mask,
+            'words_mask': words_mask,
+            'text_lengths': text_lengths,
+            'labels_embeddings': labels_embeddings,
+        }
+        inference_output = self.compute_outputs(inputs)
+        outputs = GLiNERModelOutput(
+            logits=inference_output['logits']
+        )
+        return outputs
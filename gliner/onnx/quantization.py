@@ -0,0 +1,342 @@
+import json
+import os
+import tempfile
+import warnings
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from ..data_processing.collator import DataCollator
+from ..utils import is_module_available, MissedPackageException
+from .model import (LabelsEncoderORTModel, SpanBiEncoderORTModel, SpanORTModel, TextEncoderORTModel,
+                    TokenBiEncoderORTModel, TokenORTModel)
+
+# onnx is an optional dependency, also required by onnxruntime.quantization
+if not is_module_available('onnx'):
+    raise MissedPackageException("gliner.onnx.quantization requires the onnx package, "
+                                 "install it with `pip install gliner[onnx]`.")
+
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+CALIBRATION_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+
+QUANT_FORMATS = {
+    "qdq": QuantFormat.QDQ,
+    "qoperator": QuantFormat.QOperator,
+}
+
+GRAPHS = ("model", "text_encoder", "labels_encoder")
+
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    """
+    Load a dataset in the JSON format used for training: a list of examples with
+    `tokenized_text` and `ner` ([start, end, label] spans over the words) fields.
+    Examples without words or entities are dropped.
+    """
+    with open(path, "r") as f:
+        return [item for item in json.load(f) if len(item["tokenized_text"]) and len(item["ner"])]
+
+
+def get_graph_inputs(model_path: str) -> Dict[str, np.dtype]:
+    """
+    Returns:
+        Dict[str, np.dtype]: Numpy dtype of each input of the ONNX graph.
+    """
+    model = onnx.load(model_path, load_external_data=False)
+    initializers = {initializer.name for initializer in model.graph.initializer}
+    return {
+        graph_input.name: onnx.helper.tensor_dtype_to_np_dtype(graph_input.type.tensor_type.elem_type)
+        for graph_input in model.graph.input if graph_input.name not in initializers
+    }
+
+
+class GLiNERCalibrationDataReader(CalibrationDataReader):
+    """
+    Feed batches of a dataset to an ONNX graph of a GLiNER model to collect the ranges of its activations.
+
+    Batches are prepared by the data processor of the PyTorch model. For bi-encoder models, the inputs
+    of the scorer graph (token and labels embeddings) are computed with the PyTorch encoders.
+    """
+
+    def __init__(
+        self,
+        gliner_model,
+        data: List[Dict[str, Any]],
+        graph: str = "model",
+        input_dtypes: Optional[Dict[str, np.dtype]] = None,
+        batch_size: int = 8,
+        entity_types: Optional[List[str]] = None,
+    ):
+        """
+        Args:
+            gliner_model (GLiNER): PyTorch model the ONNX graph was exported from.
+            data (List[Dict[str, Any]]): Calibration examples in the training data format.
+            graph (str): Graph to calibrate: 'model', 'text_encoder' or 'labels_encoder'. Defaults to 'model'.
+            input_dtypes (Optional[Dict[str, np.dtype]]): Inputs of the graph (see `get_graph_inputs`). If set,
+                only these inputs are fed, cast to their dtype. Defaults to None.
+            batch_size (int): Number of examples per calibration batch. Defaults to 8.
+            entity_types (Optional[List[str]]): Labels used for all examples. Defaults to None (labels of each batch).
+        """
+        if graph not in GRAPHS:
+            raise ValueError(f"Unknown graph: {graph}. Expected one of {list(GRAPHS)}.")
+        if graph != "model" and gliner_model.config.labels_encoder is None:
+            raise ValueError(f"The {graph} graph is exported only for bi-encoder models.")
+        self.gliner_model = gliner_model
+        self.data = data
+        self.graph = graph
+        self.input_dtypes = input_dtypes
+        self.batch_size = batch_size
+        self.collator = DataCollator(
+            gliner_model.config,
+            data_processor=gliner_model.data_processor,
+            prepare_labels=False,
+            entity_types=entity_types,
+        )
+        self._iterator = None
+
+    def prepare_inputs(self, batch: Dict[str, Any]) -> Dict[str, torch.Tensor]:
+        if self.graph == "text_encoder":
+            return {"input_ids": batch["input_ids"], "attention_mask": batch["attention_mask"]}
+        if self.graph == "labels_encoder":
+            return {"input_ids": batch["labels_input_ids"], "attention_mask": batch["labels_attention_mask"]}
+        if self.gliner_model.config.labels_encoder is None:
+            return batch
+
+        encoder = self.gliner_model.model.token_rep_layer
+        device = self.gliner_model.device
+        with torch.no_grad():
+            token_embeddings = encoder.encode_text(batch["input_ids"].to(device),
+                                                   batch["attention_mask"].to(device))
+            labels_embeddings = encoder.encode_labels(batch["labels_input_ids"].to(device),
+                                                      batch["labels_attention_mask"].to(device))
+        inputs = dict(batch)
+        inputs.update(token_embeddings=token_embeddings, labels_embeddings=labels_embeddings)
+        return inputs
+
+    def _iter_inputs(self) -> Iterator[Dict[str, np.ndarray]]:
+        for start in range(0, len(self.data), self.batch_size):
+            batch = self.collator(self.data[start:start + self.batch_size])
+            inputs = self.prepare_inputs(batch)
+            if self.input_dtypes is None:
+                yield {name: tensor.cpu().numpy() for name, tensor in inputs.items()
+                                                if isinstance(tensor, torch.Tensor)}
+            else:
+                yield {name: inputs[name].cpu().numpy().astype(dtype) for name, dtype in self.input_dtypes.items()}
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._iterator is None:
+            self._iterator = self._iter_inputs()
+        return next(self._iterator, None)
+
+    def rewind(self) -> None:
+        self._iterator = None
+
+
+def get_nodes_to_exclude(
+    model_path: str,
+    modules_to_exclude: Optional[Sequence[str]] = None,
+    op_types_to_exclude: Optional[Sequence[str]] = None,
+) -> List[str]:
+    """
+    Find the nodes of an exported graph to keep in full precision.
+
+    Node names of graphs exported by `torch.onnx.export` follow the module hierarchy, e.g.
+    '/core/out_project/out_project.0/Gemm'.
+
+    Args:
+        model_path (str): Path to the ONNX model.
+        modules_to_exclude (Optional[Sequence[str]]): Names of PyTorch modules whose nodes are excluded, as they
+            appear in the node names (e.g. 'out_project' and 'prompt_rep_layer' for the span scorer, 'rnn').
+            Nested modules are separated by dots.
+        op_types_to_exclude (Optional[Sequence[str]]): Operator types (e.g. 'MatMul', 'Gemm') that are excluded.
+
+    Returns:
+        List[str]: Names of the excluded nodes.
+    """
+    modules_to_exclude = [f"/{module.replace('.', '/')}/" for module in modules_to_exclude or []]
+    op_types_to_exclude = set(op_types_to_exclude or [])
+    model = onnx.load(model_path, load_external_data=False)
+    return [
+        node.name for node in model.graph.node
+        if node.op_type in op_types_to_exclude or any(module in node.name for module in modules_to_exclude)
+    ]
+
+
+def quantize_model(
+    model_path: str,
+    quantized_model_path: str,
+    calibration_data_reader: CalibrationDataReader,
+    calibration_method: str = "minmax",
+    quant_format: str = "qdq",
+    per_channel: bool = False,
+    reduce_range: bool = False,
+    activation_type: QuantType = QuantType.QUInt8,
+    weight_type: QuantType = QuantType.QInt8,
+    op_types_to_quantize: Optional[Sequence[str]] = None,
+    op_types_to_exclude: Optional[Sequence[str]] = None,
+    modules_to_exclude: Optional[Sequence[str]] = None,
+    preprocess: bool = True,
+    extra_options: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Statically quantize an ONNX graph to INT8, with activation ranges calibrated on real inputs.
+
+    Args:
+        model_path (str): Path to the fp32 ONNX model.
+        quantized_model_path (str): Path where the quantized model is saved.
+        calibration_data_reader (CalibrationDataReader): Inputs used for calibration,
+            e.g. a `GLiNERCalibrationDataReader`.
+        calibration_method (str): One of 'minmax', 'entropy' or 'percentile'. Defaults to 'minmax'.
+        quant_format (str): 'qdq' (QuantizeLinear/DequantizeLinear pairs) or 'qoperator'
+            (quantized operators). Defaults to 'qdq'.
+        per_channel (bool): Whether to quantize weights per channel. Defaults to False.
+        reduce_range (bool): Whether to quantize weights to 7 bits, which can be more accurate on
+            CPUs without VNNI. Defaults to False.
+        activation_type (QuantType): Type of the quantized activations. Defaults to QuantType.QUInt8.
+        weight_type (QuantType): Type of the quantized weights. Defaults to QuantType.QInt8.
+        op_types_to_quantize (Optional[Sequence[str]]): Operator types to quantize. Defaults to None (all supported).
+        op_types_to_exclude (Optional[Sequence[str]]): Operator types kept in fp32.
+        modules_to_exclude (Optional[Sequence[str]]): PyTorch modules kept in fp32 (see `get_nodes_to_exclude`).
+        preprocess (bool): Whether to run shape inference and graph optimizations before quantization,
+            as recommended by ONNX Runtime. Defaults to True.
+        extra_options (Optional[Dict[str, Any]]): Extra options of `onnxruntime.quantization.quantize_static`.
+
+    Returns:
+        str: Path of the quantized model.
+    """
+    if calibration_method not in CALIBRATION_METHODS:
+        raise ValueError(f"Unknown calibration method: {calibration_method}. "
+                         f"Expected one of {list(CALIBRATION_METHODS)}.")
+    if quant_format not in QUANT_FORMATS:
+        raise ValueError(f"Unknown quantization format: {quant_format}. Expected one of {list(QUANT_FORMATS)}.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if preprocess:
+            preprocessed_path = os.path.join(tmp_dir, "preprocessed.onnx")
+            # symbolic shape inference fails on data-dependent shapes (e.g. the number of words)
+            for skip_symbolic_shape in (False, True):
+                try:
+                    quant_pre_process(model_path, preprocessed_path, skip_symbolic_shape=skip_symbolic_shape)
+                    model_path = preprocessed_path
+                    break
+                except Exception as error:
+                    preprocess_error = error
+            else:
+                warnings.warn(f"Skipping the preprocessing of {model_path} before quantization: {preprocess_error}")
+
+        nodes_to_exclude = get_nodes_to_exclude(model_path, modules_to_exclude, op_types_to_exclude)
+        quantize_static(
+            model_path,
+            quantized_model_path,
+            calibration_data_reader,
+            quant_format=QUANT_FORMATS[quant_format],
+            op_types_to_quantize=list(op_types_to_quantize) if op_types_to_quantize else None,
+            per_channel=per_channel,
+            reduce_range=reduce_range,
+            activation_type=activation_type,
+            weight_type=weight_type,
+            nodes_to_exclude=nodes_to_exclude,
+            calibrate_method=CALIBRATION_METHODS[calibration_method],
+            extra_options=extra_options,
+        )
+    return quantized_model_path
+
+
+def load_onnx_gliner(
+    gliner_model,
+    model_path: str,
+    text_encoder_path: Optional[str] = None,
+    labels_encoder_path: Optional[str] = None,
+    providers: Optional[List[str]] = None,
+):
+    """
+    Wrap ONNX graphs exported from a GLiNER model, sharing its config and data processor.
+
+    Args:
+        gliner_model (GLiNER): PyTorch model the graphs were exported from.
+        model_path (str): Path to the model graph (the scorer graph for bi-encoder models).
+        text_encoder_path (Optional[str]): Path to the text encoder graph of bi-encoder models.
+        labels_encoder_path (Optional[str]): Path to the labels encoder graph of bi-encoder models.
+        providers (Optional[List[str]]): Execution providers. Defaults to CPUExecutionProvider.
+
+    Returns:
+        GLiNER: Model running the ONNX graphs.
+    """
+    config = gliner_model.config
+    providers = providers or ["CPUExecutionProvider"]
+
+    def create_session(path):
+        return ort.InferenceSession(path, providers=providers)
+
+    if config.labels_encoder is not None:
+        if text_encoder_path is None or labels_encoder_path is None:
+            raise ValueError("The text and labels encoder graphs are required for bi-encoder models.")
+        text_encoder = TextEncoderORTModel(create_session(text_encoder_path), config=config)
+        labels_encoder = LabelsEncoderORTModel(create_session(labels_encoder_path), config=config)
+        model_class = TokenBiEncoderORTModel if config.span_mode == "token_level" else SpanBiEncoderORTModel
+        model = model_class(create_session(model_path), text_encoder, labels_encoder, config=config)
+    elif config.span_mode == "token_level":
+        model = TokenORTModel(create_session(model_path), config=config)
+    else:
+        model = SpanORTModel(create_session(model_path), config=config)
+    return type(gliner_model)(config, model=model, data_processor=gliner_model.data_processor)
+
+
+def check_quantization_accuracy(
+    reference_model,
+    quantized_model,
+    data: List[Dict[str, Any]],
+    max_f1_drop: float = 0.01,
+    strict: bool = True,
+    **evaluate_kwargs,
+) -> Dict[str, Any]:
+    """
+    Compare the F1 score of a quantized model with the one of its full precision reference.
+
+    Args:
+        reference_model (GLiNER): Full precision model.
+        quantized_model (GLiNER): Quantized model.
+        data (List[Dict[str, Any]]): Evaluation examples in the training data format.
+        max_f1_drop (float): Maximum allowed absolute drop of F1. Defaults to 0.01.
+        strict (bool): Whether to raise an error, rather than warn, when the drop exceeds the tolerance.
+            Defaults to True.
+        **evaluate_kwargs: Keyword arguments of `GLiNER.evaluate`. Unless `entity_types` is set, both models
+            are evaluated on all the labels of the data, since labels sampled per batch vary between runs.
+
+    Returns:
+        Dict[str, Any]: F1 of both models, the drop and whether the quantized model passed the check.
+
+    Raises:
+        ValueError: If `strict` and the F1 drop exceeds `max_f1_drop`.
+    """
+    if evaluate_kwargs.get("entity_types") is None:
+        evaluate_kwargs["entity_types"] = sorted({entity[-1] for item in data for entity in item["ner"]})
+    with torch.no_grad():
+        _, reference_f1 = reference_model.evaluate(data, **evaluate_kwargs)
+        _, quantized_f1 = quantized_model.evaluate(data, **evaluate_kwargs)
+    report = {
+        "reference_f1": float(reference_f1),
+        "quantized_f1": float(quantized_f1),
+        "f1_drop": float(reference_f1 - quantized_f1),
+        "max_f1_drop": max_f1_drop,
+    }
+    report["passed"] = report["f1_drop"] <= max_f1_drop
+
+    if not report["passed"]:
+        message = (f"F1 of the quantized model dropped by {report['f1_drop']:.4f} "
+                   f"({report['reference_f1']:.4f} -> {report['quantized_f1']:.4f}), "
+                   f"more than the tolerance of {max_f1_drop}.")
+        if strict:
+            raise ValueError(message)
+        warnings.warn(message)
+    return report
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import queue
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import onnxruntime as ort
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def create_session_options(
+    intra_op_num_threads: Optional[int] = None,
+    inter_op_num_threads: Optional[int] = None,
+    graph_optimization_level: str = "all",
+    execution_mode: str = "sequential",
+    enable_cpu_mem_arena: bool = True,
+    enable_mem_pattern: bool = True,
+) -> ort.SessionOptions:
+    """
+    Create ONNX Runtime session options.
+
+    Args:
+        intra_op_num_threads (Optional[int]): Threads used to parallelize an operator. Defaults to None (ORT default).
+        inter_op_num_threads (Optional[int]): Threads used to run operators in parallel in the 'parallel'
+            execution mode. Defaults to None (ORT default).
+        graph_optimization_level (str): One of 'disable', 'basic', 'extended' or 'all'. Defaults to 'all'.
+        execution_mode (str): Either 'sequential' or 'parallel'. Defaults to 'sequential'.
+        enable_cpu_mem_arena (bool): Whether to use the CPU memory arena. Defaults to True.
+        enable_mem_pattern (bool): Whether to preallocate memory based on the shapes seen. Defaults to True.
+
+    Returns:
+        ort.SessionOptions: The session options.
+    """
+    if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level: {graph_optimization_level}. "
+                         f"Expected one of {list(GRAPH_OPTIMIZATION_LEVELS)}.")
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {execution_mode}. Expected one of {list(EXECUTION_MODES)}.")
+
+    session_options = ort.SessionOptions()
+    if intra_op_num_threads is not None:
+        session_options.intra_op_num_threads = intra_op_num_threads
+    if inter_op_num_threads is not None:
+        session_options.inter_op_num_threads = inter_op_num_threads
+    session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+    session_options.execution_mode = EXECUTION_MODES[execution_mode]
+    session_options.enable_cpu_mem_arena = enable_cpu_mem_arena
+    session_options.enable_mem_pattern = enable_mem_pattern
+    return session_options
+
+
+class ORTSessionPool:
+    """
+    Pool of ONNX Runtime sessions of the same model for concurrent inference.
+
+    Each caller checks out its own session, so concurrent requests run in parallel instead
+    of contending for the thread pool of a single session.
+    """
+
+    def __init__(
+        self,
+        model_path: Union[str, Path],
+        num_sessions: int = 1,
+        providers: Optional[List[str]] = None,
+        session_options: Optional[ort.SessionOptions] = None,
+        optimized_model_filepath: Optional[Union[str, Path]] = None,
+        **session_options_kwargs,
+    ):
+        """
+        Args:
+            model_path (Union[str, Path]): Path to the ONNX model.
+            num_sessions (int): Number of sessions in the pool. Defaults to 1.
+            providers (Optional[List[str]]): Execution providers. Defaults to CPUExecutionProvider.
+            session_options (Optional[ort.SessionOptions]): Options shared by all sessions. If None, they are
+                created with `create_session_options(**session_options_kwargs)` and, unless set explicitly,
+                the cores of the host are split evenly between the sessions.
+            optimized_model_filepath (Optional[Union[str, Path]]): If set, the graph optimized by the first
+                session is saved to this path and loaded by the next sessions. The saved graph is reused
+                across processes as long as the source model (by content hash), the providers, the graph
+                optimization level and the ONNX Runtime version are the same, which are recorded in a
+                JSON file next to it.
+            **session_options_kwargs: Keyword arguments of `create_session_options`.
+        """
+        if num_sessions < 1:
+            raise ValueError(f"num_sessions must be a positive integer, got {num_sessions}.")
+        if session_options is not None and session_options_kwargs:
+            raise ValueError("Pass either session_options or keyword arguments to create them, not both.")
+
+        self.model_path = str(model_path)
+        self.num_sessions = num_sessions
+        self.providers = providers or ["CPUExecutionProvider"]
+
+        if session_options is None:
+            if num_sessions > 1 and session_options_kwargs.get("intra_op_num_threads") is None:
+                session_options_kwargs["intra_op_num_threads"] = max(1, (os.cpu_count() or 1) // num_sessions)
+            session_options = create_session_options(**session_options_kwargs)
+        self.session_options = session_options
+
+        self.optimized_model_filepath = str(optimized_model_filepath) if optimized_model_filepath else None
+
+        self.sessions = [self._create_session(idx) for idx in range(num_sessions)]
+        self._available = queue.Queue()
+        for session in self.sessions:
+            self._available.put(session)
+
+    @property
+    def optimization_key_filepath(self) -> Optional[str]:
+        if self.optimized_model_filepath is None:
+            return None
+        return self.optimized_model_filepath + ".json"
+
+    def _optimization_key(self) -> Dict:
+        """
+        What the saved optimized graph depends on: the content of the source model and the settings
+        of the optimization.
+        """
+        hasher = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+        return {
+            "model_sha256": hasher.hexdigest(),
+            # providers may come with their options, as (name, options) pairs
+            "providers": json.loads(json.dumps(self.providers, default=str)),
+            "graph_optimization_level": str(self.session_options.graph_optimization_level),
+            "onnxruntime_version": ort.__version__,
+        }
+
+    def _optimized_model_is_stale(self, optimization_key: Dict) -> bool:
+        if not os.path.exists(self.optimized_model_filepath) or not os.path.exists(self.optimization_key_filepath):
+            return True
+        try:
+            with open(self.optimization_key_filepath, "r") as f:
+                return json.load(f) != optimization_key
+        except ValueError:
+            return True
+
+    def _create_session(self, idx: int) -> ort.InferenceSession:
+        if self.optimized_model_filepath is None:
+            return ort.InferenceSession(self.model_path, self.session_options, providers=self.providers)
+
+        options = self.session_options
+        level = options.graph_optimization_level
+        optimization_key = self._optimization_key() if idx == 0 else None
+        if idx == 0 and self._optimized_model_is_stale(optimization_key):
+            if os.path.exists(self.optimization_key_filepath):
+                os.remove(self.optimization_key_filepath)
+            options.optimized_model_filepath = self.optimized_model_filepath
+            try:
+                session = ort.InferenceSession(self.model_path, options, providers=self.providers)
+            finally:
+                options.optimized_model_filepath = ""
+            with open(self.optimization_key_filepath, "w") as f:
+                json.dump(optimization_key, f)
+            return session
+        # the saved graph is already optimized
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return ort.InferenceSession(self.optimized_model_filepath, options, providers=self.providers)
+        finally:
+            options.graph_optimization_level = level
+
+    @property
+    def session(self) -> ort.InferenceSession:
+        """Session used to read the model metadata (inputs, outputs, providers)."""
+        return self.sessions[0]
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[ort.InferenceSession]:
+        """
+        Borrow a session from the pool for the duration of the context, blocking until one is free.
+
+        Args:
+            timeout (Optional[float]): Maximum number of seconds to wait for a session. Defaults to None (no limit).
+
+        Raises:
+            TimeoutError: If no session became available in time.
+        """
+        try:
+            session = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No ONNX Runtime session became available within {timeout} seconds.")
+        try:
+            yield session
+        finally:
+            self._available.put(session)
+
+    def __len__(self) -> int:
+        return self.num_sessions
@@ -1,12 +1,24 @@
 import os
+import json
+import inspect
 import argparse
+import itertools
+import random
 import numpy as np
 
 from gliner import GLiNER
+from gliner.onnx.model import (SpanORTModel, TokenORTModel, TextEncoderORTModel,
+                               SpanBiEncoderORTModel, TokenBiEncoderORTModel, pad_to_bucket)
+from gliner.onnx.quantization import (GLiNERCalibrationDataReader, check_quantization_accuracy,
+                                      get_graph_inputs, load_dataset, load_onnx_gliner, quantize_model)
 
 import torch
 from onnxruntime.quantization import quantize_dynamic, QuantType
 
+# recent versions of torch export with the dynamo exporter by default, which requires onnxscript.
+# Wrappers are exported in eval mode: the exporter restores their mode, and with it the mode of the model.
+EXPORT_KWARGS = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
 class GLiNERWrapper(torch.nn.Module):
     def __init__(self, core):
         super().__init__()
@@ -22,27 +34,131 @@ class GLiNERWrapper(torch.nn.Module):
             span_idx=span_idx, 
             span_mask = span_mask
         ).logits                              
-    
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--model_path', type=str, default= "logs/model_12000")
-    parser.add_argument('--save_path', type=str, default = 'model/')
-    parser.add_argument('--quantize', type=bool, default = True)
-    args = parser.parse_args()
-    
-    if not os.path.exists(args.save_path):
-        os.makedirs(args.save_path)
 
-    onnx_save_path = os.path.join(args.save_path, "model.onnx")
+class TextEncoderWrapper(torch.nn.Module):
+    def __init__(self, core):
+        super().__init__()
+        self.encoder = core.model.token_rep_layer
 
-    print("Loading a model...")
-    gliner_model = GLiNER.from_pretrained(args.model_path, load_tokenizer=True)
+    def forward(self, input_ids, attention_mask):
+        return self.encoder.encode_text(input_ids, attention_mask)
 
-    text = "ONNX is an open-source format designed to enable the interoperability of AI models across various frameworks and tools."
-    labels = ['format', 'model', 'tool', 'cat']
+class LabelsEncoderWrapper(torch.nn.Module):
+    def __init__(self, core):
+        super().__init__()
+        self.encoder = core.model.token_rep_layer
 
-    inputs, _ = gliner_model.prepare_model_inputs([text], labels)
+    def forward(self, input_ids, attention_mask):
+        return self.encoder.encode_labels(input_ids, attention_mask)
+
+class BiEncoderScorerWrapper(torch.nn.Module):
+    def __init__(self, core):
+        super().__init__()
+        self.core = core.model
+
+    def forward(self, token_embeddings, attention_mask, words_mask, text_lengths,
+                labels_embeddings, span_idx = None, span_mask = None):
+        return self.core(
+            attention_mask=attention_mask,
+            token_embeddings=token_embeddings,
+            labels_embeddings=labels_embeddings,
+            words_mask=words_mask,
+            text_lengths=text_lengths,
+            span_idx=span_idx,
+            span_mask=span_mask
+        ).logits
+
+def export_bi_encoder(gliner_model, inputs, save_path):
+    """
+    Export a bi-encoder model as three graphs: the text encoder, the labels encoder and the scorer,
+    which takes the token and labels embeddings as inputs, so that labels embeddings can be precomputed.
+
+    Returns:
+        List[str]: Paths of the exported graphs.
+    """
+    text_encoder_path = os.path.join(save_path, "text_encoder.onnx")
+    labels_encoder_path = os.path.join(save_path, "labels_encoder.onnx")
+    scorer_path = os.path.join(save_path, "model.onnx")
+
+    print('Converting the text encoder...')
+    torch.onnx.export(
+        TextEncoderWrapper(gliner_model).eval(),
+        (inputs['input_ids'], inputs['attention_mask']),
+        f=text_encoder_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=["token_embeddings"],
+        dynamic_axes={
+            "input_ids": {0: "batch_size", 1: "sequence_length"},
+            "attention_mask": {0: "batch_size", 1: "sequence_length"},
+            "token_embeddings": {0: "batch_size", 1: "sequence_length"},
+        },
+        opset_version=19,
+        **EXPORT_KWARGS,
+    )
+
+    print('Converting the labels encoder...')
+    torch.onnx.export(
+        LabelsEncoderWrapper(gliner_model).eval(),
+        (inputs['labels_input_ids'], inputs['labels_attention_mask']),
+        f=labels_encoder_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=["labels_embeddings"],
+        dynamic_axes={
+            "input_ids": {0: "num_labels", 1: "sequence_length"},
+            "attention_mask": {0: "num_labels", 1: "sequence_length"},
+            "labels_embeddings": {0: "num_labels"},
+        },
+        opset_version=19,
+        **EXPORT_KWARGS,
+    )
+
+    with torch.no_grad():
+        token_embeddings = gliner_model.model.token_rep_layer.encode_text(inputs['input_ids'],
+                                                                          inputs['attention_mask'])
+        labels_embeddings = gliner_model.model.token_rep_layer.encode_labels(inputs['labels_input_ids'],
+                                                                             inputs['labels_attention_mask'])
+    all_inputs = (token_embeddings, inputs['attention_mask'], inputs['words_mask'],
+                  inputs['text_lengths'], labels_embeddings)
+    input_names = ['token_embeddings', 'attention_mask', 'words_mask', 'text_lengths', 'labels_embeddings']
+    dynamic_axes = {
+        "token_embeddings": {0: "batch_size", 1: "sequence_length"},
+        "attention_mask": {0: "batch_size", 1: "sequence_length"},
+        "words_mask": {0: "batch_size", 1: "sequence_length"},
+        "text_lengths": {0: "batch_size", 1: "value"},
+        "labels_embeddings": {0: "num_classes"},
+    }
+    if gliner_model.config.span_mode == 'token_level':
+        dynamic_axes["logits"] = {0: "batch_size", 1: "sequence_length", 2: "num_classes"}
+    else:
+        all_inputs = all_inputs + (inputs['span_idx'], inputs['span_mask'])
+        input_names = input_names + ['span_idx', 'span_mask']
+        dynamic_axes.update({
+            "span_idx": {0: "batch_size", 1: "num_spans", 2: "idx"},
+            "span_mask": {0: "batch_size", 1: "num_spans"},
+            "logits": {0: "batch_size", 1: "sequence_length", 2: "num_spans", 3: "num_classes"},
+        })
+
+    print('Converting the scorer...')
+    torch.onnx.export(
+        BiEncoderScorerWrapper(gliner_model).eval(),
+        all_inputs,
+        f=scorer_path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=19,
+        **EXPORT_KWARGS,
+    )
+    return [scorer_path, text_encoder_path, labels_encoder_path]
 
+def export_uni_encoder(gliner_model, inputs, save_path):
+    """
+    Export a uni-encoder model as a single graph.
+
+    Returns:
+        List[str]: Path of the exported graph.
+    """
+    onnx_save_path = os.path.join(save_path, "model.onnx")
     if gliner_model.config.span_mode == 'token_level':
         all_inputs =  (inputs['input_ids'], inputs['attention_mask'], 
                         inputs['words_mask'], inputs['text_lengths'])
@@ -69,7 +185,7 @@ if __name__ == "__main__":
             "logits": {0: "batch_size", 1: "sequence_length", 2: "num_spans", 3: "num_classes"},
         }
     print('Converting the model...')
-    model_wrapper = GLiNERWrapper(gliner_model)
+    model_wrapper = GLiNERWrapper(gliner_model).eval()
     torch.onnx.export(
         model_wrapper,
         all_inputs,
@@ -78,15 +194,257 @@ if __name__ == "__main__":
         output_names=["logits"],
         dynamic_axes=dynamic_axes,
         opset_version=19,
+        **EXPORT_KWARGS,
+    )
+    return [onnx_save_path]
+
+def export_static_graphs(model_wrapper, example_inputs, input_axes, output_names, buckets, save_path):
+    """
+    Export a graph once with symbolic axes named after the shape buckets axes, then save a copy
+    with the axes fixed to the sizes of each bucket. Shapes that depend on the input values
+    (e.g. the number of words) stay symbolic.
+
+    The example inputs are padded to a bucket before tracing, so that the traced graph handles padding.
+    """
+    import onnx
+    from onnxruntime.tools.onnx_model_utils import make_dim_param_fixed, fix_output_shapes
+
+    padded_inputs = tuple(pad_to_bucket(tensor, input_axes.get(name, ()), buckets[0][0])
+                                                for name, tensor in example_inputs.items())
+    dynamic_axes = {name: {dim: axis for dim, axis in enumerate(input_axes.get(name, ())) if axis is not None}
+                                                for name in example_inputs}
+    traced_path = os.path.join(save_path, "_traced.onnx")
+    torch.onnx.export(
+        model_wrapper,
+        padded_inputs,
+        f=traced_path,
+        input_names=list(example_inputs),
+        output_names=output_names,
+        dynamic_axes=dynamic_axes,
+        opset_version=19,
+        **EXPORT_KWARGS,
     )
+    for sizes, file_name in buckets:
+        model = onnx.load(traced_path)
+        for axis, size in sizes.items():
+            make_dim_param_fixed(model.graph, axis, size)
+        fix_output_shapes(model)
+        onnx.save(model, os.path.join(save_path, file_name))
+    os.remove(traced_path)
+
+def export_shape_buckets(gliner_model, inputs, save_path, batch_buckets, seq_buckets, labels_buckets=None):
+    """
+    Export static-shape graphs for each combination of batch size, sequence length and, for bi-encoder
+    models, number of labels. At inference, batches are padded to the smallest bucket they fit into.
+    Labels can't be padded for uni-encoder models since they are part of the sequence.
+
+    Returns:
+        Dict[str, List[Dict]]: Buckets of each dynamic graph, also saved to `shape_buckets.json`.
+    """
+    config = gliner_model.config
+    seq_length = inputs['input_ids'].shape[1]
+    skipped = [seq for seq in seq_buckets if seq <= seq_length]
+    if skipped:
+        print(f'Skipping sequence buckets {skipped}, not longer than the example text ({seq_length} tokens).')
+    seq_buckets = [seq for seq in seq_buckets if seq > seq_length]
+    if not seq_buckets:
+        raise ValueError(f"No sequence bucket is longer than the example text ({seq_length} tokens), "
+                         f"set --seq_buckets to lengths above {seq_length}.")
+
+    graphs = []
+    if config.labels_encoder is None:
+        ort_model_class = TokenORTModel if config.span_mode == 'token_level' else SpanORTModel
+        input_names = list(ort_model_class.input_axes)
+        example_inputs = {name: inputs[name] for name in input_names}
+        graphs.append(("model", GLiNERWrapper(gliner_model).eval(), example_inputs,
+                       ort_model_class.input_axes, ["logits"], [None]))
+    else:
+        with torch.no_grad():
+            token_embeddings = gliner_model.model.token_rep_layer.encode_text(inputs['input_ids'],
+                                                                              inputs['attention_mask'])
+            labels_embeddings = gliner_model.model.token_rep_layer.encode_labels(inputs['labels_input_ids'],
+                                                                                 inputs['labels_attention_mask'])
+        text_inputs = {name: inputs[name] for name in TextEncoderORTModel.input_axes}
+        graphs.append(("text_encoder", TextEncoderWrapper(gliner_model).eval(), text_inputs,
+                       TextEncoderORTModel.input_axes, ["token_embeddings"], [None]))
+
+        ort_model_class = TokenBiEncoderORTModel if config.span_mode == 'token_level' else SpanBiEncoderORTModel
+        scorer_inputs = {'token_embeddings': token_embeddings, 'attention_mask': inputs['attention_mask'],
+                         'words_mask': inputs['words_mask'], 'text_lengths': inputs['text_lengths'],
+                         'labels_embeddings': labels_embeddings}
+        if config.span_mode != 'token_level':
+            scorer_inputs.update(span_idx=inputs['span_idx'], span_mask=inputs['span_mask'])
+        # cross-attention between the text and the labels would see padded labels
+        if labels_buckets and not config.post_fusion_schema:
+            num_labels = labels_embeddings.shape[0]
+            labels_buckets = [num for num in labels_buckets if num >= num_labels]
+            if not labels_buckets:
+                raise ValueError(f"No labels bucket fits the {num_labels} labels of the example, "
+                                 f"set --labels_buckets to at least {num_labels} labels.")
+        else:
+            labels_buckets = [None]
+        graphs.append(("model", BiEncoderScorerWrapper(gliner_model).eval(), scorer_inputs,
+                       ort_model_class.input_axes, ["logits"], labels_buckets))
+
+    manifest = {}
+    for name, model_wrapper, example_inputs, input_axes, output_names, graph_labels_buckets in graphs:
+        manifest[f"{name}.onnx"] = []
+        buckets = []
+        for batch, seq, num_labels in itertools.product(batch_buckets, seq_buckets, graph_labels_buckets):
+            sizes = {"batch": batch, "seq": seq}
+            file_name = f"{name}_b{batch}_s{seq}"
+            if num_labels is not None:
+                sizes["labels"] = num_labels
+                file_name += f"_c{num_labels}"
+            file_name += ".onnx"
+            padded_sizes = dict(sizes)
+            if config.span_mode != 'token_level':
+                padded_sizes["spans"] = seq * config.max_width
+            buckets.append((padded_sizes, file_name))
+            manifest[f"{name}.onnx"].append({"sizes": sizes, "file": file_name})
+        print(f'Converting {name} for the shape buckets {[sizes for sizes, _ in buckets]}...')
+        export_static_graphs(model_wrapper, example_inputs, input_axes, output_names, buckets, save_path)
+
+    with open(os.path.join(save_path, "shape_buckets.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def quantize_static_graphs(gliner_model, graph_paths, calibration_data, eval_data, args):
+    """
+    Statically quantize the exported graphs with activation ranges calibrated on `calibration_data`,
+    then compare the F1 of the quantized and fp32 ONNX models on `eval_data`.
+
+    Quantized graphs beyond the F1 tolerance are deleted, unless `args.keep_failed` is set,
+    in which case they are kept and flagged in `quantization_report.json`.
+
+    Args:
+        graph_paths (Dict[str, str]): Path of each exported graph ('model', 'text_encoder', 'labels_encoder').
+
+    Returns:
+        Dict[str, Any]: The accuracy report.
+    """
+    quantized_paths = {}
+    for graph, path in graph_paths.items():
+        print(f'Calibrating and quantizing {os.path.basename(path)}...')
+        calibration_data_reader = GLiNERCalibrationDataReader(gliner_model, calibration_data, graph=graph,
+                                                              input_dtypes=get_graph_inputs(path),
+                                                              batch_size=args.calibration_batch_size)
+        quantized_paths[graph] = quantize_model(
+            path,
+            path.replace(".onnx", "_quantized.onnx"),
+            calibration_data_reader,
+            calibration_method=args.calibration_method,
+            per_channel=args.per_channel,
+            op_types_to_quantize=args.quantize_op_types,
+            op_types_to_exclude=args.exclude_op_types,
+            modules_to_exclude=args.exclude_modules,
+        )
+
+    print('Comparing the F1 of the quantized and fp32 models...')
+    reference_model = load_onnx_gliner(gliner_model, graph_paths['model'],
+                                       graph_paths.get('text_encoder'), graph_paths.get('labels_encoder'))
+    quantized_model = load_onnx_gliner(gliner_model, quantized_paths['model'],
+                                       quantized_paths.get('text_encoder'), quantized_paths.get('labels_encoder'))
+    report = check_quantization_accuracy(reference_model, quantized_model, eval_data,
+                                         max_f1_drop=args.max_f1_drop, strict=False,
+                                         threshold=args.eval_threshold)
+    report['files'] = [os.path.basename(path) for path in quantized_paths.values()]
+    print(f"F1: {report['reference_f1']:.4f} (fp32) -> {report['quantized_f1']:.4f} (int8)")
+
+    if not report['passed'] and not args.keep_failed:
+        print('Removing the quantized models, rerun with --keep_failed to keep them.')
+        for path in quantized_paths.values():
+            os.remove(path)
+        report['files'] = []
+    with open(os.path.join(args.save_path, "quantization_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
 
-    if args.quantize:
-        quantized_save_path = os.path.join(args.save_path, "model_quantized.onnx")
+def parse_buckets(value):
+    return [int(size) for size in value.split(',')] if value else None
+
+def parse_names(value):
+    return value.split(',') if value else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', type=str, default= "logs/model_12000")
+    parser.add_argument('--save_path', type=str, default = 'model/')
+    parser.add_argument('--quantize', type=bool, default = True)
+    parser.add_argument('--calibration_data', type=str, default = None,
+                        help="Dataset in the training JSON format; if set, the model is statically quantized "
+                             "with activation ranges calibrated on it instead of dynamically quantized.")
+    parser.add_argument('--calibration_size', type=int, default = 256)
+    parser.add_argument('--calibration_batch_size', type=int, default = 8)
+    parser.add_argument('--calibration_method', type=str, default = 'minmax',
+                        choices=['minmax', 'entropy', 'percentile'])
+    parser.add_argument('--per_channel', type=bool, default = False)
+    parser.add_argument('--quantize_op_types', type=parse_names, default = None,
+                        help="Comma-separated operator types to quantize, e.g. 'MatMul,Gemm'. Defaults to all supported.")
+    parser.add_argument('--exclude_op_types', type=parse_names, default = None,
+                        help="Comma-separated operator types kept in fp32.")
+    parser.add_argument('--exclude_modules', type=parse_names, default = None,
+                        help="Comma-separated modules kept in fp32, e.g. 'out_project,prompt_rep_layer'.")
+    parser.add_argument('--eval_data', type=str, default = None,
+                        help="Dataset used to compare the F1 of the quantized and fp32 models. "
+                             "Defaults to held-out examples of the calibration data.")
+    parser.add_argument('--eval_size', type=int, default = 256)
+    parser.add_argument('--eval_threshold', type=float, default = 0.5)
+    parser.add_argument('--max_f1_drop', type=float, default = 0.01,
+                        help="Maximum allowed drop of F1 of the statically quantized model.")
+    parser.add_argument('--keep_failed', type=bool, default = False,
+                        help="Keep quantized models beyond the F1 tolerance, flagged in quantization_report.json.")
+    parser.add_argument('--batch_buckets', type=parse_buckets, default = None,
+                        help="Comma-separated batch sizes of the static-shape graphs, e.g. '1,8'.")
+    parser.add_argument('--seq_buckets', type=parse_buckets, default = None,
+                        help="Comma-separated sequence lengths of the static-shape graphs, e.g. '128,256,512'.")
+    parser.add_argument('--labels_buckets', type=parse_buckets, default = None,
+                        help="Comma-separated numbers of labels of the static-shape graphs of bi-encoder models.")
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.save_path):
+        os.makedirs(args.save_path)
+
+    onnx_save_path = os.path.join(args.save_path, "model.onnx")
+
+    print("Loading a model...")
+    gliner_model = GLiNER.from_pretrained(args.model_path, load_tokenizer=True)
+
+    text = "ONNX is an open-source format designed to enable the interoperability of AI models across various frameworks and tools."
+    labels = ['format', 'model', 'tool', 'cat']
+
+    inputs, _ = gliner_model.prepare_model_inputs([text], labels)
+
+    if gliner_model.config.labels_encoder is not None:
+        onnx_save_paths = export_bi_encoder(gliner_model, inputs, args.save_path)
+        graph_paths = dict(zip(['model', 'text_encoder', 'labels_encoder'], onnx_save_paths))
+    else:
+        onnx_save_paths = export_uni_encoder(gliner_model, inputs, args.save_path)
+        graph_paths = {'model': onnx_save_path}
+
+    if args.seq_buckets:
+        export_shape_buckets(gliner_model, inputs, args.save_path, args.batch_buckets or [1],
+                             args.seq_buckets, args.labels_buckets)
+
+    if args.quantize and args.calibration_data:
+        data = load_dataset(args.calibration_data)
+        random.shuffle(data)
+        calibration_data = data[:args.calibration_size]
+        if args.eval_data:
+            eval_data = load_dataset(args.eval_data)[:args.eval_size]
+        else:
+            eval_data = data[args.calibration_size:args.calibration_size + args.eval_size]
+            if not eval_data:
+                raise ValueError("No examples left for the evaluation, set --eval_data or reduce --calibration_size.")
+        quantize_static_graphs(gliner_model, graph_paths, calibration_data, eval_data, args)
+    elif args.quantize:
         # Quantize the ONNX model
         print("Quantizing the model...")
-        quantize_dynamic(
-            onnx_save_path,  # Input model
-            quantized_save_path,  # Output model
-            weight_type=QuantType.QUInt8  # Quantize weights to 8-bit integers
-        )
-    print("Done!")
\ No newline at end of file
+        for path in onnx_save_paths:
+            quantized_save_path = path.replace(".onnx", "_quantized.onnx")
+            quantize_dynamic(
+                path,  # Input model
+                quantized_save_path,  # Output model
+                weight_type=QuantType.QUInt8  # Quantize weights to 8-bit integers
+            )
+    print("Done!")
@@ -0,0 +1,24 @@
+import argparse
+
+from transformers import AutoTokenizer
+
+from gliner.data_processing.pretokenized import iter_examples, prepare_pretokenized_dataset
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tokenize a training dataset once into a memory-mapped store, "
+                    "to be used as `train_data` in train.py."
+    )
+    parser.add_argument('--data', type=str, required=True,
+                        help="Dataset in the training format, a JSON list or a JSON lines (.jsonl) file.")
+    parser.add_argument('--tokenizer', type=str, required=True,
+                        help="Tokenizer of the model to train, e.g. its `model_name` or the path of a GLiNER model.")
+    parser.add_argument('--output_dir', type=str, required=True)
+    parser.add_argument('--chunk_size', type=int, default=1000, help="Number of texts tokenized at once.")
+    args = parser.parse_args()
+
+    # same tokenizer settings as train.py
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, add_prefix_space=True)
+    num_examples = prepare_pretokenized_dataset(iter_examples(args.data), args.output_dir, tokenizer,
+                                                chunk_size=args.chunk_size)
+    print(f"{num_examples} examples saved to {args.output_dir}")
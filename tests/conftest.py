@@ -0,0 +1,73 @@
+import json
+import string
+
+import pytest
+import torch
+from transformers import BertConfig, BertTokenizerFast, GPT2Config, GPT2LMHeadModel, GPT2TokenizerFast
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+from gliner import GLiNER, GLiNERConfig
+
+WORDS = ["john", "smith", "works", "at", "apple", "in", "paris", "mary", "was", "born", "london",
+         "person", "organization", "location", "date", "city", "the", "of", "and", "a"]
+
+ENCODER_CONFIG = dict(model_type="deberta-v2", vocab_size=128, hidden_size=32, num_hidden_layers=1,
+                      num_attention_heads=2, intermediate_size=64, max_position_embeddings=512, pad_token_id=0)
+
+
+@pytest.fixture
+def make_model(tmp_path):
+    """
+    Build small, randomly initialized GLiNER models on a local word-level tokenizer, without downloads.
+    """
+    def make(seed=0, model_max_length=512, **config_kwargs):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS + list(string.ascii_lowercase + string.punctuation)
+        vocab += ["##" + c for c in string.ascii_lowercase]
+        vocab_file = tmp_path / "vocab.txt"
+        vocab_file.write_text("\n".join(vocab))
+        tokenizer = BertTokenizerFast(str(vocab_file), model_max_length=model_max_length)
+
+        torch.manual_seed(seed)
+        config = GLiNERConfig(model_name=str(tmp_path), hidden_size=32, max_width=4, max_len=64,
+                              encoder_config=dict(ENCODER_CONFIG), **config_kwargs)
+        config.class_token_index = len(tokenizer)
+        tokenizer.add_tokens([config.ent_token, config.sep_token], special_tokens=True)
+        config.vocab_size = config.encoder_config.vocab_size = len(tokenizer)
+        model = GLiNER(config, tokenizer=tokenizer, encoder_from_pretrained=False)
+        return model.eval()
+    return make
+
+
+@pytest.fixture
+def labels_encoder(tmp_path):
+    """
+    Save the config of a small BERT labels encoder with a word-level tokenizer and return its path.
+    """
+    path = tmp_path / "labels_encoder"
+    path.mkdir()
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS))
+    BertTokenizerFast(str(vocab_file)).save_pretrained(path)
+    BertConfig(vocab_size=len(WORDS) + 5, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+               intermediate_size=32, max_position_embeddings=64).save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture
+def labels_decoder(tmp_path):
+    """
+    Save a small, randomly initialized GPT-2 labels decoder with a byte-level tokenizer and return its path.
+    """
+    path = tmp_path / "decoder"
+    path.mkdir()
+    vocab = {char: i for i, char in enumerate(bytes_to_unicode().values())}
+    vocab["<|endoftext|>"] = len(vocab)
+    (path / "vocab.json").write_text(json.dumps(vocab))
+    (path / "merges.txt").write_text("#version: 0.2\n")
+    GPT2TokenizerFast(str(path / "vocab.json"), str(path / "merges.txt")).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(vocab), n_embd=32, n_layer=1, n_head=2,
+                        bos_token_id=len(vocab) - 1, eos_token_id=len(vocab) - 1)
+    GPT2LMHeadModel(config).save_pretrained(path)
+    return str(path)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from gliner.data_processing.utils import get_spans_idx, length_bucketed_batches
+
+
+def test_batches_are_sorted_by_length():
+    lengths = [3, 10, 1, 7, 7]
+    batches = length_bucketed_batches(lengths, batch_size=2)
+    assert batches == [[1, 3], [4, 0], [2]]
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+
+
+def test_token_budget():
+    lengths = [3, 10, 1, 7, 7]
+    batches = length_bucketed_batches(lengths, batch_size=2, max_tokens_per_batch=20)
+    for batch in batches:
+        assert max(lengths[i] for i in batch) * len(batch) <= 20
+
+    # an example longer than the budget still gets its own batch
+    assert length_bucketed_batches([50, 2], batch_size=8, max_tokens_per_batch=10) == [[0], [1]]
+
+
+def test_spans_idx_template():
+    spans_idx = get_spans_idx(3, max_width=2)
+    assert spans_idx.tolist() == [[0, 0], [0, 1], [1, 1], [1, 2], [2, 2], [2, 3]]
+    # longer sentences use a larger template with the same layout
+    assert get_spans_idx(100, max_width=2)[:6].tolist() == spans_idx.tolist()
+
+
+def reference_word_mask(tokenized_inputs, prompt_lengths, token_level=False):
+    """
+    Per-token loop the vectorized `prepare_word_mask` replaced.
+    """
+    words_masks = []
+    for id, prompt_length in enumerate(prompt_lengths):
+        words_mask = []
+        prev_word_id = None
+        words_count = 0
+        for word_id in tokenized_inputs.word_ids(id):
+            if word_id is None:
+                words_mask.append(0)
+            elif word_id != prev_word_id or token_level:
+                if words_count < prompt_length:
+                    words_mask.append(0)
+                else:
+                    words_mask.append(word_id - prompt_length + 1)
+                if word_id != prev_word_id:
+                    words_count += 1
+            else:
+                words_mask.append(0)
+            prev_word_id = word_id
+        words_masks.append(words_mask)
+    return words_masks
+
+
+@pytest.mark.parametrize("model_max_length", [512, 12])
+@pytest.mark.parametrize("token_level", [False, True])
+def test_word_mask_matches_token_loop(make_model, model_max_length, token_level):
+    processor = make_model(model_max_length=model_max_length).data_processor
+    config = processor.config
+    # subword splits ("johnxyz", "parisx"), unknown words and texts truncated at 12 tokens
+    texts = [["john", "smith", "works", "at", "apple", "in", "paris", "."],
+             ["johnxyz", "was", "born", "in", "parisx", "\u00e9t\u00e9", "london", "of", "the", "city"],
+             ["mary"]]
+    prompts = [[config.ent_token, "person", config.ent_token, "location", config.sep_token],
+               [config.ent_token, "organization", config.sep_token],
+               []]
+    input_texts = [prompt + text for prompt, text in zip(prompts, texts)]
+    prompt_lengths = [len(prompt) for prompt in prompts]
+    tokenized_inputs = processor.transformer_tokenizer(input_texts, is_split_into_words=True, return_tensors="pt",
+                                                       truncation=True, padding="longest")
+    word_ids = np.array([[-1 if word_id is None else word_id for word_id in tokenized_inputs.word_ids(i)]
+                         for i in range(len(input_texts))])
+    assert (word_ids[1] == len(prompts[1])).sum() > 1
+    assert (word_ids[1].max() < len(input_texts[1]) - 1) == (model_max_length == 12)
+
+    words_mask = processor.prepare_word_mask(input_texts, tokenized_inputs, prompt_lengths, token_level=token_level)
+    expected = reference_word_mask(tokenized_inputs, prompt_lengths, token_level=token_level)
+    assert words_mask.tolist() == expected
+    # word ids of pretokenized texts, passed instead of the ones of the tokenizer
+    assert words_mask.tolist() == processor.prepare_word_mask(
+        input_texts, None, prompt_lengths, token_level=token_level, word_ids=word_ids).tolist()
@@ -0,0 +1,54 @@
+import torch
+
+from gliner.cache import LRUCache, LabelsEmbeddingsCache
+
+
+def test_lru_eviction_and_stats():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_labels_embeddings_persist_on_disk(tmp_path):
+    cache = LabelsEmbeddingsCache(cache_dir=tmp_path, namespace="rev")
+    embeddings = torch.randn(3, 8)
+    for label, embedding in zip(["person", "location", "date"], embeddings):
+        cache.put(label, embedding)
+    cache.flush()
+    cache.put("award", torch.zeros(8))
+    cache.flush()
+
+    reloaded = LabelsEmbeddingsCache(cache_dir=tmp_path, namespace="rev")
+    found = reloaded.get_many(["location", "award", "organization"])
+    assert set(found) == {"location", "award"}
+    assert torch.equal(found["location"], embeddings[1])
+    assert reloaded.stats["disk_size"] == 4
+
+
+def test_labels_embeddings_flush_appends(tmp_path):
+    cache = LabelsEmbeddingsCache(cache_dir=tmp_path, namespace="rev")
+    cache.put("person", torch.ones(8))
+    cache.flush()
+    cache.put("location", torch.full((8,), 2.0))
+    cache.flush()
+    assert cache.disk_path.stat().st_size == 2 * 8 * 4
+
+    # a flush interrupted after writing the embeddings leaves them unindexed
+    with open(cache.disk_path, "ab") as f:
+        f.write(torch.zeros(8).numpy().tobytes())
+    with open(cache.index_path, "a") as f:
+        f.write('"da')
+
+    reloaded = LabelsEmbeddingsCache(cache_dir=tmp_path, namespace="rev")
+    assert reloaded.stats["disk_size"] == 2
+    reloaded.put("date", torch.full((8,), 3.0))
+    reloaded.flush()
+
+    reloaded = LabelsEmbeddingsCache(cache_dir=tmp_path, namespace="rev")
+    found = reloaded.get_many(["person", "location", "date"])
+    assert [embedding[0].item() for embedding in found.values()] == [1.0, 2.0, 3.0]
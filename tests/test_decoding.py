@@ -0,0 +1,139 @@
+import pytest
+import torch
+
+from gliner.config import GLiNERConfig
+from gliner.decoding import SpanDecoder, TokenDecoder
+from gliner.decoding.utils import greedy_search_indices
+from gliner.decoding.trie import LabelsTrie, CompiledLabelsTrie
+from gliner.decoding.trie.constraints import TrieConstraints
+
+
+# generation from prefix embeddings of 3 spans, left-padded to 5 positions
+PREFIX_MASK = torch.tensor([[1, 1, 1, 1, 1], [0, 0, 1, 1, 1], [0, 0, 0, 0, 1]])
+
+
+def test_greedy_search_flat():
+    # (start, end, score): the best span suppresses everything overlapping it
+    starts, ends, scores = [0, 1, 3, 4], [1, 2, 3, 5], [0.9, 0.95, 0.6, 0.7]
+    assert greedy_search_indices(starts, ends, scores, flat_ner=True).tolist() == [1, 2, 3]
+
+
+def test_greedy_search_nested_and_multi_label():
+    starts, ends, scores = [0, 1, 1, 2], [3, 2, 2, 4], [0.9, 0.8, 0.7, 0.6]
+    # nested spans are kept, partially overlapping ones are not
+    assert greedy_search_indices(starts, ends, scores, flat_ner=False).tolist() == [0, 1]
+    # identical boundaries are kept only with multi_label
+    assert greedy_search_indices(starts, ends, scores, flat_ner=False, multi_label=True).tolist() == [0, 1, 2]
+
+
+def test_token_decoder_spans():
+    # (B, L, C, 3) logits of start, end and inside scores for a single class
+    logits = torch.full((2, 5, 1, 3), -5.0)
+    logits[:, 1, 0, 0] = 5.0         # start at word 1
+    logits[:, 3, 0, 1] = 5.0         # end at word 3
+    logits[:, 1:4, 0, 2] = 3.0       # inside words 1..3
+    tokens = [["w"] * 5, ["w"] * 3]  # the second sentence ends before the span does
+
+    spans = TokenDecoder(GLiNERConfig()).decode(tokens, {1: "label"}, logits, threshold=0.5)
+    assert [span[:3] for span in spans[0]] == [(1, 3, "label")]
+    assert abs(spans[0][0][-1] - torch.sigmoid(torch.tensor(3.0)).item()) < 1e-6
+    assert spans[1] == []
+
+
+def test_span_decoder_pruned_logits():
+    config = GLiNERConfig(max_width=3)
+    torch.manual_seed(0)
+    logits = torch.randn(2, 4, 3, 2)  # (B, L, K, C)
+    tokens = [["w"] * 4, ["w"] * 2]
+    id_to_classes = {1: "a", 2: "b"}
+    decoder = SpanDecoder(config)
+    dense = decoder.decode(tokens, id_to_classes, logits, threshold=0.3)
+
+    # keep every span: pruned logits (B, N, C) with their flat positions
+    kept_span_idx = torch.arange(12).expand(2, -1)
+    pruned = decoder.decode(tokens, id_to_classes, logits.view(2, 12, 2), threshold=0.3,
+                            kept_span_idx=kept_span_idx)
+    assert pruned == dense
+
+    # padded positions are ignored
+    kept_span_idx = torch.tensor([[0, 4, -1], [1, -1, -1]])
+    pruned_logits = torch.full((2, 3, 2), 5.0)
+    spans = decoder.decode(tokens, id_to_classes, pruned_logits, threshold=0.3, kept_span_idx=kept_span_idx,
+                           multi_label=True)
+    assert [span[:3] for span in spans[0]] == [(0, 0, "a"), (0, 0, "b"), (1, 2, "a"), (1, 2, "b")]
+    assert [span[:3] for span in spans[1]] == [(0, 1, "a"), (0, 1, "b")]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_trie_constraints_match_trie_lookups(compiled):
+    eos = 1
+    labels = [[5, 6, eos], [5, 7, 8, eos], [9, eos]]
+    trie = LabelsTrie(labels)
+    constraints = TrieConstraints(CompiledLabelsTrie.from_labels(labels) if compiled else trie)
+
+    # each row follows its own path, the last one leaves the trie
+    paths = [[5, 7, 8, eos], [9, eos, eos, eos], [5, 6, eos, eos], [4, 2, 2, 2]]
+    states = constraints.initial_states(len(paths))
+    for step in range(4):
+        logits = torch.zeros(len(paths), 10)
+        masked, allowed = constraints.mask_logits(logits, states, eos)
+        for row, path in enumerate(paths):
+            expected = trie.get(path[:step]) or [eos]
+            assert torch.isfinite(masked[row]).nonzero().flatten().tolist() == sorted(expected)
+        states = constraints.advance(states, torch.tensor([path[step] for path in paths]), allowed)
+
+
+def test_compiled_labels_trie(tmp_path):
+    labels = [[5, 6, 1], [5, 7, 8, 1], [9, 1], [5, 6, 2]]
+    trie = LabelsTrie(labels)
+    compiled = CompiledLabelsTrie.from_labels(labels)
+    compiled.save(tmp_path / "labels_trie.npy")
+    loaded = CompiledLabelsTrie.load(tmp_path / "labels_trie.npy", mmap=True)
+
+    for prefix in [[], [5], [5, 6], [5, 7, 8], [5, 7, 8, 1], [9, 1], [4], [5, 4, 1]]:
+        assert loaded.get(prefix) == sorted(trie.get(prefix))
+    node = loaded.child(loaded.child(loaded.root, 5), 6)
+    assert node == loaded.node([5, 6])
+    assert loaded.children(node).tolist() == [1, 2]
+    assert loaded.child(node, 3) == -1
+
+
+@pytest.fixture
+def decoder(make_model, labels_decoder):
+    return make_model(labels_decoder=labels_decoder, decoder_mode="span").model.decoder
+
+
+def test_prefilled_greedy_generation(decoder):
+    torch.manual_seed(1)
+    inputs_embeds = torch.randn(len(PREFIX_MASK), PREFIX_MASK.shape[1], decoder.decoder_hidden_size)
+    generate_kwargs = dict(inputs_embeds=inputs_embeds, attention_mask=PREFIX_MASK, max_new_tokens=6,
+                           do_sample=False, pad_token_id=decoder.decoder_layer.model.config.eos_token_id)
+    past_key_values = decoder.prefill(inputs_embeds[:, :-1], PREFIX_MASK[:, :-1])
+    model = decoder.decoder_layer.model
+    with torch.no_grad():
+        expected = model.generate(**generate_kwargs)
+        assert torch.equal(model.generate(past_key_values=past_key_values, **generate_kwargs), expected)
+    assert torch.equal(decoder.generate(**generate_kwargs), expected)
+
+
+@pytest.mark.parametrize("num_return_sequences", [2, 3])
+def test_prefilled_beam_generation(decoder, monkeypatch, num_return_sequences):
+    torch.manual_seed(1)
+    inputs_embeds = torch.randn(len(PREFIX_MASK), PREFIX_MASK.shape[1], decoder.decoder_hidden_size)
+    generate_kwargs = dict(inputs_embeds=inputs_embeds, attention_mask=PREFIX_MASK, max_new_tokens=6,
+                           do_sample=False, num_return_sequences=num_return_sequences)
+    prefill_calls = []
+    prefill = decoder.prefill
+
+    def counting_prefill(inputs_embeds, attention_mask, num_copies=1):
+        prefill_calls.append((inputs_embeds.shape[0], num_copies))
+        return prefill(inputs_embeds, attention_mask, num_copies=num_copies)
+
+    monkeypatch.setattr(decoder, "prefill", counting_prefill)
+    generated = decoder.generate(**generate_kwargs)
+    # the prefix is run once per span, not once per beam
+    assert prefill_calls == [(len(PREFIX_MASK), num_return_sequences)]
+    assert generated.shape[0] == len(PREFIX_MASK) * num_return_sequences
+
+    monkeypatch.setattr(decoder, "prefill", lambda *args, **kwargs: None)
+    assert torch.equal(decoder.generate(**generate_kwargs), generated)
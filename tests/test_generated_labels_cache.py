@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+TEXTS = ["john smith works at apple in paris .", "mary was born in london ."]
+LABELS = ["person", "organization", "location"]
+# deterministic generation, the random model scores spans around 0.5
+PREDICT_KWARGS = dict(threshold=0.3, num_gen_sequences=2, do_sample=False, max_new_tokens=4)
+
+
+@pytest.fixture
+def model(make_model, labels_decoder, monkeypatch):
+    # the processor of models with a labels decoder prompts a random batch out of 11 with a blank label
+    monkeypatch.setattr(random, "randint", lambda a, b: a)
+    return make_model(labels_decoder=labels_decoder, decoder_mode="span")
+
+
+@pytest.fixture
+def decoder_inputs(model, monkeypatch):
+    # number of spans of each text decoded by each call of the labels decoder
+    calls = []
+    generate_labels = model.model.generate_labels
+
+    def counting_generate_labels(decoder_embedding, decoder_embedding_mask, **kwargs):
+        rows = model._decoder_input_rows(decoder_embedding_mask)
+        calls.append(rows[:, 0].bincount(minlength=len(decoder_embedding_mask)).tolist())
+        return generate_labels(decoder_embedding, decoder_embedding_mask, **kwargs)
+
+    monkeypatch.setattr(model.model, "generate_labels", counting_generate_labels)
+    return calls
+
+
+def generated_labels(outputs):
+    return [[entity["generated labels"] for entity in entities] for entities in outputs]
+
+
+def test_repeated_call_hits_cache(model, decoder_inputs):
+    cache = model.set_generated_labels_cache()
+    first = model.run(TEXTS, LABELS, **PREDICT_KWARGS)
+    num_spans = sum(*decoder_inputs)
+    assert cache.stats["misses"] == num_spans and cache.stats["hits"] == 0
+    assert all(len(labels) == 2 for labels in sum(generated_labels(first), []))
+
+    assert model.run(TEXTS, LABELS, **PREDICT_KWARGS) == first
+    assert len(decoder_inputs) == 1
+    assert cache.stats["hits"] == num_spans and cache.stats["misses"] == num_spans
+
+
+def test_partial_hits_keep_order(model, decoder_inputs):
+    expected = model.run(TEXTS, LABELS, **PREDICT_KWARGS)
+
+    (num_first_spans, num_second_spans), = decoder_inputs
+
+    # the generated labels depend on the padding of the batch, so the texts are decoded together;
+    # the spans of the second text, decoded first, are evicted
+    model.set_generated_labels_cache(max_size=num_first_spans)
+    model.run(TEXTS[::-1], LABELS, **PREDICT_KWARGS)
+    outputs = model.run(TEXTS, LABELS, **PREDICT_KWARGS)
+    assert decoder_inputs[-1] == [0, num_second_spans]
+    assert generated_labels(outputs) == generated_labels(expected)
+    assert outputs == expected
+
+
+def test_cache_cleared_with_weights(model):
+    cache = model.set_generated_labels_cache()
+    model.run(TEXTS, LABELS, **PREDICT_KWARGS)
+    assert len(cache)
+    model.train()
+    assert not len(cache) and cache.stats["misses"] == 0
+
+    model.eval()
+    model.run(TEXTS, LABELS, **PREDICT_KWARGS)
+    assert len(cache)
+    model.optimize_for_inference()
+    assert not len(cache)
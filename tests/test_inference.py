@@ -0,0 +1,176 @@
+import threading
+
+import pytest
+import torch
+
+from gliner.data_processing.collator import DataCollator
+from gliner.modeling.span_rep import SpanRepLayer
+
+TEXTS = ["john smith works at apple in paris .",
+         "mary was born in london , the city of the organization .",
+         "apple"]
+LABELS = ["person", "organization", "location", "date"]
+
+
+def test_windows_fit_into_encoder(make_model):
+    model = make_model(model_max_length=24)
+    # long words take several subword tokens
+    document = " ".join(["johnathan", "smithsonian", "works", "at", "apple"] * 8)
+    input_x, starts, ends = model.prepare_texts([document])
+
+    max_tokens = model._window_max_tokens(LABELS)
+    windows_x = model._split_into_windows(input_x, starts, ends, window_size=16, window_overlap=4,
+                                          max_tokens=max_tokens)[0]
+    assert len(windows_x) > 1
+    windows_words = [window["tokenized_text"] for window in windows_x]
+    prompted_windows, _ = model.data_processor.prepare_inputs(windows_words, [LABELS] * len(windows_x))
+    encodings = model.data_processor.transformer_tokenizer(prompted_windows, is_split_into_words=True)
+    for words, ids in zip(windows_words, encodings["input_ids"]):
+        assert 1 <= len(words) <= 16 and len(ids) <= 24
+
+    with pytest.raises(ValueError):
+        model.run([document], LABELS, sliding_window=True, window_overlap=model.config.max_width - 1)
+    assert len(model.run([document], LABELS, sliding_window=True, window_size=16)) == 1
+
+
+def test_entity_crossing_window_edge(make_model):
+    model = make_model()
+    document = " ".join(str(i) for i in range(20))
+    input_x, starts, ends = model.prepare_texts([document])
+    # windows of words [0, 10), [6, 16) and [12, 20)
+    _, windows_starts, windows_ends, _, windows_cuts = model._split_into_windows(
+        input_x, starts, ends, window_size=10, window_overlap=model.config.max_width)
+    assert [len(window) for window in windows_starts] == [10, 10, 8]
+
+    def entity(window, first, last):
+        offset = starts[0].index(windows_starts[window][0])
+        return {"start": windows_starts[window][first - offset], "end": windows_ends[window][last - offset],
+                "label": "person", "score": 0.9}
+
+    # words 8-11 are truncated by the first window and seen whole by the second one
+    merged = model._merge_window_entities([[entity(0, 8, 9)], [entity(1, 8, 11)], []], windows_cuts)
+    assert [(ent["start"], ent["end"]) for ent in merged] == [(starts[0][8], ends[0][11])]
+
+    # words 6-9 cover the whole overlap of the first two windows and touch the edges of both
+    merged = model._merge_window_entities([[entity(0, 6, 9)], [entity(1, 6, 9)], []], windows_cuts)
+    assert [(ent["start"], ent["end"]) for ent in merged] == [(starts[0][6], ends[0][9])]
+
+
+@torch.no_grad()
+def sharded_reference(model, texts, label_shards, threshold=0.5):
+    # every shard is run as a regular call, then the spans scored by all the shards are decoded
+    # together, each shard giving the scores of its own labels only
+    num_labels = sum(len(shard) for shard in label_shards)
+    shards_logits, shards_span_idx = [], []
+    for shard_id, shard in enumerate(label_shards):
+        collator = DataCollator(model.config, data_processor=model.data_processor, return_tokens=True,
+                                return_entities=True, return_id_to_classes=True, prepare_labels=False,
+                                entity_types=shard)
+        texts, batch, starts, ends = model._collate_texts(collator, texts)
+        logits, _, _, kept_span_idx = model._forward_batch(batch)
+        logits = logits.flatten(1, -2)[..., :len(shard)]
+        if kept_span_idx is None:
+            kept_span_idx = torch.arange(logits.size(1)).expand(len(texts), -1)
+
+        first_label = sum(len(prev_shard) for prev_shard in label_shards[:shard_id])
+        shard_logits = logits.new_full((*logits.shape[:2], num_labels), float("-inf"))
+        shard_logits[..., first_label:first_label + len(shard)] = logits
+        shards_logits.append(shard_logits)
+        shards_span_idx.append(kept_span_idx)
+
+    id_to_classes = {i: label for i, label in enumerate(sum(label_shards, []), start=1)}
+    outputs = model.decoder.decode(batch["tokens"], id_to_classes, torch.cat(shards_logits, dim=1), flat_ner=True,
+                                   threshold=threshold, kept_span_idx=torch.cat(shards_span_idx, dim=1))
+    return model._spans_to_entities(texts, outputs, starts, ends)
+
+
+@pytest.mark.parametrize("span_pruning_top_k", [None, 6])
+def test_label_sharding_in_run_and_stream(make_model, span_pruning_top_k):
+    model = make_model(span_proposal=True, span_pruning_top_k=span_pruning_top_k)
+    label_shards = model.data_processor.shard_labels(LABELS, max_prompt_tokens=5)
+    assert len(label_shards) > 1
+
+    # the random model scores spans around 0.5
+    expected = sharded_reference(model, TEXTS, label_shards, threshold=0.3)
+    assert any(expected)
+    assert model.run(TEXTS, LABELS, threshold=0.3, max_prompt_tokens=5) == expected
+    assert list(model.stream(TEXTS, LABELS, threshold=0.3, batch_size=2, max_prompt_tokens=5)) == expected
+    assert model.run(TEXTS, LABELS, threshold=0.3, sort_by_length=True, max_prompt_tokens=5) == expected
+
+
+@pytest.mark.parametrize("span_mode", ["marker", "markerV0", "markerV1"])
+def test_packed_span_scores_match_dense(make_model, monkeypatch, span_mode):
+    model = make_model(span_mode=span_mode)
+    inputs, _ = model.prepare_model_inputs(TEXTS, LABELS)
+    span_mask = inputs["span_mask"].view(len(TEXTS), -1, model.config.max_width).bool()
+    with torch.no_grad():
+        packed_logits = model.model(**inputs).logits
+        monkeypatch.setattr(SpanRepLayer, "supports_packed", False)
+        dense_logits = model.model(**inputs).logits
+    assert torch.allclose(packed_logits[span_mask], dense_logits[span_mask], atol=1e-5)
+    assert not packed_logits[~span_mask].any()
+
+
+def test_merge_label_shards_with_pruned_spans(make_model):
+    model = make_model()
+    K = model.config.max_width
+    # one text prompted with two shards, each keeping different spans (flat positions, -1 for padding)
+    batch = {"tokens": [["john", "smith"]] * 2, "span_idx": torch.zeros(2, 2 * K, 2, dtype=torch.long)}
+    logits = torch.tensor([[[1.0], [2.0]], [[3.0], [0.0]]])
+    kept_span_idx = torch.tensor([[1, 5], [5, -1]])
+
+    merged_batch, (merged_logits, *_, merged_kept_span_idx) = model._merge_label_shards(
+        batch, (logits, None, None, kept_span_idx), [["person"], ["location"]])
+    assert merged_kept_span_idx is None and merged_batch["id_to_classes"] == {1: "person", 2: "location"}
+
+    expected = torch.full((1, 2 * K, 2), float("-inf"))
+    expected[0, 1, 0], expected[0, 5, 0], expected[0, 5, 1] = 1.0, 2.0, 3.0
+    assert torch.equal(merged_logits, expected.view(1, 2, K, 2))
+
+
+MIXED_TEXTS = ["john smith works at apple in paris .", "mary", "the city of london", "apple and paris",
+               "mary smith was born in london , the city of the organization .", "john", "smith works"]
+
+
+def test_pipelined_predictions(make_model):
+    model = make_model()
+    expected = model.run(MIXED_TEXTS, LABELS, threshold=0.3, batch_size=2)
+    assert any(expected)
+    for text, entities in zip(MIXED_TEXTS, expected):
+        assert all(text[entity["start"]:entity["end"]] == entity["text"] for entity in entities)
+
+    for prefetch_batches in (1, 2, 8):
+        predict_kwargs = dict(threshold=0.3, batch_size=2, pipeline=True, prefetch_batches=prefetch_batches)
+        assert model.run(MIXED_TEXTS, LABELS, **predict_kwargs) == expected
+        assert list(model.stream(iter(MIXED_TEXTS), LABELS, **predict_kwargs)) == expected
+    assert model.run(MIXED_TEXTS, LABELS, threshold=0.3, batch_size=2, sort_by_length=True, pipeline=True) \
+        == model.run(MIXED_TEXTS, LABELS, threshold=0.3, batch_size=2, sort_by_length=True)
+
+
+@pytest.mark.parametrize("stage", ["_collate_texts", "_forward_batch", "_decode_to_entities"])
+def test_pipeline_raises_worker_errors(make_model, monkeypatch, stage):
+    model = make_model()
+    method = getattr(model, stage)
+    calls = []
+
+    def fail_on_second_batch(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == 2:
+            raise RuntimeError(f"{stage} failed")
+        return method(*args, **kwargs)
+
+    monkeypatch.setattr(model, stage, fail_on_second_batch)
+    errors = []
+
+    def predict():
+        try:
+            model.run(MIXED_TEXTS, LABELS, batch_size=2, pipeline=True)
+        except RuntimeError as error:
+            errors.append(error)
+
+    # the error reaches the caller instead of leaving it waiting on the workers
+    thread = threading.Thread(target=predict, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert [str(error) for error in errors] == [f"{stage} failed"]
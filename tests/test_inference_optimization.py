@@ -0,0 +1,59 @@
+import pytest
+import torch
+
+from gliner import GLiNER
+
+TEXTS = ["john smith works at apple in paris .", "mary was born in london ."]
+LABELS = ["person", "organization", "location"]
+
+
+def scores(model):
+    inputs, _ = model.prepare_model_inputs(TEXTS, LABELS)
+    with torch.no_grad():
+        return torch.sigmoid(model._call_model(**inputs).logits)
+
+
+@pytest.mark.parametrize("mode", ["frozen", "bf16", "dynamic_int8"])
+def test_optimize_for_inference(make_model, mode):
+    model = make_model()
+    reference = scores(model)
+    model.optimize_for_inference(mode, texts=TEXTS, labels=LABELS)
+    assert model.config.inference_optimization == mode
+    assert not any(param.requires_grad for param in model.parameters())
+    assert (scores(model) - reference).abs().max() <= 0.05
+    assert len(model.run(TEXTS, LABELS, threshold=0.3)) == len(TEXTS)
+
+    with pytest.raises(ValueError):
+        model.train()
+    with pytest.raises(ValueError):
+        model.optimize_for_inference("frozen")
+
+
+def test_optimization_reverted_beyond_tolerance(make_model):
+    model = make_model()
+    reference = scores(model)
+    modules = dict(model.model.named_children())
+    with pytest.raises(ValueError, match="tolerance"):
+        model.optimize_for_inference("dynamic_int8", texts=TEXTS, labels=LABELS, atol=0.0)
+
+    assert model.config.inference_optimization is None
+    assert dict(model.model.named_children()) == modules
+    assert all(param.requires_grad for param in model.parameters())
+    assert torch.equal(scores(model), reference)
+    model.train()
+
+
+@pytest.mark.parametrize("mode", ["bf16", "dynamic_int8"])
+def test_optimization_reapplied_on_load(make_model, tmp_path, mode):
+    model = make_model()
+    model.optimize_for_inference(mode, texts=TEXTS, labels=LABELS)
+    model.save_pretrained(tmp_path / "optimized", safe_serialization=mode != "dynamic_int8")
+    model.data_processor.transformer_tokenizer.save_pretrained(tmp_path / "optimized")
+
+    loaded = GLiNER.from_pretrained(str(tmp_path / "optimized"), load_tokenizer=True)
+    assert loaded.config.inference_optimization == mode
+    assert not any(param.requires_grad for param in loaded.parameters())
+    assert [type(module) for module in loaded.model.modules()] == [type(module) for module in model.model.modules()]
+    assert torch.equal(scores(loaded), scores(model))
+    with pytest.raises(ValueError):
+        loaded.train()
@@ -0,0 +1,20 @@
+import torch
+
+from gliner.onnx.model import pad_to_bucket
+
+
+def test_pad_to_bucket():
+    span_idx = torch.tensor([[[0, 0], [0, 1]], [[1, 1], [1, 2]]])
+    padded = pad_to_bucket(span_idx, ("batch", "spans", None), {"batch": 3, "spans": 4})
+    assert padded.shape == (3, 4, 2)
+    # the batch is padded with copies of the last example, the other axes with zeros
+    assert torch.equal(padded[2], padded[1])
+    assert torch.equal(padded[:2, :2], span_idx)
+    assert not padded[:, 2:].any()
+
+
+def test_pad_to_bucket_bool():
+    span_mask = torch.tensor([[True, False]])
+    padded = pad_to_bucket(span_mask, ("batch", "spans"), {"batch": 1, "spans": 3, "seq": 8})
+    assert padded.dtype == torch.bool
+    assert padded.tolist() == [[True, False, False]]
@@ -0,0 +1,116 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+import torch
+
+from gliner import GLiNER
+
+pytest.importorskip("onnx")
+
+SCRIPT_PATH = Path(__file__).parents[1] / "scripts" / "convert_to_onnx.py"
+
+TEXTS = ["john smith works at apple in paris .", "mary was born in london ."]
+LABELS = ["person", "organization", "location"]
+
+
+@pytest.fixture(scope="module")
+def convert_to_onnx():
+    spec = importlib.util.spec_from_file_location("convert_to_onnx", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_shape_buckets_shorter_than_example(make_model, convert_to_onnx, tmp_path):
+    model = make_model()
+    inputs, _ = model.prepare_model_inputs(["john smith works at apple in paris ."], ["person", "location"])
+    seq_length = inputs["input_ids"].shape[1]
+    with pytest.raises(ValueError, match=f"{seq_length} tokens"):
+        convert_to_onnx.export_shape_buckets(model, inputs, str(tmp_path), [1], [seq_length - 1, seq_length])
+    assert not list(tmp_path.glob("*.onnx"))
+
+
+def export_model(model, convert_to_onnx, save_path):
+    """
+    Save the model and its ONNX graphs as `convert_to_onnx.py` does, and load them back.
+    """
+    model.save_pretrained(save_path)
+    model.data_processor.transformer_tokenizer.save_pretrained(save_path)
+    inputs, _ = model.prepare_model_inputs(TEXTS, LABELS)
+    if model.config.labels_encoder is not None:
+        convert_to_onnx.export_bi_encoder(model, inputs, str(save_path))
+    else:
+        convert_to_onnx.export_uni_encoder(model, inputs, str(save_path))
+    return GLiNER.from_pretrained(str(save_path), load_onnx_model=True, load_tokenizer=True)
+
+
+def test_io_binding_outputs(make_model, convert_to_onnx, tmp_path):
+    model = make_model()
+    onnx_model = export_model(model, convert_to_onnx, tmp_path / "onnx")
+    ort_model = onnx_model.model
+    assert ort_model.use_io_binding
+
+    first_inputs, _ = onnx_model.prepare_model_inputs(TEXTS, LABELS)
+    second_inputs, _ = onnx_model.prepare_model_inputs(TEXTS[::-1], LABELS)
+    with torch.no_grad():
+        expected = model.model(**first_inputs).logits
+    logits = ort_model(**first_inputs).logits
+    assert torch.allclose(logits, expected, atol=1e-4)
+
+    # logits of an earlier batch, and their views, are not overwritten by the next batch
+    first_logits = logits.sigmoid()
+    first_view = logits[:1]
+    del logits
+    second_logits = ort_model(**second_inputs).logits
+    assert torch.equal(first_view.sigmoid(), first_logits[:1])
+    assert second_logits.data_ptr() != first_view.data_ptr()
+
+    # released buffers are reused
+    data_ptr = second_logits.data_ptr()
+    second_logits = second_logits.clone()
+    del first_view
+    assert torch.equal(ort_model(**second_inputs).logits, second_logits)
+    assert ort_model(**second_inputs).logits.data_ptr() == data_ptr
+
+    outputs = onnx_model.run(TEXTS, LABELS, threshold=0.3)
+    ort_model.use_io_binding = False
+    assert torch.equal(torch.as_tensor(ort_model(**second_inputs).logits), second_logits)
+    assert onnx_model.run(TEXTS, LABELS, threshold=0.3) == outputs
+
+
+def test_bi_encoder_export(make_model, labels_encoder, convert_to_onnx, tmp_path, monkeypatch):
+    model = make_model(labels_encoder=labels_encoder)
+    onnx_model = export_model(model, convert_to_onnx, tmp_path / "onnx")
+    ort_model = onnx_model.model
+    assert {path.name for path in (tmp_path / "onnx").glob("*.onnx")} == {"text_encoder.onnx",
+                                                                            "labels_encoder.onnx", "model.onnx"}
+
+    inputs, _ = onnx_model.prepare_model_inputs(TEXTS, LABELS)
+    with torch.no_grad():
+        expected = model.model(**inputs).logits
+    assert torch.allclose(ort_model(**inputs).logits, expected, atol=1e-4)
+    outputs = model.run(TEXTS, LABELS, threshold=0.5)
+    assert any(outputs)
+
+    # the labels encoder only runs for labels missing from the cache
+    encoded_labels = []
+    compute_outputs = ort_model.labels_encoder.compute_outputs
+
+    def count_labels(inputs):
+        encoded_labels.append(inputs["input_ids"].shape[0])
+        return compute_outputs(inputs)
+
+    monkeypatch.setattr(ort_model.labels_encoder, "compute_outputs", count_labels)
+    onnx_outputs = onnx_model.run(TEXTS, LABELS, threshold=0.5)
+    assert encoded_labels == [len(LABELS)]
+    assert [[(entity["start"], entity["end"], entity["label"]) for entity in entities] for entities in onnx_outputs] \
+        == [[(entity["start"], entity["end"], entity["label"]) for entity in entities] for entities in outputs]
+    for entities, expected_entities in zip(onnx_outputs, outputs):
+        for entity, expected_entity in zip(entities, expected_entities):
+            assert entity["score"] == pytest.approx(expected_entity["score"], abs=1e-4)
+
+    assert onnx_model.run(TEXTS[::-1], LABELS[::-1], threshold=0.5) == onnx_outputs[::-1]
+    assert encoded_labels == [len(LABELS)]
+    onnx_model.run(TEXTS, LABELS + ["date"], threshold=0.5)
+    assert encoded_labels == [len(LABELS), 1]
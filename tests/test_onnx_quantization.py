@@ -0,0 +1,51 @@
+import pytest
+
+onnx = pytest.importorskip("onnx")
+
+from onnx import TensorProto, helper
+
+from gliner.onnx.quantization import check_quantization_accuracy, get_nodes_to_exclude
+
+
+class FixedF1Model:
+    def __init__(self, f1):
+        self.f1 = f1
+        self.entity_types = None
+
+    def evaluate(self, data, entity_types=None, **kwargs):
+        self.entity_types = entity_types
+        return None, self.f1
+
+
+DATA = [{"tokenized_text": ["john", "lives", "in", "paris"], "ner": [[0, 0, "person"], [3, 3, "location"]]}]
+
+
+def test_get_nodes_to_exclude(tmp_path):
+    names = ["/core/token_rep_layer/bert_layer/MatMul", "/core/out_project/out_project.0/Gemm",
+             "/core/prompt_rep_layer/prompt_rep_layer.0/MatMul"]
+    nodes = [helper.make_node("Identity", ["x"], ["y0"], name=names[0]),
+             helper.make_node("Identity", ["y0"], ["y1"], name=names[1]),
+             helper.make_node("Identity", ["y1"], ["y"], name=names[2])]
+    value_info = lambda name: helper.make_tensor_value_info(name, TensorProto.FLOAT, [1])
+    graph = helper.make_graph(nodes, "graph", [value_info("x")], [value_info("y")])
+    path = str(tmp_path / "model.onnx")
+    onnx.save(helper.make_model(graph), path)
+
+    assert get_nodes_to_exclude(path, modules_to_exclude=["out_project"]) == [names[1]]
+    assert get_nodes_to_exclude(path, modules_to_exclude=["token_rep_layer.bert_layer", "prompt_rep_layer"]) == [
+        names[0], names[2]]
+    assert get_nodes_to_exclude(path, op_types_to_exclude=["Identity"]) == names
+
+
+def test_check_quantization_accuracy():
+    reference, quantized = FixedF1Model(0.8), FixedF1Model(0.795)
+    report = check_quantization_accuracy(reference, quantized, DATA, max_f1_drop=0.01)
+    assert report["passed"]
+    # both models are evaluated on the same labels
+    assert reference.entity_types == quantized.entity_types == ["location", "person"]
+
+    with pytest.raises(ValueError):
+        check_quantization_accuracy(reference, FixedF1Model(0.7), DATA, max_f1_drop=0.01)
+    with pytest.warns(UserWarning):
+        report = check_quantization_accuracy(reference, FixedF1Model(0.7), DATA, max_f1_drop=0.01, strict=False)
+    assert not report["passed"]
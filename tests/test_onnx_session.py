@@ -0,0 +1,55 @@
+import json
+import os
+
+import numpy as np
+import onnxruntime as ort
+import pytest
+
+from gliner.onnx.session import ORTSessionPool, create_session_options
+
+
+def test_create_session_options():
+    options = create_session_options(intra_op_num_threads=4, inter_op_num_threads=2,
+                                     graph_optimization_level="extended", execution_mode="parallel",
+                                     enable_cpu_mem_arena=False)
+    assert options.intra_op_num_threads == 4
+    assert options.inter_op_num_threads == 2
+    assert options.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    assert options.execution_mode == ort.ExecutionMode.ORT_PARALLEL
+    assert not options.enable_cpu_mem_arena
+
+
+def test_create_session_options_invalid():
+    with pytest.raises(ValueError):
+        create_session_options(graph_optimization_level="max")
+    with pytest.raises(ValueError):
+        create_session_options(execution_mode="async")
+
+
+def test_optimized_model_is_keyed_on_model_content(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    def save_model(path, value):
+        constant = helper.make_tensor("c", TensorProto.FLOAT, [1], [value])
+        graph = helper.make_graph([helper.make_node("Add", ["x", "c"], ["y"])], "add",
+                                  [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1])],
+                                  [helper.make_tensor_value_info("y", TensorProto.FLOAT, [1])], [constant])
+        onnx.save(helper.make_model(graph, ir_version=8, opset_imports=[helper.make_opsetid("", 17)]), path)
+
+    def run(pool):
+        with pool.checkout() as session:
+            return session.run(None, {"x": np.zeros(1, dtype=np.float32)})[0].item()
+
+    model_path, optimized_path = str(tmp_path / "model.onnx"), str(tmp_path / "model_optimized.onnx")
+    save_model(model_path, 1.0)
+    assert run(ORTSessionPool(model_path, num_sessions=2, optimized_model_filepath=optimized_path)) == 1.0
+
+    # a different model with an older modification time than the saved graph
+    save_model(model_path, 2.0)
+    os.utime(model_path, (0, 0))
+    assert run(ORTSessionPool(model_path, optimized_model_filepath=optimized_path)) == 2.0
+
+    pool = ORTSessionPool(model_path, optimized_model_filepath=optimized_path, graph_optimization_level="basic")
+    with open(pool.optimization_key_filepath) as f:
+        assert json.load(f) == pool._optimization_key()
@@ -0,0 +1,69 @@
+import random
+import warnings
+
+import pytest
+import torch
+from transformers import BertTokenizerFast
+
+from gliner.config import GLiNERConfig
+from gliner.data_processing import SpanProcessor, PretokenizedDataset, WordsSplitter, prepare_pretokenized_dataset
+from gliner.data_processing.collator import DataCollator
+
+WORDS = ["john", "smith", "works", "at", "apple", "in", "paris", "Zürich", "x-y", "."]
+
+
+@pytest.fixture
+def tokenizer(tmp_path):
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "<<ENT>>", "<<SEP>>"] + WORDS
+    vocab += list("abcdefghijklmnopqrstuvwxyz-") + ["##" + c for c in "abcdefghijklmnopqrstuvwxyz"]
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(vocab))
+    tokenizer = BertTokenizerFast(str(vocab_file), model_max_length=32)
+    # as done for the models, so that prompts can be spliced
+    tokenizer.add_tokens(["<<ENT>>", "<<SEP>>"], special_tokens=True)
+    return tokenizer
+
+
+def test_pretokenized_batches_match_json_examples(tokenizer, tmp_path):
+    rng = random.Random(0)
+    examples = []
+    for _ in range(30):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(0, 40))]
+        ner = [[i, i, rng.choice(["person", "location"])] for i in range(0, len(words), 7)]
+        examples.append({"tokenized_text": words, "ner": ner})
+    kept = [example for example in examples if example["tokenized_text"] and example["ner"]]
+
+    assert prepare_pretokenized_dataset(examples, tmp_path / "data", tokenizer, chunk_size=4,
+                                        show_progress=False) == len(kept)
+    dataset = PretokenizedDataset(tmp_path / "data", tokenizer=tokenizer)
+    assert [dataset[i]["tokenized_text"] for i in range(len(dataset))] == [ex["tokenized_text"] for ex in kept]
+
+    # texts are truncated both to `max_len` words and to the maximum length of the tokenizer
+    config = GLiNERConfig(max_width=3, max_len=24)
+    collator = DataCollator(config, data_processor=SpanProcessor(config, tokenizer, None), prepare_labels=True)
+    for start in range(0, len(kept), 8):
+        random.seed(start)
+        expected = collator(kept[start:start + 8])
+        random.seed(start)
+        batch = collator([dataset[i] for i in range(start, min(start + 8, len(dataset)))])
+        assert batch.keys() == expected.keys()
+        for key in expected:
+            assert torch.equal(batch[key], expected[key]), key
+
+
+def test_unspliced_pretokenized_texts_warn(tokenizer, tmp_path):
+    examples = [{"tokenized_text": ["john", "smith", "works", "at", "apple"], "ner": [[0, 1, "person"]]}]
+    prepare_pretokenized_dataset(examples, tmp_path / "data", tokenizer, show_progress=False)
+    dataset = PretokenizedDataset(tmp_path / "data", tokenizer=tokenizer)
+
+    config = GLiNERConfig(max_width=3, max_len=24)
+    processor = SpanProcessor(config, tokenizer, None)
+    assert processor.splice_prompts
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        DataCollator(config, data_processor=processor, prepare_labels=True)([dataset[0]])
+
+    # processors of `GLiNERDataset` split the texts into words again
+    processor = SpanProcessor(config, tokenizer, WordsSplitter("whitespace"), preprocess_text=True)
+    with pytest.warns(UserWarning, match="pretokenized"):
+        DataCollator(config, data_processor=processor, prepare_labels=True)([dataset[0]])
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import torch
+
+from gliner.modeling.layers import ConvSeq2SeqEncoder, LstmSeq2SeqEncoder
+
+CONFIG = SimpleNamespace(hidden_size=16)
+
+
+def make_inputs():
+    torch.manual_seed(0)
+    x = torch.randn(3, 7, CONFIG.hidden_size)
+    mask = (torch.arange(7).unsqueeze(0) < torch.tensor([[7], [3], [5]])).long()
+    return x, mask
+
+
+def test_lstm_padded_matches_packed():
+    x, mask = make_inputs()
+    encoder = LstmSeq2SeqEncoder(CONFIG)
+    with torch.no_grad():
+        assert torch.allclose(encoder.forward_padded(x, mask), encoder(x, mask), atol=1e-6)
+
+
+def test_conv_ignores_padding():
+    x, mask = make_inputs()
+    encoder = ConvSeq2SeqEncoder(CONFIG)
+    noisy_x = x.clone()
+    noisy_x[1, 3:] = 100.
+    with torch.no_grad():
+        output = encoder(x, mask)
+        assert torch.allclose(encoder(noisy_x, mask)[1, :3], output[1, :3])
+        assert not output[1, 3:].any()
@@ -6,12 +6,13 @@ import json
 
 from transformers import AutoTokenizer
 import torch
+from torch.utils.data import Subset
 
 from gliner import GLiNERConfig, GLiNER
 from gliner.training import Trainer, TrainingArguments
 from gliner.data_processing.collator import DataCollatorWithPadding, DataCollator
 from gliner.utils import load_config_as_namespace
-from gliner.data_processing import WordsSplitter, GLiNERDataset
+from gliner.data_processing import WordsSplitter, GLiNERDataset, PretokenizedDataset
 
 
 if __name__ == '__main__':
@@ -28,8 +29,14 @@ if __name__ == '__main__':
     config = load_config_as_namespace(args.config)
     config.log_dir = args.log_dir
 
-    with open(config.train_data, 'r') as f:
-        data = [item for item in json.load(f) if len(item['tokenized_text']) and len(item['ner'])]
+    pretokenized_data = None
+    if os.path.isdir(config.train_data):
+        # dataset prepared by scripts/pretokenize_dataset.py
+        pretokenized_data = PretokenizedDataset(config.train_data)
+        data = list(range(len(pretokenized_data)))
+    else:
+        with open(config.train_data, 'r') as f:
+            data = [item for item in json.load(f) if len(item['tokenized_text']) and len(item['ner'])]
 
     print('Dataset size:', len(data))
     #shuffle
@@ -38,6 +45,9 @@ if __name__ == '__main__':
 
     train_data = data[:int(len(data)*0.9)]
     test_data = data[int(len(data)*0.9):]
+    if pretokenized_data is not None:
+        train_data = Subset(pretokenized_data, train_data)
+        test_data = Subset(pretokenized_data, test_data)
 
     print('Dataset is splitted...')
 
@@ -62,6 +72,10 @@ if __name__ == '__main__':
                                         set_class_token_index = False,
                                         add_tokens_to_tokenizer=False)
 
+    if pretokenized_data is not None:
+        # the stored tokens are spliced into the inputs by the data processor of the model
+        pretokenized_data.check_tokenizer(model.data_processor.transformer_tokenizer)
+
     if args.compile_model:
         torch.set_float32_matmul_precision('high')
         model.compile_for_training()
@@ -84,8 +98,9 @@ if __name__ == '__main__':
             model.model.decoder.decoder_layer.model.requires_grad_(True)
 
     if args.new_data_schema:
-        train_dataset = GLiNERDataset(train_data, model_config, tokenizer, words_splitter)
-        test_dataset = GLiNERDataset(test_data, model_config, tokenizer, words_splitter)
+        entities = pretokenized_data.labels if pretokenized_data is not None else None
+        train_dataset = GLiNERDataset(train_data, model_config, tokenizer, words_splitter, entities=entities)
+        test_dataset = GLiNERDataset(test_data, model_config, tokenizer, words_splitter, entities=entities)
         data_collator = DataCollatorWithPadding(model_config)
     else:
         train_dataset = train_data